@@ -0,0 +1,296 @@
+# arbiter.py
+"""
+Un solo dueño por dedo: arbitraje de órdenes sobre cada actuador.
+
+Los clics manuales (do_pulse), las rutinas, HOME y PARO corren en hilos
+distintos y podían mover el mismo actuador a la vez. Ahora toda orden pide
+un turno (Lease) sobre su actuador antes de tocar los relés:
+
+- Prioridad: paro/reposo > home > manual > intencion > rutina. Una orden más
+  prioritaria le quita el turno al dueño actual y cancela las pendientes
+  menos prioritarias; las de igual o menor prioridad esperan en cola (por
+  prioridad y luego por llegada).
+- Al quitar un turno el relé se apaga en ese mismo instante, en el hilo
+  que lo pide y con el lock de relés tomado. Lease.set() comprueba la
+  revocación bajo el mismo lock, así que el dueño anterior ya no puede
+  volver a encenderlo, y sus esperas (Lease.wait -> clock.wait) despiertan
+  en el acto en vez de terminar su sleep().
+- preempt_all() (PARO) apaga los 5 actuadores y vacía todas las colas. El
+  lock sólo se toma para escribir relés, nunca durante una espera: la
+  latencia PARO -> todo OFF es unas pocas escrituras de GPIO más, como
+  mucho, la sección crítica de otro hilo. Se mide en cada paro
+  (stop_latency) y se comprueba contra STOP_BUDGET_S con --bench.
+- Clics repetidos: una orden con la misma 'key' (actuador y sentido) que
+  otra en cola, o que el dueño actual empezó hace menos de coalesce_s, se
+  descarta.
+- Cada Lease lleva su contexto (causa, rutina, ciclo) y lo pasa a apply():
+  el diario anota cada transición con el de la orden que la hizo, aunque
+  haya otras órdenes en otros hilos.
+
+    python3 -m Laptop_client.GUI.arbiter --bench
+"""
+from __future__ import annotations
+import argparse
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+PRIORITY = {"paro": 0, "reposo": 0, "home": 1, "manual": 2, "intencion": 3, "rutina": 4}
+STOP_BUDGET_S = 0.010          # PARO -> todos los relés OFF, peor caso admitido
+COALESCE_S = 0.5
+
+
+def _check_cause(cause: str):
+    if cause not in PRIORITY:
+        raise ValueError(f"Causa desconocida: {cause!r} (válidas: {', '.join(PRIORITY)})")
+
+
+class Lease:
+    """Turno de una orden sobre un actuador. Se usa como context manager."""
+
+    def __init__(self, arb: "ActuatorArbiter", actuator: int, cause: str, key, seq: int,
+                 routine: str = "", cycle: int = 0):
+        self.arb = arb
+        self.actuator = actuator
+        self.cause = cause
+        self.routine = routine
+        self.cycle = cycle
+        self.prio = PRIORITY[cause]
+        self.key = key
+        self.seq = seq
+        self.t0 = 0.0                              # monotonic al conceder el turno
+        self.granted = False
+        self.revoked = threading.Event()
+        self._signal = threading.Event()           # concedido o revocado
+
+    def __lt__(self, other: "Lease") -> bool:
+        return (self.prio, self.seq) < (other.prio, other.seq)
+
+    def set(self, a: bool, b: bool) -> bool:
+        """Aplica A/B si el turno sigue vigente; False si ya se revocó."""
+        with self.arb.lock:
+            if self.revoked.is_set():
+                return False
+            self.arb.apply(self.actuator, a, b, self.cause, self.routine, self.cycle)
+            return True
+
+    def wait(self, dt: float) -> bool:
+        """Espera 'dt' en el reloj del controlador; True si se revocó el turno antes."""
+        if self.revoked.is_set():
+            return True
+        return bool(self.arb.clock.wait(self.revoked, dt))
+
+    def release(self):
+        self.arb.release(self)
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ActuatorArbiter:
+    """
+    apply(n, a, b, cause, routine="", cycle=0) escribe los relés del
+    actuador 'n' y anota la transición; siempre se llama con 'lock' tomado.
+    Una causa que no esté en PRIORITY es un ValueError antes de tocar nada.
+    """
+
+    def __init__(self, actuators: Iterable[int], apply: Callable[..., None],
+                 clock, coalesce_s: float = COALESCE_S):
+        self.apply = apply
+        self.clock = clock
+        self.coalesce_s = coalesce_s
+        self.lock = threading.RLock()
+        self._owner: Dict[int, Optional[Lease]] = {n: None for n in actuators}
+        self._queue: Dict[int, List[Lease]] = {n: [] for n in self._owner}
+        self._seq = itertools.count()
+        self.preemptions = 0
+        self.coalesced = 0
+        self.stop_latency: deque = deque(maxlen=256)
+
+    # ------------------------ turnos ------------------------------------
+    def acquire(self, actuator: int, cause: str, key=None, routine: str = "",
+                cycle: int = 0) -> Optional[Lease]:
+        """
+        Turno sobre 'actuator'. Bloquea mientras lo tenga una orden de igual
+        o mayor prioridad. None si la orden se descartó por repetida o la
+        canceló otra más prioritaria mientras esperaba.
+        """
+        _check_cause(cause)
+        with self.lock:
+            if key is not None and self._duplicate(actuator, key):
+                self.coalesced += 1
+                return None
+            lease = Lease(self, actuator, cause, key, next(self._seq), routine, cycle)
+            owner = self._owner[actuator]
+            if owner is None:
+                self._grant(lease)
+                return lease
+            if lease.prio < owner.prio:
+                self._revoke(owner, cause)
+                self._drop_queued(actuator, lease.prio)
+                self._grant(lease)
+                return lease
+            heapq.heappush(self._queue[actuator], lease)
+        # Fuera del lock: espera su turno en el reloj (participa del VirtualClock)
+        while not lease._signal.is_set():
+            self.clock.wait(lease._signal, 3600.0)
+        return lease if lease.granted and not lease.revoked.is_set() else None
+
+    def release(self, lease: Lease):
+        """Fin de la orden: relé OFF (por si abortó a medias) y turno al siguiente."""
+        with self.lock:
+            n = lease.actuator
+            if self._owner[n] is not lease:
+                return                                 # ya revocado
+            self.apply(n, False, False, lease.cause, lease.routine, lease.cycle)
+            self._owner[n] = None
+            q = self._queue[n]
+            while q:
+                nxt = heapq.heappop(q)
+                if not nxt.revoked.is_set():
+                    self._grant(nxt)
+                    break
+
+    def preempt_all(self, cause: str = "paro") -> float:
+        """Todos los relés OFF ya, revoca a todos los dueños y vacía las colas. Devuelve la latencia (s)."""
+        _check_cause(cause)
+        t = time.perf_counter()
+        with self.lock:
+            for n, owner in self._owner.items():
+                self.apply(n, False, False, cause)
+                if owner is not None:
+                    self._revoke(owner, cause, off=False)
+                    self._owner[n] = None
+                self._drop_queued(n, -1)
+            dt = time.perf_counter() - t
+        self.stop_latency.append(dt)
+        return dt
+
+    def off_idle(self, cause: str = "reposo"):
+        """OFF de los actuadores sin dueño (no toca las órdenes en curso de otros hilos)."""
+        _check_cause(cause)
+        with self.lock:
+            for n, owner in self._owner.items():
+                if owner is None:
+                    self.apply(n, False, False, cause)
+
+    def owner(self, actuator: int) -> Optional[str]:
+        o = self._owner[actuator]
+        return None if o is None else o.cause
+
+    # ------------------------ internos (con lock) -----------------------
+    def _duplicate(self, actuator: int, key) -> bool:
+        o = self._owner[actuator]
+        if o is not None and o.key == key and time.monotonic() - o.t0 < self.coalesce_s:
+            return True
+        return any(q.key == key and not q.revoked.is_set() for q in self._queue[actuator])
+
+    def _grant(self, lease: Lease):
+        lease.granted = True
+        lease.t0 = time.monotonic()
+        self._owner[lease.actuator] = lease
+        lease._signal.set()
+        self.clock.wake()
+
+    def _revoke(self, lease: Lease, cause: str, off: bool = True):
+        if off:
+            self.apply(lease.actuator, False, False, cause)   # el corte es aquí, no al despertar
+        lease.revoked.set()
+        lease._signal.set()
+        self.preemptions += 1
+        self.clock.wake()
+
+    def _drop_queued(self, actuator: int, prio: int):
+        q = self._queue[actuator]
+        keep = []
+        for lease in q:
+            if lease.prio > prio:
+                lease.revoked.set()
+                lease._signal.set()
+            else:
+                keep.append(lease)
+        if len(keep) != len(q):
+            heapq.heapify(keep)
+            self._queue[actuator] = keep
+            self.clock.wake()
+
+
+# ---------------------- Banco de pruebas --------------------------------------
+def bench(trials: int = 200, speed: float = 10.0, clickers: int = 3, seed: int = 0) -> Dict:
+    """
+    PAROs en momentos al azar con una rutina corriendo y clics manuales
+    repetidos en otros hilos (reloj acelerado, relés simulados). Mide la
+    latencia PARO -> todo OFF, comprueba que tras cada paro no quede ningún
+    relé encendido y que la línea de tiempo cumpla interlock y deadtime.
+    """
+    from Laptop_client.GUI.clock import ScaledClock, TimelineRecorder, check_timeline
+    from Laptop_client.GUI.routines import ControlActuadores, SimOutput
+
+    clock = ScaledClock(speed)
+    rec = TimelineRecorder(clock)
+    ctrl = ControlActuadores(journal=rec, clock=clock, output_cls=SimOutput, verbose=False)
+    rng = random.Random(seed)
+    lat: List[float] = []
+    left_on = 0
+
+    for _ in range(trials):
+        stop, quit_clicks = threading.Event(), threading.Event()
+
+        def click(r=random.Random(rng.random())):
+            while not quit_clicks.is_set():
+                ctrl.mover_actuador(r.randint(1, 5), 0.2, 0.0, 0.2, r.choice(("open", "close")))
+
+        hilos = [threading.Thread(target=ctrl.run_routine, daemon=True,
+                                  args=(rng.choice(("Rutina 1", "Rutina 2", "Rutina 3")), 1, stop))]
+        hilos += [threading.Thread(target=click, daemon=True) for _ in range(clickers)]
+        for th in hilos: th.start()
+        time.sleep(rng.uniform(0.0, 0.3))
+
+        stop.set()
+        lat.append(ctrl.stop_now())
+        # Un turno nuevo espera deadtime antes de encender: si algo está ON ahora, el paro falló
+        with ctrl.arbiter.lock:
+            left_on += any(r.state for rel in ctrl.relays.values() for r in rel.values())
+        quit_clicks.set()
+        for th in hilos: th.join()
+
+    errors = check_timeline(rec.timeline(), ctrl.deadtime_s)
+    lat.sort()
+    return {"trials": trials, "p50_ms": lat[len(lat) // 2] * 1000,
+            "p99_ms": lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000,
+            "max_ms": lat[-1] * 1000, "left_on": left_on, "violations": len(errors),
+            "preemptions": ctrl.arbiter.preemptions, "coalesced": ctrl.arbiter.coalesced,
+            "transitions": len(rec.events)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Arbitraje de actuadores: latencia de PARO bajo carga")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--trials", type=int, default=200)
+    ap.add_argument("--speed", type=float, default=10.0)
+    ap.add_argument("--clickers", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args(argv)
+    if not a.bench:
+        ap.print_help()
+        return
+
+    r = bench(a.trials, a.speed, a.clickers, a.seed)
+    print(f"{r['trials']} paros bajo carga: PARO -> todo OFF p50 {r['p50_ms']:.3f} ms, "
+          f"p99 {r['p99_ms']:.3f} ms, máx {r['max_ms']:.3f} ms (límite {STOP_BUDGET_S * 1000:.0f} ms)")
+    viol = "OK" if not r["violations"] else f"{r['violations']} violaciones"
+    print(f"relés encendidos tras el paro: {r['left_on']}; interlock/deadtime: {viol}; "
+          f"{r['preemptions']} desalojos, {r['coalesced']} clics fusionados, {r['transitions']} transiciones")
+    if r["max_ms"] > STOP_BUDGET_S * 1000 or r["left_on"] or r["violations"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# clock.py
+"""
+Reloj enchufable para ControlActuadores.
+
+- RealClock: time.monotonic / time.sleep / un hilo por tarea paralela
+  (el comportamiento de siempre).
+- wait(event, dt): como sleep() pero despierta en cuanto se marca 'event'
+  (devuelve True); quien lo marca llama después a wake(). Es lo que usa el
+  arbitraje de actuadores (arbiter.py) para que un PARO corte al instante.
+- ScaledClock: igual que RealClock pero 'speed' veces más rápido; sirve
+  desde cualquier hilo (p.ej. los de la UI en diagnostics/soak.py).
+- VirtualClock: tiempo virtual de eventos discretos. sleep() no espera:
+  registra el despertar y, cuando TODOS los hilos participantes están
+  dormidos, el reloj salta al despertar más próximo. Una rutina completa
+  (100 ciclos incluidos) corre en lo que tarda la CPU, con tiempos exactos
+  y reproducibles.
+
+Participantes del VirtualClock: el hilo que lo crea y los que se lanzan
+con run_parallel(). Un hilo ajeno no debe llamar a sleep().
+
+Con simulate() se ejecuta una rutina con relés simulados, se guarda la
+línea de tiempo de todos los relés y se verifica interlock y deadtime:
+    python3 -m Laptop_client.GUI.clock --routine "Rutina 3" --cycles 100
+    python3 -m Laptop_client.GUI.clock --routine "Rutina 2" --real   # precisión real vs ideal
+"""
+from __future__ import annotations
+import argparse
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+
+class RealClock:
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, dt: float):
+        time.sleep(max(0.0, dt))
+
+    def wait(self, event: threading.Event, dt: float) -> bool:
+        return event.wait(max(0.0, dt))
+
+    def wake(self):
+        pass
+
+    def run_parallel(self, tareas: List[Callable[[], None]]):
+        hilos = [threading.Thread(target=t, daemon=True) for t in tareas]
+        for th in hilos: th.start()
+        for th in hilos: th.join()
+
+
+class ScaledClock(RealClock):
+    """Reloj real acelerado 'speed' veces; lo puede usar cualquier hilo (pruebas de resistencia)."""
+
+    def __init__(self, speed: float = 10.0):
+        self.speed = float(speed)
+        self._m0 = time.monotonic()
+
+    def now(self) -> float:
+        return self._m0 + (time.monotonic() - self._m0) * self.speed
+
+    def sleep(self, dt: float):
+        time.sleep(max(0.0, dt) / self.speed)
+
+    def wait(self, event: threading.Event, dt: float) -> bool:
+        return event.wait(max(0.0, dt) / self.speed)
+
+
+class VirtualClock:
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._cv = threading.Condition()
+        self._heap: list = []                 # [despertar, seq, liberado, cancelado]
+        self._seq = itertools.count()
+        self._running = 1                     # el hilo creador
+        self.wakeups = 0
+
+    def now(self) -> float:
+        return self._now
+
+    def sleep(self, dt: float):
+        with self._cv:
+            entry = [self._now + max(0.0, dt), next(self._seq), False, False]
+            heapq.heappush(self._heap, entry)
+            self._running -= 1
+            self._advance()
+            while not entry[2]:
+                self._cv.wait()
+
+    def wait(self, event: threading.Event, dt: float) -> bool:
+        with self._cv:
+            if event.is_set():
+                return True
+            entry = [self._now + max(0.0, dt), next(self._seq), False, False]
+            heapq.heappush(self._heap, entry)
+            self._running -= 1
+            self._advance()
+            while not entry[2] and not event.is_set():
+                self._cv.wait()
+            if not entry[2]:
+                # Despertado por el evento: el tiempo no avanza y el despertar se descarta
+                entry[3] = True
+                self._running += 1
+            return event.is_set()
+
+    def wake(self):
+        """Avisa a los hilos en wait() de que algún evento cambió (lo llama un participante activo)."""
+        with self._cv:
+            self._cv.notify_all()
+
+    def _advance(self):
+        """Con el lock tomado: si nadie puede avanzar, salta al próximo despertar."""
+        while self._heap and self._heap[0][3]:
+            heapq.heappop(self._heap)
+        if self._running > 0 or not self._heap:
+            return
+        t = self._heap[0][0]
+        self._now = t
+        while self._heap and self._heap[0][0] == t:
+            entry = heapq.heappop(self._heap)
+            if entry[3]:
+                continue
+            entry[2] = True
+            self._running += 1
+            self.wakeups += 1
+        self._cv.notify_all()
+
+    def run_parallel(self, tareas: List[Callable[[], None]]):
+        def wrap(fn):
+            def run():
+                try:
+                    fn()
+                finally:
+                    with self._cv:
+                        self._running -= 1
+                        self._advance()
+            return run
+
+        if not tareas:
+            return
+        with self._cv:
+            # Los hijos cuentan como activos desde ya; el padre queda bloqueado en join
+            self._running += len(tareas) - 1
+        hilos = [threading.Thread(target=wrap(t), daemon=True) for t in tareas]
+        for th in hilos: th.start()
+        for th in hilos: th.join()
+        with self._cv:
+            self._running += 1
+
+
+# ---------------------- Línea de tiempo de relés -----------------------------
+@dataclass
+class RelayEvent:
+    t: float
+    actuator: int
+    A: bool
+    B: bool
+    cause: str = ""
+    routine: str = ""
+    cycle: int = 0
+
+
+class TimelineRecorder:
+    """Sustituto del EventJournal que guarda las transiciones en memoria con la hora del reloj."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.events: List[RelayEvent] = []
+        self._lock = threading.Lock()
+
+    def record(self, actuator: int, a: bool, b: bool, cause: str = "manual",
+               routine: str = "", cycle: int = 0):
+        with self._lock:
+            self.events.append(RelayEvent(self.clock.now(), actuator, a, b, cause, routine, cycle))
+
+    def begin_session(self, session: str):
+        pass
+
+    def recent(self, t0: float, t1: float) -> list:
+        return [e.__dict__ for e in self.timeline() if t0 <= e.t < t1]
+
+    def timeline(self) -> List[RelayEvent]:
+        """Ordenada por (t, actuador): a igual instante virtual el orden entre hilos no importa."""
+        with self._lock:
+            return sorted(self.events, key=lambda e: (e.t, e.actuator))
+
+
+def check_timeline(events: List[RelayEvent], deadtime_s: float, tol: float = 1e-9) -> List[str]:
+    """Violaciones de interlock (A y B a la vez) y de deadtime al invertir sentido."""
+    errors = []
+    last_off: Dict[Tuple[int, str], float] = {}
+    state: Dict[int, Tuple[bool, bool]] = {}
+    for e in events:
+        prev = state.get(e.actuator, (False, False))
+        if e.A and e.B:
+            errors.append(f"t={e.t:.3f}s act {e.actuator}: A y B activos a la vez")
+        for side, was, now_on, other in (("A", prev[0], e.A, "B"), ("B", prev[1], e.B, "A")):
+            if was and not now_on:
+                last_off[(e.actuator, side)] = e.t
+            if now_on and not was:
+                t_off = last_off.get((e.actuator, other))
+                if t_off is not None and e.t - t_off < deadtime_s - tol:
+                    errors.append(f"t={e.t:.3f}s act {e.actuator}: {side} ON a "
+                                  f"{(e.t - t_off) * 1000:.1f} ms de apagar {other} (< deadtime)")
+        state[e.actuator] = (e.A, e.B)
+    return errors
+
+
+def on_intervals(events: List[RelayEvent]) -> List[Tuple[int, str, float, float]]:
+    """(actuador, lado, inicio, duración) de cada activación, en orden."""
+    out, since = [], {}
+    state: Dict[int, Tuple[bool, bool]] = {}
+    for e in events:
+        prev = state.get(e.actuator, (False, False))
+        for side, was, now_on in (("A", prev[0], e.A), ("B", prev[1], e.B)):
+            if now_on and not was:
+                since[(e.actuator, side)] = e.t
+            elif was and not now_on:
+                t0 = since.pop((e.actuator, side))
+                out.append((e.actuator, side, t0, e.t - t0))
+        state[e.actuator] = (e.A, e.B)
+    return sorted(out, key=lambda r: (r[2], r[0]))
+
+
+def simulate(routine: str = "Rutina 1", cycles: int = 1, clock=None):
+    """Ejecuta la rutina con relés simulados. Devuelve (controlador, timeline)."""
+    from Laptop_client.GUI.routines import ControlActuadores, SimOutput
+    clock = clock or VirtualClock()
+    rec = TimelineRecorder(clock)
+    ctrl = ControlActuadores(journal=rec, clock=clock, output_cls=SimOutput, verbose=False)
+    ctrl.run_routine(routine, cycles=cycles)
+    return ctrl, rec.timeline()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Simulación de rutinas en tiempo virtual")
+    ap.add_argument("--routine", default="Rutina 3")
+    ap.add_argument("--cycles", type=int, default=1)
+    ap.add_argument("--real", action="store_true",
+                    help="corre también con reloj real y compara contra la línea ideal")
+    a = ap.parse_args(argv)
+
+    t = time.perf_counter()
+    ctrl, ideal = simulate(a.routine, a.cycles)
+    wall = time.perf_counter() - t
+    errors = check_timeline(ideal, ctrl.deadtime_s)
+    print(f"{a.routine} x{a.cycles}: {ctrl.clock.now():.2f} s virtuales en {wall:.2f} s reales "
+          f"({len(ideal)} transiciones, {ctrl.clock.wakeups} despertares)")
+    print(f"interlock/deadtime: {'OK' if not errors else f'{len(errors)} violaciones'}")
+    for err in errors[:10]:
+        print("  " + err)
+
+    if a.real:
+        _, real = simulate(a.routine, a.cycles, clock=RealClock())
+        iv, rv = on_intervals(ideal), on_intervals(real)
+        t0 = real[0].t if real else 0.0
+        dur = [abs(r[3] - i[3]) * 1000 for i, r in zip(iv, rv)]
+        start = [abs((r[2] - t0) - (i[2] - ideal[0].t)) * 1000 for i, r in zip(iv, rv)]
+        errors = check_timeline(real, ctrl.deadtime_s)
+        if dur:
+            print(f"reloj real: error de duración máx {max(dur):.1f} ms, medio {sum(dur)/len(dur):.1f} ms; "
+                  f"deriva de inicio máx {max(start):.1f} ms; interlock/deadtime: "
+                  f"{'OK' if not errors else f'{len(errors)} violaciones'}")
+
+
+if __name__ == "__main__":
+    main()
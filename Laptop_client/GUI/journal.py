@@ -0,0 +1,288 @@
+# journal.py
+"""
+Diario binario (append-only) de transiciones de relés.
+
+Cada transición es un registro fijo de 16 bytes:
+    t (float64, segundos de época)  actuador (u8)  estado (u8: bit0 = A, bit1 = B)
+    causa (u8, índice en CAUSES)  rutina (u8, índice en la tabla de la sesión)
+    ciclo (u32)
+
+- record() es lo único que corre en el camino caliente (_drive): toma la
+  hora y encola la tupla; no hace E/S.
+- Un hilo escritor vacía la cola por lotes (un write() por lote) y hace
+  fsync como mucho cada 'fsync_s' segundos (group commit), y siempre al
+  cambiar de sesión o cerrar.
+- Un archivo por sesión: <raíz>/<sesión>.jrn + <sesión>.json (inicio y
+  tabla de rutinas). Como los registros son fijos y van ordenados por t,
+  el propio archivo es el índice: JournalReader busca con searchsorted
+  sobre un memmap.
+- Las últimas 'recent' transiciones también quedan en memoria (recent()),
+  para adjuntarlas a un segmento de disparo sin esperar al disco.
+
+t usa el mismo reloj que SessionRecorder.start_time (time.time), para
+alinear la actividad de los relés con el EMG grabado, pero anclado: se toma
+time.time() al empezar cada sesión y a partir de ahí avanza con
+time.monotonic(). Un salto de NTP a mitad de sesión no desordena el
+archivo (la búsqueda binaria lo necesita ordenado); además t nunca retrocede.
+
+Una causa fuera de CAUSES se anota como "otra"; las causas nuevas van al
+final de CAUSES para no cambiar el índice de las ya grabadas. Un error de E/S se cuenta
+en 'errors' y el hilo escritor sigue.
+
+EventJournal arranca un hilo y escribe en disco, así que es opt-in: quien
+es dueño de los relés (daemon.py, main_window.py) lo crea y se lo pasa a
+ControlActuadores; sin él, ControlActuadores usa NullJournal.
+"""
+from __future__ import annotations
+import atexit
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+JOURNAL_DIR = os.environ.get(
+    "EXO_JOURNAL_DIR", os.path.join(os.path.expanduser("~"), ".exo", "journal"))
+
+CAUSES = ("manual", "rutina", "home", "paro", "reposo", "otra", "intencion")
+_CAUSE_ID = {c: i for i, c in enumerate(CAUSES)}
+STATE_A, STATE_B = 1, 2
+
+_REC = struct.Struct("<dBBBBI")           # 16 bytes
+JOURNAL_EXT, META_EXT = ".jrn", ".json"
+
+
+def _default_session() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+class EventJournal:
+    def __init__(self, root: str = JOURNAL_DIR, session: Optional[str] = None,
+                 flush_s: float = 0.1, fsync_s: float = 1.0, recent: int = 4096):
+        self.root = root
+        self.flush_s, self.fsync_s = flush_s, fsync_s
+        self._q: deque = deque()
+        self._recent: deque = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._f = None
+        self._session: Optional[str] = None
+        self._meta: Dict = {}
+        self._routines: Dict[str, int] = {}
+        self._last_fsync = 0.0
+        self._wall0, self._mono0 = time.time(), time.monotonic()
+        self._last_t = 0.0
+        # contadores (para ver que el group commit agrupa)
+        self.events = self.batches = self.fsyncs = self.errors = 0
+        self.begin_session(session or _default_session())
+        self._th = threading.Thread(target=self._writer, name="journal", daemon=True)
+        self._th.start()
+        atexit.register(self.close)
+
+    # ------------------------ camino caliente -------------------------------
+    def record(self, actuator: int, a: bool, b: bool, cause: str = "manual",
+               routine: str = "", cycle: int = 0):
+        state = (STATE_A if a else 0) | (STATE_B if b else 0)
+        # La hora se toma bajo el lock: la cola queda ordenada por t
+        with self._lock:
+            ev = (self._now(), actuator, state, cause, routine, cycle)
+            self._q.append(ev)
+            self._recent.append(ev)
+
+    def _now(self) -> float:
+        """Hora de pared anclada al inicio de la sesión (con _lock tomado)."""
+        t = max(self._last_t, self._wall0 + (time.monotonic() - self._mono0))
+        self._last_t = t
+        return t
+
+    def recent(self, t0: float, t1: float) -> List[Dict]:
+        """Transiciones en memoria con t0 <= t < t1 (time.time), ya decodificadas."""
+        with self._lock:
+            evs = [e for e in self._recent if t0 <= e[0] < t1]
+        return [{"t": t, "actuator": act, "A": bool(st & STATE_A), "B": bool(st & STATE_B),
+                 "cause": cause, "routine": routine, "cycle": cycle}
+                for t, act, st, cause, routine, cycle in evs]
+
+    def begin_session(self, session: str):
+        """Las transiciones siguientes van a la sesión 'session' (p.ej. paciente/fecha)."""
+        with self._lock:
+            self._wall0, self._mono0 = time.time(), time.monotonic()
+            self._q.append(("session", session))
+        self._wake.set()
+
+    def flush(self, timeout: float = 2.0):
+        """Espera a que lo encolado hasta ahora esté escrito y sincronizado."""
+        done = threading.Event()
+        with self._lock:
+            self._q.append(("flush", done))
+        self._wake.set()
+        if self._th is threading.current_thread() or not self._th.is_alive():
+            self._drain()
+        else:
+            done.wait(timeout)
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set(); self._wake.set()
+        self._th.join(timeout=2.0)
+        self._drain()
+        self._close_file()
+
+    # ------------------------ hilo escritor ---------------------------------
+    def _writer(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+            try:
+                self._drain()
+            except Exception as ex:            # disco lleno, carpeta borrada...: seguir
+                self.errors += 1
+                print(f"[Journal] error escribiendo el diario: {ex}")
+
+    def _drain(self):
+        buf = bytearray()
+        while True:
+            try:
+                item = self._q.popleft()
+            except IndexError:
+                break
+            if item[0] == "session":
+                self._write(buf); buf.clear()
+                self._open(item[1])
+            elif item[0] == "flush":
+                self._write(buf, force_sync=True); buf.clear()
+                item[1].set()
+            else:
+                t, act, state, cause, routine, cycle = item
+                try:
+                    buf += _REC.pack(t, act, state, _CAUSE_ID.get(cause, _CAUSE_ID["otra"]),
+                                     self._routine_id(routine), cycle)
+                except struct.error:
+                    self.errors += 1
+                    continue
+                self.events += 1
+        self._write(buf)
+
+    def _write(self, buf: bytearray, force_sync: bool = False):
+        if self._f is None:
+            return
+        if buf:
+            self._f.write(buf)
+            self._f.flush()
+            self.batches += 1
+        now = time.monotonic()
+        if (buf or force_sync) and (force_sync or now - self._last_fsync >= self.fsync_s):
+            os.fsync(self._f.fileno())
+            self._last_fsync = now
+            self.fsyncs += 1
+
+    def _routine_id(self, name: str) -> int:
+        if not name:
+            return 0
+        rid = self._routines.get(name)
+        if rid is None:
+            self._meta["routines"].append(name)
+            rid = self._routines[name] = len(self._meta["routines"])
+            self._write_meta()
+        return rid
+
+    def _open(self, session: str):
+        self._close_file()
+        base = os.path.join(self.root, session)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        self._session = session
+        try:
+            with open(base + META_EXT, encoding="utf-8") as f:
+                self._meta = json.load(f)
+        except (OSError, ValueError):
+            self._meta = {"session": session, "start_time": time.time(), "routines": []}
+        self._routines = {r: i + 1 for i, r in enumerate(self._meta["routines"])}
+        self._write_meta()
+        self._f = open(base + JOURNAL_EXT, "ab")
+
+    def _close_file(self):
+        if self._f is not None:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+            self._f = None
+
+    def _write_meta(self):
+        base = os.path.join(self.root, self._session)
+        tmp = base + META_EXT + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._meta, f, indent=2)
+        os.replace(tmp, base + META_EXT)
+
+
+class NullJournal:
+    """Diario que no guarda nada (ni hilo ni archivos): por defecto en ControlActuadores."""
+
+    def record(self, actuator: int, a: bool, b: bool, cause: str = "manual",
+               routine: str = "", cycle: int = 0):
+        pass
+
+    def begin_session(self, session: str):
+        pass
+
+    def recent(self, t0: float, t1: float) -> List[Dict]:
+        return []
+
+    def flush(self, timeout: float = 2.0):
+        pass
+
+    def close(self):
+        pass
+
+
+# ---------------------- Lectura ----------------------------------------------
+class JournalReader:
+    """Consulta de una sesión por rango de tiempo (memmap + búsqueda binaria)."""
+
+    def __init__(self, session: str, root: str = JOURNAL_DIR):
+        import numpy as np
+        self._np = np
+        self.dtype = np.dtype([("t", "<f8"), ("actuator", "u1"), ("state", "u1"),
+                               ("cause", "u1"), ("routine", "u1"), ("cycle", "<u4")])
+        base = os.path.join(root, session)
+        with open(base + META_EXT, encoding="utf-8") as f:
+            self.meta: Dict = json.load(f)
+        self.routines: List[str] = [""] + list(self.meta.get("routines", []))
+        path = base + JOURNAL_EXT
+        n = os.path.getsize(path) // self.dtype.itemsize if os.path.exists(path) else 0
+        self.records = (np.memmap(path, dtype=self.dtype, mode="r", shape=(n,))
+                        if n else np.zeros(0, dtype=self.dtype))
+
+    def __len__(self) -> int:
+        return self.records.shape[0]
+
+    def range(self, t0: Optional[float] = None, t1: Optional[float] = None,
+              actuator: Optional[int] = None):
+        """Registros con t0 <= t < t1 (array estructurado, sin copiar si no hay filtro)."""
+        t = self.records["t"]
+        i0 = 0 if t0 is None else int(self._np.searchsorted(t, t0, "left"))
+        i1 = len(t) if t1 is None else int(self._np.searchsorted(t, t1, "left"))
+        out = self.records[i0:i1]
+        if actuator is not None:
+            out = out[out["actuator"] == actuator]
+        return out
+
+    def decode(self, recs) -> List[Dict]:
+        return [{"t": float(r["t"]), "actuator": int(r["actuator"]),
+                 "A": bool(r["state"] & STATE_A), "B": bool(r["state"] & STATE_B),
+                 "cause": CAUSES[r["cause"]], "routine": self.routines[r["routine"]],
+                 "cycle": int(r["cycle"])} for r in recs]
+
+
+def list_journal_sessions(root: str = JOURNAL_DIR) -> List[str]:
+    """Sesiones con diario bajo 'root' (rutas relativas, ordenadas)."""
+    out = []
+    for d, _, files in os.walk(root):
+        for fn in files:
+            if fn.endswith(JOURNAL_EXT):
+                out.append(os.path.relpath(os.path.join(d, fn[:-len(JOURNAL_EXT)]), root))
+    return sorted(out)
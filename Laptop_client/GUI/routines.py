@@ -1,8 +1,23 @@
 # routines.py
 from __future__ import annotations
-from time import sleep
 import threading
 
+from Laptop_client.GUI.arbiter import STOP_BUDGET_S, ActuatorArbiter
+from Laptop_client.GUI.clock import RealClock
+from Laptop_client.GUI.journal import EventJournal, NullJournal
+
+INTENT_STEP_S = 0.5      # tramo que mueve cada decisión del clasificador de intención
+
+
+class SimOutput:  # simulador mínimo de un relé
+    def __init__(self, pin, active_high=True, initial_value=False):
+        self.pin = pin
+        self.state = bool(initial_value)
+    def on(self):  self.state = True
+    def off(self): self.state = False
+    def close(self): self.off()
+
+
 # --- Intentamos usar GPIO real; si falla, simulamos (útil en laptop) ---
 try:
     from gpiozero import DigitalOutputDevice, Device  # type: ignore
@@ -11,14 +26,7 @@ try:
     _GPIO_OK = True
 except Exception:
     _GPIO_OK = False
-
-    class DigitalOutputDevice:  # simulador mínimo
-        def __init__(self, pin, active_high=True, initial_value=False):
-            self.pin = pin
-            self.state = bool(initial_value)
-        def on(self):  self.state = True
-        def off(self): self.state = False
-        def close(self): self.off()
+    DigitalOutputDevice = SimOutput
 
 
 class ControlActuadores:
@@ -31,6 +39,20 @@ class ControlActuadores:
     - Interlock: nunca A y B activos a la vez
     - Deadtime: pequeña pausa antes de invertir sentido
     - HOME: todo OFF; además exponemos home_now() que hace 3s de 'close' en paralelo.
+
+    Cada transición de relé se anota en 'journal' con la causa, rutina y
+    ciclo de la orden que la hizo (viajan en su Lease, no en el
+    controlador); _set() sólo encola, la escritura va en otro hilo. Sin
+    'journal' no se anota nada (NullJournal): el dueño de los relés pasa
+    un EventJournal.
+
+    Todas las esperas y el paralelismo pasan por 'clock' (clock.py): con un
+    VirtualClock y output_cls=SimOutput las rutinas corren al instante.
+
+    Cada orden (manual, intención, rutina, HOME, PARO) pide turno al
+    ActuatorArbiter (arbiter.py) antes de mover un actuador: un dueño por
+    dedo, prioridad paro > home > manual > intencion > rutina y corte
+    inmediato a nivel de relé.
     """
 
     RELAY_PINS_BCM = {
@@ -43,21 +65,30 @@ class ControlActuadores:
 
     deadtime_s = 0.05
 
-    def __init__(self, actualizar_estado=None):
+    def __init__(self, actualizar_estado=None, journal: EventJournal | None = None,
+                 clock=None, output_cls=None, verbose: bool = True):
         self.actualizar_estado = actualizar_estado
+        self.clock = clock or RealClock()
+        self.verbose = verbose
+        output_cls = output_cls or DigitalOutputDevice
+        sim = output_cls is not DigitalOutputDevice or not _GPIO_OK
+        self.journal = journal if journal is not None else NullJournal()
+        self._relay_state = {n: (False, False) for n in self.RELAY_PINS_BCM}
         self.relays = {}
         for n, pins in self.RELAY_PINS_BCM.items():
             self.relays[n] = {
-                "A": DigitalOutputDevice(pins["A"], active_high=True, initial_value=False),
-                "B": DigitalOutputDevice(pins["B"], active_high=True, initial_value=False),
+                "A": output_cls(pins["A"], active_high=True, initial_value=False),
+                "B": output_cls(pins["B"], active_high=True, initial_value=False),
             }
+        self.arbiter = ActuatorArbiter(self.relays, self._set, self.clock)
         self._msg("Inicializando controlador de actuadores "
-                  + ("(GPIO real LGPIO)." if _GPIO_OK else "(SIM sin GPIO)."))
+                  + ("(SIM sin GPIO)." if sim else "(GPIO real LGPIO)."))
         self.posicion_reposo()
 
     # ------------------------ utilidades de log ------------------------
     def _msg(self, texto: str):
-        print(texto)
+        if self.verbose:
+            print(texto)
         if self.actualizar_estado:
             try:
                 self.actualizar_estado(texto)
@@ -65,80 +96,112 @@ class ControlActuadores:
                 pass
 
     # ------------------------ API pública ------------------------------
+    def begin_journal_session(self, session: str):
+        """Anota las transiciones siguientes en la sesión 'session' del diario."""
+        self.journal.begin_session(session)
+
+    def relay_events(self, t0: float, t1: float) -> list:
+        """Transiciones recientes de relés entre t0 y t1 (time.time)."""
+        return self.journal.recent(t0, t1)
+
     def posicion_reposo(self):
-        """Todo OFF."""
-        for n in self.relays:
-            self._both_off(n)
+        """Todo OFF (cancela cualquier orden en curso)."""
+        self.arbiter.preempt_all("reposo")
         self._msg("Todos los actuadores en reposo (OFF).")
 
-    def home_now(self, close_seconds: float = 3.0):
+    def stop_now(self) -> float:
+        """
+        Corte inmediato: todos los relés OFF en este hilo, revocando rutinas,
+        pulsos y HOME en curso. Devuelve la latencia PARO -> todo OFF (s).
+        """
+        dt = self.arbiter.preempt_all("paro")
+        aviso = "" if dt <= STOP_BUDGET_S else f" ⚠ por encima de {STOP_BUDGET_S * 1000:.0f} ms"
+        self._msg(f"PARO: relés OFF en {dt * 1000:.2f} ms{aviso}.")
+        return dt
+
+    def home_now(self, close_seconds: float = 3.0, cause: str = "home"):
         """
         'HOME' mecánico: pone TODOS en 'close' durante close_seconds en paralelo
         y luego OFF. Útil para regresar al origen.
         """
+        self._home(close_seconds, cause)
+
+    def _home(self, close_seconds: float, cause: str):
         self._msg(f"HOME: todos en 'close' {close_seconds:.2f}s en paralelo...")
-        tareas = [lambda n=n: self._drive(n, "close", float(close_seconds)) for n in self.relays]
+        tareas = [lambda n=n: self._drive_owned(n, "close", float(close_seconds), cause)
+                  for n in self.relays]
         self._run_parallel(tareas)
-        self.posicion_reposo()
+        self.arbiter.off_idle()
         self._msg("HOME completado.")
 
     def stop_and_home(self, stop_event: threading.Event | None = None, close_seconds: float = 3.0):
         """
-        Señal de paro + HOME. Si recibimos stop_event lo marcamos, y ejecutamos HOME.
+        Señal de paro + HOME. Si recibimos stop_event lo marcamos, cortamos
+        todos los relés al instante (stop_now) y ejecutamos HOME.
         """
         if stop_event:
             stop_event.set()
+        self.stop_now()
         self._msg("PARO solicitado: llevando a HOME.")
-        self.home_now(close_seconds=close_seconds)
+        self._home(close_seconds, "paro")
 
     def mover_actuador(self, actuador_num: int, tiempo_avance: float,
                        tiempo_pause: float, tiempo_retroceso: float,
                        sentido_inicio: str = "open",
-                       stop_event: threading.Event | None = None):
+                       stop_event: threading.Event | None = None,
+                       cause: str = "manual", routine: str = "", cycle: int = 0):
         """
         Secuencia completa para 1 actuador: avance -> pausa -> retroceso.
-        Responde a stop_event si se marca entre fases.
+        Responde a stop_event entre fases y, en cualquier momento, a una
+        orden más prioritaria sobre el mismo actuador. Un clic manual igual
+        a otro todavía en cola o recién empezado se ignora.
         """
         if stop_event and stop_event.is_set():
             return
 
-        self._msg(f"Actuador {actuador_num}: Avance {tiempo_avance}s, pausa {tiempo_pause}s, retroceso {tiempo_retroceso}s.")
-        # Avance
-        self._drive(actuador_num, sentido=sentido_inicio, dur_s=float(tiempo_avance))
-        if stop_event and stop_event.is_set():
+        key = (actuador_num, sentido_inicio) if cause == "manual" else None
+        lease = self.arbiter.acquire(actuador_num, cause, key, routine, cycle)
+        if lease is None:
+            self._msg(f"Actuador {actuador_num}: orden descartada (repetida o cancelada).")
             return
+        with lease:
+            self._msg(f"Actuador {actuador_num}: Avance {tiempo_avance}s, pausa {tiempo_pause}s, retroceso {tiempo_retroceso}s.")
+            # Avance
+            if not self._drive(lease, sentido=sentido_inicio, dur_s=float(tiempo_avance)):
+                return
+            if stop_event and stop_event.is_set():
+                return
 
-        # Pausa OFF
-        self._both_off(actuador_num)
-        self._sleep_with_stop(tiempo_pause, stop_event)
-        if stop_event and stop_event.is_set():
-            return
+            # Pausa OFF
+            if self._wait_with_stop(lease, tiempo_pause, stop_event):
+                return
 
-        # Retroceso
-        sentido_vuelta = "close" if sentido_inicio == "open" else "open"
-        self._drive(actuador_num, sentido=sentido_vuelta, dur_s=float(tiempo_retroceso))
-        self._both_off(actuador_num)
+            # Retroceso
+            sentido_vuelta = "close" if sentido_inicio == "open" else "open"
+            self._drive(lease, sentido=sentido_vuelta, dur_s=float(tiempo_retroceso))
 
     # ------------------------ Rutinas base --------------------------------
-    def rutina_1_once(self, stop_event: threading.Event | None = None):
+    def rutina_1_once(self, stop_event: threading.Event | None = None, cycle: int = 0):
         """Todos (1..5) en paralelo: 2s avance, 4s pausa, 2s retroceso."""
         self._msg("Rutina 1 (paralela) - una pasada.")
         tareas = [
-            (lambda n=n: self.mover_actuador(n, 2, 4, 2, "open", stop_event))
+            (lambda n=n: self.mover_actuador(n, 2, 4, 2, "open", stop_event,
+                                             cause="rutina", routine="Rutina 1", cycle=cycle))
             for n in (1, 2, 3, 4, 5)
         ]
         self._run_parallel(tareas)
 
-    def rutina_2_once(self, stop_event: threading.Event | None = None):
+    def rutina_2_once(self, stop_event: threading.Event | None = None, cycle: int = 0):
         """Todos (1..5) en paralelo: 0.5s avance, 4s pausa, 0.5s retroceso."""
         self._msg("Rutina 2 (paralela) - una pasada.")
         tareas = [
-            (lambda n=n: self.mover_actuador(n, 0.5, 4, 0.5, "open", stop_event))
+            (lambda n=n: self.mover_actuador(n, 0.5, 4, 0.5, "open", stop_event,
+                                             cause="rutina", routine="Rutina 2", cycle=cycle))
             for n in (1, 2, 3, 4, 5)
         ]
         self._run_parallel(tareas)
 
-    def rutina_3_once(self, stop_event: threading.Event | None = None):
+    def rutina_3_once(self, stop_event: threading.Event | None = None, cycle: int = 0):
         """
         Patrón pedido:
         1) Cuatro dedos (2,3,4,5) en paralelo: avance/pausa/retroceso.
@@ -160,7 +223,8 @@ class ControlActuadores:
             if stop_event and stop_event.is_set():
                 return
             tareas = [
-                (lambda n=n: self.mover_actuador(n, 2, 1, 2, "open", stop_event))
+                (lambda n=n: self.mover_actuador(n, 2, 1, 2, "open", stop_event,
+                                                 cause="rutina", routine="Rutina 3", cycle=cycle))
                 for n in grupo
             ]
             self._run_parallel(tareas)
@@ -178,62 +242,99 @@ class ControlActuadores:
                     break
                 self._msg(f"→ Ciclo {i+1}/{cycles}")
                 if name == "Rutina 1":
-                    self.rutina_1_once(stop_event)
+                    self.rutina_1_once(stop_event, i + 1)
                 elif name == "Rutina 2":
-                    self.rutina_2_once(stop_event)
+                    self.rutina_2_once(stop_event, i + 1)
                 elif name == "Rutina 3":
-                    self.rutina_3_once(stop_event)
+                    self.rutina_3_once(stop_event, i + 1)
                 else:
                     self._msg(f"Rutina desconocida: {name}")
                     break
             self._msg(f"{name} finalizada.")
         finally:
-            self.posicion_reposo()
+            # Sólo los actuadores libres: un pulso manual en otro dedo sigue
+            self.arbiter.off_idle()
+
+    # ------------------------ Intención (EMG) -----------------------------
+    def intent_command(self, gesture: str, cmd, step_s: float = INTENT_STEP_S):
+        """
+        on_command de intent.IntentController: mueve los actuadores del
+        gesto 'step_s' segundos con causa "intencion" (el gesto va como
+        rutina en el diario). "reposo" (cmd None) no mueve nada. No
+        bloquea: devuelve el hilo que lo ejecuta, o None.
+        """
+        if cmd is None:
+            return None
+        actuadores, sentido = cmd
+        self._msg(f"Intención: {gesture} ({sentido}, actuadores {list(actuadores)}).")
+        tareas = [(lambda n=n: self._drive_owned(n, sentido, step_s, "intencion",
+                                                 key=("intencion", sentido), routine=gesture))
+                  for n in actuadores]
+        th = threading.Thread(target=self._run_parallel, args=(tareas,), name="intencion", daemon=True)
+        th.start()
+        return th
 
     # ------------------------ Bajo nivel (seguridad) -------------------
-    def _both_off(self, actuador_num: int):
+    def _set(self, actuador_num: int, a: bool, b: bool, cause: str = "manual",
+             routine: str = "", cycle: int = 0):
+        """
+        Aplica el estado A/B (primero apaga, luego enciende) y lo anota si cambió.
+        Sólo se llama con arbiter.lock tomado (Lease.set o el propio árbitro).
+        """
         A = self.relays[actuador_num]["A"]
         B = self.relays[actuador_num]["B"]
-        A.off(); B.off()
+        if not a: A.off()
+        if not b: B.off()
+        if a: A.on()
+        if b: B.on()
+        if self._relay_state[actuador_num] != (a, b):
+            self._relay_state[actuador_num] = (a, b)
+            self.journal.record(actuador_num, a, b, cause, routine, cycle)
 
-    def _drive(self, actuador_num: int, sentido: str, dur_s: float):
+    def _drive(self, lease, sentido: str, dur_s: float) -> bool:
+        """Un tramo con el turno 'lease'. False si se lo quitaron (el relé ya quedó OFF)."""
         assert sentido in ("open", "close"), "sentido debe ser 'open' o 'close'"
-        A = self.relays[actuador_num]["A"]
-        B = self.relays[actuador_num]["B"]
 
         # Interlock + deadtime
-        A.off(); B.off()
-        sleep(self.deadtime_s)
+        if not lease.set(False, False) or lease.wait(self.deadtime_s):
+            return False
 
         # Activa solo el sentido requerido
-        if sentido == "open":
-            A.on(); B.off()
-        else:
-            B.on(); A.off()
+        if not lease.set(sentido == "open", sentido == "close"):
+            return False
 
-        # Mantiene activación el tiempo solicitado
-        sleep(max(0.0, float(dur_s)))
+        # Mantiene activación el tiempo solicitado (una revocación la corta)
+        if lease.wait(max(0.0, float(dur_s))):
+            return False
 
         # Apaga y espera deadtime
-        A.off(); B.off()
-        sleep(self.deadtime_s)
+        return lease.set(False, False) and not lease.wait(self.deadtime_s)
+
+    def _drive_owned(self, actuador_num: int, sentido: str, dur_s: float, cause: str,
+                     key=None, routine: str = "") -> bool:
+        lease = self.arbiter.acquire(actuador_num, cause, key=key, routine=routine)
+        if lease is None:
+            return False
+        with lease:
+            return self._drive(lease, sentido, dur_s)
 
     def _run_parallel(self, tareas: list[callable]):
         """Ejecuta en paralelo una lista de callables (sin args) y espera a que terminen."""
-        hilos = [threading.Thread(target=t, daemon=True) for t in tareas]
-        for th in hilos: th.start()
-        for th in hilos: th.join()
+        self.clock.run_parallel(tareas)
 
-    def _sleep_with_stop(self, dur: float, stop_event: threading.Event | None):
-        """Espera 'dur' segundos comprobando stop_event para poder abortar pausa."""
-        if dur <= 0:
-            return
+    def _wait_with_stop(self, lease, dur: float, stop_event: threading.Event | None) -> bool:
+        """
+        Espera 'dur' segundos con el turno tomado; True si hay que abortar
+        (turno revocado o stop_event, que se comprueba cada 50 ms).
+        """
         end = max(0.0, float(dur))
         step = 0.05
         t = 0.0
         while t < end:
             if stop_event and stop_event.is_set():
-                return
+                return True
             sl = min(step, end - t)
-            sleep(sl)
+            if lease.wait(sl):
+                return True
             t += sl
+        return bool(stop_event and stop_event.is_set())
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Dispositivo AD8232 falso sobre un pseudo-terminal (pty), para cargar la
+ruta de ingesta sin hardware.
+
+Emite exactamente las líneas de sensores_AD8232.ino (Serial.println):
+    n,v1,lo1,v2,lo2,v3,lo3\\r\\n
+con el contador módulo 65536 y cuentas de 10 bits; con otro nº de canales
+se repite el par v,lo. El lado esclavo del pty (o el enlace --link) se
+abre como un /dev/ttyUSB0: adc_reader.py, el daemon (--port) o
+SerialAggregator.
+
+- Señal: EMGSimulator, ECGSimulator (Laptop_client/GUI/data.py), 'mix'
+  (canal 1 ECG, resto EMG) o 'noise' (sólo ruido, lo más barato). mV ->
+  cuentas con la calibración de fábrica (calibration.py), más ruido
+  gaussiano en cuentas.
+- Cable: se modela el UART 8N1 (baud/10 bytes/s) con el búfer de TX de
+  64 bytes del Arduino: si las líneas no caben, el firmware se bloquea en
+  Serial.print y la frecuencia real baja, sin huecos en el contador.
+  baud=0 quita el límite (para medir el parser más allá del cable).
+- Si el lector no vacía el pty a tiempo, el convertidor USB-serie pierde
+  los bytes (desborde): el lector ve líneas rotas y huecos de contador.
+- Fallos: episodios de lead-off (lo=1 y salida en el raíl), corrupción por
+  línea (truncada, sin coma, carácter basura, bytes extra) y ráfagas:
+  'stall' (el host deja de leer y luego llega todo de golpe) o 'garbage'
+  (ruido en la línea).
+
+Medición (el generador corre en otro proceso; el lector es el de verdad):
+    python3 -m RaspberryPI5_server.diagnostics.fake_device --link /tmp/ttyEXO0 --waveform mix
+    python3 -m RaspberryPI5_server.diagnostics.fake_device --measure --fs 2000 --baud 0
+    python3 -m RaspberryPI5_server.diagnostics.fake_device --sweep
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import random
+import select
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from RaspberryPI5_server.emg_processing.calibration import (ADC_BITS, DEFAULT_MV_PER_COUNT,
+                                                            DEFAULT_OFFSET_COUNTS)
+from RaspberryPI5_server.emg_processing.protocol import DEFAULT_BAUD, DEFAULT_FS, parse_line
+from RaspberryPI5_server.emg_processing.timing import ClockSync
+
+try:
+    import termios  # type: ignore
+    import tty      # type: ignore
+    _TERMIOS_OK = True
+except Exception:
+    _TERMIOS_OK = False
+
+ADC_MAX = (1 << ADC_BITS) - 1
+TX_BUFFER = 64                 # búfer de Serial en el ATmega328
+BLOCK_S = 0.01                 # granularidad de generación
+WAVEFORMS = ("emg", "ecg", "mix", "noise")
+CORRUPTIONS = ("trunc", "comma", "char", "extra")
+
+
+@dataclass
+class FakeConfig:
+    channels: int = 3
+    fs: float = DEFAULT_FS
+    baud: int = DEFAULT_BAUD             # 0 = sin límite de cable
+    waveform: str = "emg"
+    noise_counts: float = 2.0
+    lead_off_rate: float = 0.0           # episodios por segundo y canal
+    lead_off_s: float = 0.5
+    corrupt: float = 0.0                 # probabilidad por línea
+    burst_every_s: float = 0.0           # 0 = sin ráfagas
+    burst_s: float = 0.2
+    burst_kind: str = "stall"            # stall | garbage
+    seed: int = 0
+
+
+@dataclass
+class FakeStats:
+    lines: int = 0                       # líneas generadas (= muestras del contador)
+    unsent: int = 0                      # aún en el búfer de TX al parar
+    bytes: int = 0                       # bytes escritos en el pty
+    corrupted: int = 0
+    lead_off_episodes: int = 0
+    bursts: int = 0
+    overrun_bytes: int = 0               # perdidos porque el lector no vació el pty
+    wire_stalls: int = 0                 # bloques retrasados por el límite de baudios
+    elapsed_s: float = 0.0
+
+
+# ---------------------- Señal -------------------------------------------------
+class _Waveform:
+    def __init__(self, cfg: FakeConfig):
+        from RaspberryPI5_server.emg_processing.signal_filter import EMGSimulator
+        self.cfg = cfg
+        self.rng = np.random.default_rng(cfg.seed)
+        if cfg.waveform not in WAVEFORMS:
+            raise ValueError(f"forma de onda desconocida: {cfg.waveform}")
+        n_ecg = {"ecg": cfg.channels, "mix": 1}.get(cfg.waveform, 0)
+        n_emg = {"emg": cfg.channels, "mix": cfg.channels - 1}.get(cfg.waveform, 0)
+        self.ecg = []
+        if n_ecg:
+            from Laptop_client.GUI.data import ECGSimulator
+            self.ecg = [ECGSimulator(fs=cfg.fs) for _ in range(n_ecg)]
+        self.emg = EMGSimulator(fs=int(cfg.fs), channels=n_emg, seed=cfg.seed) if n_emg > 0 else None
+        self._lo_until = np.zeros(cfg.channels)
+        self.lead_off_episodes = 0
+
+    def block(self, k: int, t: float) -> Tuple[np.ndarray, np.ndarray]:
+        """k muestras a partir del instante t (s): (cuentas int [k, ch], lead-off [k, ch])."""
+        cfg = self.cfg
+        mv = np.zeros((k, cfg.channels))
+        c = 0
+        for sim in self.ecg:
+            y = np.asarray(sim.generar(k / cfg.fs)[0], dtype=np.float64)[:k]
+            mv[:y.size, c] = y
+            c += 1
+        if self.emg is not None:
+            mv[:, c:] = np.asarray(self.emg.next_chunk(k), dtype=np.float64).T
+        counts = DEFAULT_OFFSET_COUNTS + mv / DEFAULT_MV_PER_COUNT
+        if cfg.noise_counts:
+            counts += self.rng.normal(0.0, cfg.noise_counts, counts.shape)
+        lo = np.zeros((k, cfg.channels), dtype=np.uint8)
+        if cfg.lead_off_rate:
+            start = self.rng.random(cfg.channels) < cfg.lead_off_rate * k / cfg.fs
+            start &= self._lo_until <= t
+            self._lo_until[start] = t + cfg.lead_off_s
+            self.lead_off_episodes += int(start.sum())
+            off = self._lo_until > t
+            lo[:, off] = 1
+            counts[:, off] = ADC_MAX                 # electrodo suelto: salida al raíl
+        return np.clip(np.rint(counts), 0, ADC_MAX).astype(np.int64), lo
+
+
+# ---------------------- Dispositivo -------------------------------------------
+class FakeDevice:
+    def __init__(self, cfg: FakeConfig = FakeConfig(), link: Optional[str] = None):
+        self.cfg = cfg
+        self.link = link
+        self.stats = FakeStats()
+        self.master = self.slave = -1
+        self.path = ""
+
+    def open(self) -> str:
+        """Crea el pty (modo raw: sin eco ni traducción de fin de línea). Devuelve la ruta del esclavo."""
+        self.master, self.slave = os.openpty()
+        if _TERMIOS_OK:
+            tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.path = os.ttyname(self.slave)
+        if self.link:
+            if os.path.islink(self.link):
+                os.unlink(self.link)
+            os.symlink(self.path, self.link)
+        return self.path
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            if fd >= 0:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.slave = -1
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+
+    # ------------------------ líneas ------------------------------------
+    def _lines(self, counter0: int, counts: np.ndarray, lo: np.ndarray, rng: random.Random) -> bytes:
+        ch = self.cfg.channels
+        cols = np.empty((counts.shape[0], 1 + 2 * ch), dtype=np.int64)
+        cols[:, 0] = (counter0 + np.arange(counts.shape[0])) & 0xFFFF
+        cols[:, 1::2], cols[:, 2::2] = counts, lo
+        lines = [",".join(map(str, row)) + "\r\n" for row in cols.tolist()]
+        if self.cfg.corrupt:
+            for i in range(len(lines)):
+                if rng.random() < self.cfg.corrupt:
+                    lines[i] = self._corrupt(lines[i], rng)
+                    self.stats.corrupted += 1
+        return "".join(lines).encode("ascii", "replace")
+
+    @staticmethod
+    def _corrupt(line: str, rng: random.Random) -> str:
+        kind = rng.choice(CORRUPTIONS)
+        body = line[:-2]
+        if kind == "trunc":                      # sin fin de línea: se pega a la siguiente
+            return body[:rng.randrange(1, len(body))]
+        if kind == "comma" and "," in body:
+            i = rng.choice([k for k, c in enumerate(body) if c == ","])
+            return body[:i] + body[i + 1:] + "\r\n"
+        if kind == "char":
+            i = rng.randrange(len(body))
+            return body[:i] + rng.choice("x?\x00\xff") + body[i + 1:] + "\r\n"
+        i = rng.randrange(len(body))
+        return body[:i] + "".join(chr(rng.randrange(32, 127)) for _ in range(rng.randint(1, 6))) + body[i:] + "\r\n"
+
+    # ------------------------ bucle -------------------------------------
+    def run(self, seconds: Optional[float] = None, stop=None) -> FakeStats:
+        """Emite hasta 'seconds' o hasta que se marque 'stop' (threading/mp Event)."""
+        cfg = self.cfg
+        wave = _Waveform(cfg)
+        rng = random.Random(cfg.seed)
+        k = max(1, int(round(cfg.fs * BLOCK_S)))
+        wire = cfg.baud / 10.0 if cfg.baud else float("inf")      # bytes/s en 8N1
+        st = self.stats
+        pending = bytearray()                   # en el búfer de TX del micro
+        held = bytearray()                      # en el convertidor USB durante un 'stall'
+        t0 = time.monotonic()
+        sent_wire = 0.0                         # bytes que el cable ya sacó
+        next_burst = t0 + cfg.burst_every_s if cfg.burst_every_s else float("inf")
+        burst_end = 0.0
+        while not (stop is not None and stop.is_set()):
+            now = time.monotonic()
+            if seconds is not None and now - t0 >= seconds:
+                break
+            if now >= next_burst:
+                burst_end, next_burst = now + cfg.burst_s, next_burst + cfg.burst_every_s
+                st.bursts += 1
+            in_burst = now < burst_end
+
+            # Muestreo: sólo si el búfer de TX tiene hueco (si no, Serial.print bloquea)
+            due = int((now - t0) * cfg.fs)
+            while st.lines + k <= due:
+                if len(pending) > TX_BUFFER and wire != float("inf"):
+                    st.wire_stalls += 1
+                    break
+                counts, lo = wave.block(k, st.lines / cfg.fs)
+                pending += self._lines(st.lines, counts, lo, rng)
+                st.lines += k
+            if in_burst and cfg.burst_kind == "garbage":
+                pending += bytes(rng.randrange(256) for _ in range(rng.randint(1, 32)))
+
+            # Cable: como mucho baud/10 bytes/s, sin acumular crédito estando ocioso
+            if wire == float("inf"):
+                budget = len(pending)
+            else:
+                sent_wire = max(sent_wire, (now - t0) * wire - TX_BUFFER)
+                budget = max(0, min(len(pending), int((now - t0) * wire - sent_wire)))
+            chunk = bytes(pending[:budget])
+            del pending[:budget]
+            sent_wire += budget
+            if in_burst and cfg.burst_kind == "stall":
+                held += chunk                    # el host no lee: se acumula en el convertidor
+            elif held or chunk:
+                data, held = bytes(held) + chunk, bytearray()
+                try:
+                    w = os.write(self.master, data)
+                except BlockingIOError:
+                    w = 0
+                except OSError:
+                    break                        # pty cerrado
+                st.bytes += w
+                st.overrun_bytes += len(data) - w     # el lector no dio abasto: se pierden
+            time.sleep(0.001)
+        st.unsent = pending.count(b"\n") + held.count(b"\n")
+        st.lead_off_episodes = wave.lead_off_episodes
+        st.elapsed_s = time.monotonic() - t0
+        return st
+
+
+# ---------------------- Medición ----------------------------------------------
+def _serve(dev: FakeDevice, go, stop, out):
+    os.close(dev.slave)                          # el hijo sólo escribe
+    dev.slave = -1
+    go.wait()
+    out.put(asdict(dev.run(stop=stop)))
+
+
+def _read_aggregator(path: str, cfg: FakeConfig, seconds: float, start) -> Dict:
+    from RaspberryPI5_server.emg_processing.aggregator import DeviceSpec, SerialAggregator
+    agg = SerialAggregator([DeviceSpec(path, cfg.channels, baud=cfg.baud or DEFAULT_BAUD, fs=cfg.fs)],
+                           fs_out=cfg.fs)
+
+    async def run():
+        task = asyncio.ensure_future(agg.run())
+        await asyncio.sleep(0.1)                 # puerto abierto antes de emitir
+        start()
+        await asyncio.sleep(seconds)
+        agg.stop()
+        await task
+
+    asyncio.run(run())
+    s = agg.stats()[0]
+    return {"good": s["lines"] - s["parse_errors"], "parse_errors": s["parse_errors"],
+            "gaps": s["dropped"]}
+
+
+def _read_lines(path: str, cfg: FakeConfig, seconds: float, start) -> Dict:
+    """
+    Lector mínimo: read() + partir en líneas + parse_line, sin ajuste de
+    reloj ni mezcla (cota del parser). Los contadores pasan por
+    ClockSync.split, el mismo criterio que el daemon: un salto no se toma
+    como nuevo 'last' hasta que la línea siguiente lo confirma.
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_NOCTTY)
+    if _TERMIOS_OK:
+        tty.setraw(fd)
+    good = errors = gaps = 0
+    clock = ClockSync(cfg.fs)
+    last: Optional[int] = None
+    partial = b""
+    start()
+    end = time.monotonic() + seconds
+    try:
+        while time.monotonic() < end:
+            if not select.select([fd], [], [], 0.05)[0]:
+                continue
+            lines = (partial + os.read(fd, 65536)).split(b"\n")
+            partial = lines.pop()
+            counters = []
+            for raw in lines:
+                # El firmware siempre manda contador: una línea sin él es un resto
+                parsed = parse_line(raw.decode("ascii", "ignore"), cfg.channels, True)
+                if not parsed or len(parsed[0]) != cfg.channels:
+                    errors += 1
+                    continue
+                counters.append(parsed[2])
+            if not counters:
+                continue
+            rejected = clock.rejected
+            for ticks, _, restart in clock.split(np.asarray(counters), np.zeros((len(counters), 0))):
+                if last is not None and not restart:
+                    gaps += int(ticks[0]) - last - 1
+                gaps += int(ticks[-1] - ticks[0]) + 1 - ticks.size
+                good += ticks.size
+                last = int(ticks[-1])
+            errors += clock.rejected - rejected  # contador imposible: línea corrupta que parseó
+    finally:
+        os.close(fd)
+    return {"good": good, "parse_errors": errors, "gaps": gaps}
+
+
+def measure(cfg: FakeConfig, seconds: float = 3.0, reader: str = "aggregator") -> Dict:
+    """
+    Generador en un proceso hijo, lector real en este. Pérdida = 1 - líneas
+    válidas leídas / líneas que salieron del micro (desbordes + corrupción).
+    """
+    ctx = mp.get_context("fork")
+    dev = FakeDevice(cfg)
+    path = dev.open()
+    go, stop, out = ctx.Event(), ctx.Event(), ctx.Queue()
+    child = ctx.Process(target=_serve, args=(dev, go, stop, out), daemon=True)
+    child.start()
+    os.close(dev.master)
+    dev.master = -1
+
+    def start():
+        go.set()
+        # El generador para antes que el lector, que así vacía lo que quede
+        timer = threading.Timer(max(0.0, seconds - 0.3), stop.set)
+        timer.daemon = True
+        timer.start()
+
+    cpu, t = time.process_time(), time.perf_counter()
+    try:
+        r = (_read_lines if reader == "readline" else _read_aggregator)(path, cfg, seconds, start)
+    finally:
+        stop.set()
+        gen = out.get(timeout=5.0)
+        child.join(timeout=2.0)
+        dev.close()
+    wall = time.perf_counter() - t
+    sent = gen["lines"] - gen["unsent"]
+    line_bytes = gen["bytes"] / max(1, sent)
+    emitted_s = sent / max(1e-9, gen["elapsed_s"])
+    return {"fs": cfg.fs, "baud": cfg.baud, "reader": reader, "emitted_s": emitted_s,
+            "wire_cap_s": (cfg.baud / 10.0 / line_bytes) if cfg.baud else float("inf"),
+            "good_s": r["good"] / max(1e-9, gen["elapsed_s"]),
+            "loss": 1.0 - r["good"] / max(1, sent), "parse_errors": r["parse_errors"],
+            "gaps": r["gaps"], "overrun_bytes": gen["overrun_bytes"],
+            "reader_cpu": (time.process_time() - cpu) / wall, "generator": gen}
+
+
+def _row(m: Dict) -> str:
+    cap = "∞" if m["wire_cap_s"] == float("inf") else f"{m['wire_cap_s']:,.0f}"
+    return (f"{m['fs']:>7.0f} {m['baud'] or '∞':>7} {m['reader']:>10} {m['emitted_s']:>10,.0f} {cap:>9} "
+            f"{m['good_s']:>10,.0f} {m['loss'] * 100:>6.2f}% {m['parse_errors']:>6} {m['gaps']:>7} "
+            f"{m['overrun_bytes']:>9,} {m['reader_cpu'] * 100:>5.0f}%")
+
+
+HEADER = (f"{'fs':>7} {'baud':>7} {'lector':>10} {'líneas/s':>10} {'cable/s':>9} {'válidas/s':>10} "
+          f"{'pérdida':>7} {'errores':>6} {'huecos':>7} {'desborde':>9} {'CPU':>6}")
+
+
+def sweep(rates: List[float], bauds: List[int], seconds: float, reader: str, cfg: FakeConfig):
+    print(f"{cfg.channels} canales, forma '{cfg.waveform}', {seconds:.0f} s por prueba, "
+          f"{os.cpu_count()} CPU")
+    print(HEADER)
+    for baud in bauds:
+        for fs in rates:
+            c = FakeConfig(**{**asdict(cfg), "fs": fs, "baud": baud})
+            print(_row(measure(c, seconds, reader)), flush=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Dispositivo AD8232 falso sobre un pty")
+    ap.add_argument("--channels", type=int, default=3)
+    ap.add_argument("--fs", type=float, default=DEFAULT_FS)
+    ap.add_argument("--baud", type=int, default=DEFAULT_BAUD, help="0 = sin límite de cable")
+    ap.add_argument("--waveform", choices=WAVEFORMS, default="emg")
+    ap.add_argument("--noise", type=float, default=2.0, help="ruido gaussiano (cuentas)")
+    ap.add_argument("--lead-off-rate", type=float, default=0.0, help="episodios/s por canal")
+    ap.add_argument("--lead-off-s", type=float, default=0.5)
+    ap.add_argument("--corrupt", type=float, default=0.0, help="probabilidad de corrupción por línea")
+    ap.add_argument("--burst-every-s", type=float, default=0.0)
+    ap.add_argument("--burst-s", type=float, default=0.2)
+    ap.add_argument("--burst-kind", choices=("stall", "garbage"), default="stall")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--link", default=None, help="enlace simbólico al pty (p.ej. /tmp/ttyEXO0)")
+    ap.add_argument("--seconds", type=float, default=None)
+    ap.add_argument("--measure", action="store_true", help="mide pérdida y rendimiento de un lector")
+    ap.add_argument("--reader", choices=("aggregator", "readline"), default="aggregator")
+    ap.add_argument("--sweep", action="store_true", help="tabla de fs x baudios")
+    a = ap.parse_args(argv)
+
+    cfg = FakeConfig(a.channels, a.fs, a.baud, a.waveform, a.noise, a.lead_off_rate, a.lead_off_s,
+                     a.corrupt, a.burst_every_s, a.burst_s, a.burst_kind, a.seed)
+    if a.sweep:
+        sweep([400, 1000, 2000, 4000, 8000, 16000, 32000], [DEFAULT_BAUD, 0], a.seconds or 3.0, a.reader, cfg)
+        return
+    if a.measure:
+        print(HEADER)
+        print(_row(measure(cfg, a.seconds or 3.0, a.reader)))
+        return
+
+    dev = FakeDevice(cfg, link=a.link)
+    path = dev.open()
+    print(f"pty: {path}" + (f" (enlace {a.link})" if a.link else "") + "  —  Ctrl-C para salir")
+    try:
+        st = dev.run(a.seconds)
+    except KeyboardInterrupt:
+        st = dev.stats
+    finally:
+        dev.close()
+    print(f"{st.lines} líneas, {st.bytes:,} bytes, {st.corrupted} corruptas, "
+          f"{st.lead_off_episodes} lead-off, {st.bursts} ráfagas, {st.overrun_bytes:,} bytes desbordados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Perfilado bajo demanda de un proceso en marcha (kiosk o daemon), sin
+reiniciarlo.
+
+- Muestreo: un hilo aparte lee sys._current_frames() cada 'interval' y
+  cuenta la pila de TODOS los demás hilos (tiempo de pared: un hilo
+  bloqueado en wait() también aparece, que es justo lo que interesa cuando
+  la UI "se siente lenta"). Si una muestra cuesta más de 'max_overhead'
+  del periodo, el intervalo se alarga solo.
+- Memoria (opcional, alloc=True / --alloc): tracemalloc sólo durante la
+  ventana (si nadie lo tenía ya activo), con pocas tramas por traza; al
+  final se compara la instantánea inicial con la final. Es lo caro: en
+  código que asigna sin parar puede frenar el proceso a la mitad o menos
+  durante la ventana (ver --bench), así que por defecto (UI y daemon en
+  plena sesión) sólo se muestrea, que no se nota.
+- Un solo perfil a la vez por proceso y duración acotada (MAX_SECONDS):
+  es seguro lanzarlo en mitad de una sesión de terapia. La adquisición y
+  los relés del daemon corren en sus propios hilos y el perfilador sólo
+  lee sus pilas.
+
+Salida en <EXO_PROFILE_DIR>/<fecha>-<etiqueta>/:
+    stacks.collapsed   pila;pila;... cuenta  (flamegraph.pl, speedscope, inferno)
+    allocations.txt    crecimiento y mayores asignadores (sólo con alloc)
+    summary.json       duración, muestras, sobrecoste, hilos y funciones más vistas
+
+Se dispara desde la UI (botón en "Bitácora"), por el socket del daemon
+(comando "profile") o por el socket del kiosk (EXO_PROFILER_SOCKET):
+    python3 -m RaspberryPI5_server.diagnostics.profiler --seconds 10
+    python3 -m RaspberryPI5_server.diagnostics.profiler --socket /tmp/exo_daemon.sock --seconds 30 [--alloc]
+    python3 -m RaspberryPI5_server.diagnostics.profiler --bench
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+
+PROFILE_DIR = os.environ.get(
+    "EXO_PROFILE_DIR", os.path.join(os.path.expanduser("~"), ".exo", "profiles"))
+DEFAULT_PROFILER_SOCKET = os.environ.get("EXO_PROFILER_SOCKET", "/tmp/exo_ui_profiler.sock")
+MAX_SECONDS = 120.0
+MAX_DEPTH = 128
+
+
+# ---------------------- Muestreador ------------------------------------------
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, max_overhead: float = 0.02,
+                 alloc: bool = False, alloc_frames: int = 4, top: int = 40):
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.alloc, self.alloc_frames, self.top = alloc, alloc_frames, top
+        self.stacks: Counter = Counter()
+        self.threads: Counter = Counter()
+        self.samples = 0
+        self.busy_s = 0.0                      # CPU de pared gastada muestreando
+        self._labels: Dict[object, str] = {}   # code -> "func (archivo:línea)"
+        self._stop = threading.Event()
+        self._th: Optional[threading.Thread] = None
+        self._snap0 = None
+        self._own_tracing = False
+        self.t0 = self.t1 = 0.0
+
+    def start(self):
+        if self.alloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.alloc_frames)
+                self._own_tracing = True
+            self._snap0 = tracemalloc.take_snapshot()
+        self.t0 = time.monotonic()
+        self._th = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._th.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._th is not None:
+            self._th.join()
+        self.t1 = time.monotonic()
+
+    def _label(self, code) -> str:
+        lab = self._labels.get(code)
+        if lab is None:
+            fn = code.co_filename
+            parts = fn.replace("\\", "/").rsplit("/", 2)
+            short = "/".join(parts[-2:]) if len(parts) > 1 else fn
+            lab = f"{code.co_name} ({short}:{code.co_firstlineno})".replace(";", ",")
+            self._labels[code] = lab
+        return lab
+
+    def _stack(self, frame) -> Tuple[str, ...]:
+        out = []
+        while frame is not None and len(out) < MAX_DEPTH:
+            out.append(self._label(frame.f_code))
+            frame = frame.f_back
+        out.reverse()
+        return tuple(out)
+
+    def _run(self):
+        me = threading.get_ident()
+        interval = self.interval
+        while not self._stop.wait(interval):
+            t = time.perf_counter()
+            names = {th.ident: th.name for th in threading.enumerate()}
+            frames, frame = sys._current_frames(), None
+            for tid, frame in frames.items():
+                if tid == me:
+                    continue
+                name = names.get(tid, f"thread-{tid}").replace(";", ",")
+                self.stacks[(name,) + self._stack(frame)] += 1
+                self.threads[name] += 1
+            del frames, frame           # no retener tramas entre muestras
+            self.samples += 1
+            cost = time.perf_counter() - t
+            self.busy_s += cost
+            # Sobrecoste acotado: el periodo crece si muestrear se encarece
+            interval = max(self.interval, cost / self.max_overhead)
+
+    # ------------------------ resultados ------------------------------------
+    def write(self, out_dir: str) -> Dict:
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "stacks.collapsed"), "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(";".join(stack) + f" {n}\n")
+
+        # "self": la función en la cima de la pila (hilos en espera incluidos)
+        leaf: Counter = Counter()
+        for stack, n in self.stacks.items():
+            leaf[stack[-1]] += n
+        total = sum(self.stacks.values()) or 1
+        dur = max(1e-9, (self.t1 or time.monotonic()) - self.t0)
+        summary = {
+            "out_dir": out_dir,
+            "duration_s": round(dur, 3),
+            "samples": self.samples,
+            "sample_hz": round(self.samples / dur, 1),
+            "overhead_pct": round(100.0 * self.busy_s / dur, 2),
+            "threads": dict(self.threads.most_common()),
+            "top_self": [[lab, round(100.0 * n / total, 2)] for lab, n in leaf.most_common(15)],
+        }
+        if self._snap0 is not None:
+            summary["alloc"] = self._write_alloc(os.path.join(out_dir, "allocations.txt"))
+        with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        return summary
+
+    def _write_alloc(self, path: str) -> Dict:
+        filt = [tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)]
+        snap1 = tracemalloc.take_snapshot().filter_traces(filt)
+        snap0 = self._snap0.filter_traces(filt)
+        if self._own_tracing:
+            tracemalloc.stop()
+        self._snap0 = None
+        diff = snap1.compare_to(snap0, "lineno")
+        cur = snap1.statistics("lineno")
+        grown = sum(d.size_diff for d in diff)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# Crecimiento neto en la ventana: {grown / 1024:+.1f} KiB "
+                    f"({'trazas desde el inicio de la ventana' if self._own_tracing else 'tracemalloc ya activo'})\n\n")
+            f.write("## Mayor crecimiento (lineno)\n")
+            for d in diff[:self.top]:
+                f.write(f"{d.size_diff / 1024:+10.1f} KiB {d.count_diff:+8d} bloques  {d.traceback}\n")
+            f.write("\n## Mayores asignadores vivos (lineno)\n")
+            for s in cur[:self.top]:
+                f.write(f"{s.size / 1024:10.1f} KiB {s.count:8d} bloques  {s.traceback}\n")
+            f.write("\n## Trazas del mayor crecimiento\n")
+            for d in snap1.compare_to(snap0, "traceback")[:5]:
+                f.write(f"\n{d.size_diff / 1024:+.1f} KiB {d.count_diff:+d} bloques\n")
+                for line in d.traceback.format():
+                    f.write(line + "\n")
+        return {"grown_kib": round(grown / 1024, 1),
+                "top": [[str(d.traceback), round(d.size_diff / 1024, 1)] for d in diff[:5]]}
+
+
+# ---------------------- Un perfil a la vez -----------------------------------
+_busy = threading.Lock()
+_last: Dict = {}
+
+
+def _default_label() -> str:
+    return os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+
+
+def profile_for(seconds: float, alloc: bool = False, interval: float = 0.005,
+                label: Optional[str] = None, root: str = PROFILE_DIR) -> Dict:
+    """Perfila este proceso durante 'seconds' (acotado a MAX_SECONDS) y devuelve el resumen."""
+    if not _busy.acquire(blocking=False):
+        raise RuntimeError("Ya hay un perfil en curso.")
+    try:
+        seconds = min(max(0.1, float(seconds)), MAX_SECONDS)
+        out_dir = os.path.join(root, f"{time.strftime('%Y%m%d-%H%M%S')}-{label or _default_label()}")
+        prof = SamplingProfiler(interval=interval, alloc=alloc)
+        prof.start()
+        try:
+            time.sleep(seconds)
+        finally:
+            prof.stop()
+        summary = prof.write(out_dir)
+        _last.clear(); _last.update(summary)
+        return summary
+    finally:
+        _busy.release()
+
+
+def profile_async(seconds: float, on_done: Optional[Callable[[Dict], None]] = None,
+                  on_error: Optional[Callable[[Exception], None]] = None, **kw) -> threading.Thread:
+    """profile_for() en un hilo; el resultado (o el error) llega por callback."""
+    def run():
+        try:
+            summary = profile_for(seconds, **kw)
+        except Exception as ex:
+            if on_error:
+                on_error(ex)
+            return
+        if on_done:
+            on_done(summary)
+    th = threading.Thread(target=run, name="profile-window", daemon=True)
+    th.start()
+    return th
+
+
+def handle_request(req: Dict, label: Optional[str] = None) -> Dict:
+    """Comandos 'profile' y 'profile_status' (los comparten el daemon y el kiosk)."""
+    cmd = req.get("cmd")
+    if cmd == "profile_status":
+        return {"ok": True, "running": _busy.locked(), "last": dict(_last)}
+    if cmd == "profile":
+        kw = {"alloc": bool(req.get("alloc", False)), "label": label}
+        seconds = float(req.get("seconds", 10.0))
+        if req.get("wait", True):
+            try:
+                return {"ok": True, **profile_for(seconds, **kw)}
+            except RuntimeError as ex:
+                return {"ok": False, "error": str(ex)}
+        if _busy.locked():
+            return {"ok": False, "error": "Ya hay un perfil en curso."}
+        profile_async(seconds, **kw)
+        return {"ok": True, "started": True, "seconds": min(seconds, MAX_SECONDS)}
+    return {"ok": False, "error": f"Comando desconocido: {cmd}"}
+
+
+# ---------------------- Socket local -----------------------------------------
+class ProfilerServer:
+    """Socket Unix (una línea JSON por petición) para perfilar el kiosk desde fuera."""
+
+    def __init__(self, sock_path: str = DEFAULT_PROFILER_SOCKET, label: Optional[str] = None):
+        self.sock_path = sock_path
+        self.label = label
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+
+    def start(self) -> "ProfilerServer":
+        label = self.label
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        resp = handle_request(json.loads(line), label)
+                    except Exception as ex:
+                        resp = {"ok": False, "error": str(ex)}
+                    self.wfile.write((json.dumps(resp, ensure_ascii=False) + "\n").encode())
+
+        if os.path.exists(self.sock_path):
+            os.unlink(self.sock_path)
+        self._server = socketserver.ThreadingUnixStreamServer(self.sock_path, _Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.5},
+                         name="profiler-socket", daemon=True).start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.sock_path):
+                os.unlink(self.sock_path)
+
+
+# ---------------------- Benchmark --------------------------------------------
+def bench(seconds: float = 3.0, workers: int = 4):
+    """Caída de rendimiento de hilos que sólo calculan: sin perfilar, muestreando y con tracemalloc."""
+    import tempfile
+
+    def spin(stop, counter, i):
+        while not stop.is_set():
+            sum(range(200))
+            counter[i] += 1
+
+    def run(mode: Optional[str]) -> float:
+        stop, counter = threading.Event(), [0] * workers
+        ths = [threading.Thread(target=spin, args=(stop, counter, i), daemon=True) for i in range(workers)]
+        for th in ths: th.start()
+        with tempfile.TemporaryDirectory() as d:
+            if mode:
+                summary = profile_for(seconds, alloc=(mode == "alloc"), label="bench", root=d)
+            else:
+                time.sleep(seconds)
+            stop.set()
+            for th in ths: th.join()
+        return sum(counter) / seconds, (summary if mode else None)
+
+    base, _ = run(None)
+    print(f"{workers} hilos de cálculo, {seconds:.0f} s por prueba: {base:,.0f} it/s sin perfilar")
+    for mode, txt in (("stacks", "sólo muestreo"), ("alloc", "muestreo + tracemalloc")):
+        rate, s = run(mode)
+        print(f"  {txt:<24} {rate:>12,.0f} it/s ({100 * (1 - rate / base):+5.1f}% de caída), "
+              f"{s['samples']} muestras a {s['sample_hz']} Hz, muestreador {s['overhead_pct']}% de la ventana")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Perfilado bajo demanda (muestreo + tracemalloc)")
+    ap.add_argument("--socket", default=DEFAULT_PROFILER_SOCKET,
+                    help="socket del proceso a perfilar (kiosk o daemon)")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--alloc", action="store_true",
+                    help="también instantáneas de tracemalloc (frena el proceso durante la ventana)")
+    ap.add_argument("--status", action="store_true")
+    ap.add_argument("--bench", action="store_true")
+    a = ap.parse_args(argv)
+
+    if a.bench:
+        bench()
+        return
+    from RaspberryPI5_server.emg_processing.daemon_client import DaemonClient
+    cli = DaemonClient(a.socket, timeout=min(a.seconds, MAX_SECONDS) + 30.0)
+    if a.status:
+        resp = cli.call("profile_status")
+    else:
+        resp = cli.call("profile", seconds=a.seconds, alloc=a.alloc, wait=True)
+    print(json.dumps(resp, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
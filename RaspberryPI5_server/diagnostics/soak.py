@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Prueba de resistencia (soak) de main_window.py sin navegador.
+
+Levanta window_main() sobre una página sin conexión (HeadlessPage) que sí
+calcula el diff de Flet en cada update(), igual que la página real antes
+de enviarlo, y durante horas repite al azar (semilla fija) lo que pasa en
+un turno de clínica:
+
+- abrir las hojas de usuarios/pacientes, buscar, elegir un registro y cerrar
+- iniciar/parar el sensor (con paciente elegido se graba la sesión)
+- rutinas, pulsos manuales, HOME y paro (relés simulados, reloj acelerado)
+- cerrar la sesión del navegador y abrir otra
+
+Cada 'sample_s' se anota RSS, memoria trazada (tracemalloc), hilos vivos,
+controles en el árbol de la página, controles montados (índice de la
+página), BottomSheets en el overlay, líneas de bitácora, latencia de
+cuadro (EMGEngine._render con su page.update) y bytes por update.
+
+El calentamiento ejecuta primero cada acción al menos una vez (WARMUP:
+usuario y paciente elegidos, sensor grabando hasta llenar la ventana del
+Scope, cerrado con su resumen, rutina, pulso, HOME, paro y reconexión),
+para que las importaciones perezosas, los primeros hilos y el mayor diff de
+Flet no cuenten como crecimiento, y dura como mínimo 'warmup_s'. Al final
+se compara contra la muestra tomada justo después: si
+algo crece por encima de su presupuesto (Budget) la prueba falla (código 1) y se
+listan los asignadores que más crecieron. Con tracemalloc activo la
+latencia de cuadro sale inflada y sólo se informa; para juzgarla, --no-trace.
+Todo se escribe en un directorio
+temporal (sesiones, diario de relés) salvo el CSV de la serie temporal.
+
+    python3 -m RaspberryPI5_server.diagnostics.soak --minutes 10
+    python3 -m RaspberryPI5_server.diagnostics.soak --hours 8 --speed 50 --csv soak.csv
+"""
+from __future__ import annotations
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, fields
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# ---------------------- Presupuestos y muestras -------------------------------
+@dataclass
+class Budget:
+    """Crecimiento máximo permitido respecto a la muestra tras el calentamiento."""
+    rss_mb: float = 40.0
+    traced_mb: float = 20.0
+    threads: int = 8
+    controls: int = 300          # controles en el árbol de la página
+    mounted: int = 300           # controles en el índice de la página
+    frame_p99_ms: float = 50.0   # valor absoluto, no crecimiento
+
+
+@dataclass
+class Sample:
+    t_s: float
+    rss_mb: float
+    traced_mb: float
+    threads: int
+    controls: int
+    mounted: int
+    overlay: int
+    log_lines: int
+    frame_p50_ms: float
+    frame_p99_ms: float
+    update_kb: float             # bytes medios por page.update() desde la muestra anterior
+    actions: int
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0   # pico, en Linux en KiB
+
+
+def walk(roots) -> list:
+    """Todos los controles alcanzables desde 'roots' (sin repetir)."""
+    seen, out, stack = set(), [], list(roots)
+    while stack:
+        c = stack.pop()
+        if c is None or id(c) in seen:
+            continue
+        seen.add(id(c))
+        out.append(c)
+        try:
+            stack.extend(c._get_children())
+        except Exception:
+            pass
+    return out
+
+
+# ---------------------- Página sin conexión ----------------------------------
+class HeadlessPage:
+    """
+    Sustituye a ft.Page: guarda los atributos que fija window_main() y en
+    update() construye los comandos de Flet (mismo diff que la página real)
+    y asigna ids como lo haría el cliente. Así el coste y el tamaño de cada
+    update y los controles montados se miden de verdad.
+    """
+    _ids = itertools.count()
+
+    def __init__(self):
+        import flet as ft
+        from flet.core.protocol import CommandEncoder
+        page = self
+
+        class _Root(ft.Control):
+            def _get_control_name(self):
+                return "page"
+
+            def _get_children(self):
+                return page.controls + page.overlay
+
+        self._encoder = CommandEncoder
+        self.window = SimpleNamespace()
+        self.controls: list = []
+        self.overlay: list = []
+        self.on_disconnect = None
+        self.snack_bar = None
+        self._root = _Root()
+        self._root._Control__uid = "page"
+        self._index: Dict = {"page": self}
+        self._lock = threading.RLock()
+        self.updates = 0
+        self.update_bytes = 0
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+        self.update()
+
+    def update(self, *controls):
+        with self._lock:
+            commands, added, removed = [], [], []
+            for c in (controls or (self._root,)):
+                c.build_update_commands(self._index, commands, added, removed)
+            for c in added:
+                uid = f"_{next(self._ids)}"
+                c._Control__uid = uid
+                self._index[uid] = c
+            for c in removed:
+                c.parent = None
+            self.updates += 1
+            self.update_bytes += len(json.dumps(commands, cls=self._encoder))
+
+    def tree(self) -> list:
+        return walk([self._root])
+
+    @property
+    def mounted(self) -> int:
+        return len(self._index) - 1
+
+
+class _Session:
+    """Una pestaña del kiosk: window_main() sobre una HeadlessPage y sus botones."""
+
+    def __init__(self, mw, rng: random.Random):
+        import flet as ft
+        self.ft, self.rng = ft, rng
+        self.page = HeadlessPage()
+        mw.window_main(self.page)
+        tree = self.page.tree()
+
+        def by_text(text):
+            return [c for c in tree if getattr(c, "text", None) == text and getattr(c, "on_click", None)]
+        self.users_btn = by_text("Usuarios")[0]
+        self.patients_btn = by_text("Pacientes")[0]
+        self.start_btn = by_text("Start Sensor")[0]
+        self.stop_btn = by_text("Stop Sensor")[0]
+        self.routine_btn = by_text("▶ Ejecutar (1 vez)")[0]
+        self.paro_btn = by_text("⛔ Paro de rutina (HOME)")[0]
+        self.home_btn = by_text("🏠 HOME")[0]
+        self.pulse_btns = by_text("Open") + by_text("Close")
+        self.routine_dd = next(c for c in tree if isinstance(c, ft.Dropdown))
+        self.log_list = next(c for c in tree if isinstance(c, ft.ListView))
+        self.sensor_on = False
+
+    # ------------------------ acciones --------------------------------------
+    def _open_sheet(self):
+        sheets = [c for c in self.page.overlay if isinstance(c, self.ft.BottomSheet) and c.open]
+        return sheets[-1] if sheets else None
+
+    def sheet(self, btn, search: bool = True):
+        btn.on_click(None)
+        bs = self._open_sheet()
+        if bs is None:
+            return                                    # p.ej. "Selecciona un usuario primero"
+        tree = walk([bs])
+        if search and self.rng.random() < 0.3:
+            search = next((c for c in tree if isinstance(c, self.ft.TextField)), None)
+            if search is not None and search.on_change:
+                search.value = self.rng.choice(["", "a", "P-00", "Ana"])
+                search.on_change(None)
+                tree = walk([bs])
+        rows = [c for c in tree if isinstance(c, self.ft.Container) and c.on_click and c.visible]
+        if rows:
+            self.rng.choice(rows).on_click(None)
+        bs.open = False
+        self.page.update()
+        if getattr(bs, "on_dismiss", None):
+            bs.on_dismiss(None)
+
+    def sensor(self):
+        (self.stop_btn if self.sensor_on else self.start_btn).on_click(None)
+        self.sensor_on = not self.sensor_on
+
+    def routine(self):
+        self.routine_dd.value = self.rng.choice(["Rutina 1", "Rutina 2", "Rutina 3"])
+        self.routine_btn.on_click(None)
+
+    def pulse(self):
+        self.rng.choice(self.pulse_btns).on_click(None)
+
+    def close(self):
+        if self.page.on_disconnect:
+            self.page.on_disconnect(None)
+
+
+# ---------------------- Prueba -----------------------------------------------
+class SoakRunner:
+    ACTIONS = (("users", 3.0), ("patients", 3.0), ("sensor", 2.0), ("pulse", 2.0),
+               ("routine", 1.0), ("home", 0.3), ("paro", 0.3), ("reconnect", 0.3))
+    # Calentamiento, en orden, antes de la línea base ("hold": el Scope llena su ventana)
+    WARMUP = ("users", "patients", "sensor", "pulse", "routine", "home", "paro",
+              "hold", "sensor", "reconnect")
+
+    def __init__(self, seconds: float, step_s: float = 0.5, sample_s: float = 10.0,
+                 speed: float = 20.0, seed: int = 0, warmup_s: Optional[float] = None,
+                 budget: Optional[Budget] = None, trace: bool = True, verbose: bool = True):
+        self.seconds, self.step_s, self.sample_s = seconds, step_s, sample_s
+        self.speed, self.trace, self.verbose = speed, trace, verbose
+        self.warmup_s = min(60.0, 0.2 * seconds) if warmup_s is None else warmup_s
+        self.budget = budget or Budget()
+        self.rng = random.Random(seed)
+        self.samples: List[Sample] = []
+        self.failures: List[str] = []
+        self.actions = 0
+        self._names = [a for a, _ in self.ACTIONS]
+        self._weights = [w for _, w in self.ACTIONS]
+        self._warmup = list(self.WARMUP)
+        self._snap0 = None
+        self._last_upd = (0, 0)
+
+    def _setup(self, workdir: str):
+        # Sesiones, diario y daemon fuera de las rutas reales (antes de importar)
+        os.environ["EXO_SESSIONS_DIR"] = os.path.join(workdir, "sessions")
+        os.environ["EXO_JOURNAL_DIR"] = os.path.join(workdir, "journal")
+        os.environ["EXO_DAEMON_SOCKET"] = os.path.join(workdir, "no-daemon.sock")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if root not in sys.path:
+            sys.path.insert(0, root)
+        import main_window as mw
+        from Laptop_client.GUI.clock import ScaledClock
+        from Laptop_client.GUI.journal import EventJournal
+        from Laptop_client.GUI.routines import ControlActuadores, SimOutput
+
+        rt = mw._runtime
+        with rt._lock:
+            rt.controlador = ControlActuadores(actualizar_estado=rt.broadcast, clock=ScaledClock(self.speed),
+                                               output_cls=SimOutput, verbose=False,
+                                               journal=EventJournal())
+            rt.engine = mw.EMGEngine(seconds_window=5.0, fs=300)
+            rt.estado = f"SOAK (relés simulados, reloj x{self.speed:g})"
+        self.mw = mw
+
+    def _sample(self, t_s: float, session: _Session) -> Sample:
+        frames = np.array(self.mw._runtime.engine.frame_ms, dtype=float)
+        self.mw._runtime.engine.frame_ms.clear()
+        page = session.page
+        n, b = page.updates - self._last_upd[0], page.update_bytes - self._last_upd[1]
+        self._last_upd = (page.updates, page.update_bytes)
+        s = Sample(
+            t_s=round(t_s, 1),
+            rss_mb=round(rss_mb(), 2),
+            traced_mb=round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 2) if self.trace else 0.0,
+            threads=threading.active_count(),
+            controls=len(page.tree()),
+            mounted=page.mounted,
+            overlay=len(page.overlay),
+            log_lines=len(session.log_list.controls),
+            frame_p50_ms=round(float(np.percentile(frames, 50)), 2) if frames.size else 0.0,
+            frame_p99_ms=round(float(np.percentile(frames, 99)), 2) if frames.size else 0.0,
+            update_kb=round(b / max(1, n) / 1024.0, 2),
+            actions=self.actions,
+        )
+        self.samples.append(s)
+        if self.verbose:
+            print(f"[{s.t_s:8.0f}s] rss={s.rss_mb:7.1f}MB traza={s.traced_mb:6.1f}MB hilos={s.threads:3d} "
+                  f"controles={s.controls:5d} montados={s.mounted:5d} overlay={s.overlay:3d} "
+                  f"log={s.log_lines:4d} cuadro p50/p99={s.frame_p50_ms:.1f}/{s.frame_p99_ms:.1f}ms "
+                  f"update={s.update_kb:.1f}KB acciones={s.actions}", flush=True)
+        return s
+
+    def _act(self, session: _Session) -> _Session:
+        if self._warmup:
+            action = self._warmup.pop(0)
+        else:
+            action = self.rng.choices(self._names, self._weights)[0]
+        warming = self.actions < len(self.WARMUP)
+        if action == "users":
+            session.sheet(session.users_btn, search=not warming)
+        elif action == "patients":
+            session.sheet(session.patients_btn, search=not warming)
+        elif action == "hold":
+            time.sleep(self.mw._runtime.engine.window + 1.0)
+        elif action == "sensor":
+            session.sensor()
+        elif action == "pulse":
+            session.pulse()
+        elif action == "routine":
+            session.routine()
+        elif action == "home":
+            session.home_btn.on_click(None)
+        elif action == "paro":
+            session.paro_btn.on_click(None)
+        elif action == "reconnect":
+            session.close()
+            session = _Session(self.mw, self.rng)
+            self._last_upd = (0, 0)
+        self.actions += 1
+        return session
+
+    def run(self) -> bool:
+        with tempfile.TemporaryDirectory(prefix="exo-soak-") as workdir:
+            self._setup(workdir)
+            if self.trace:
+                tracemalloc.start(1)
+            session = _Session(self.mw, self.rng)
+            t0 = time.monotonic()
+            next_sample = t0
+            baseline: Optional[Sample] = None
+            try:
+                while True:
+                    now = time.monotonic()
+                    if baseline is None and not self._warmup and now - t0 >= self.warmup_s:
+                        # La instantánea primero: ocupa decenas de MB que no son crecimiento
+                        if self.trace:
+                            self._snap0 = tracemalloc.take_snapshot()
+                        baseline = self._sample(now - t0, session)
+                        next_sample = now + self.sample_s
+                    elif now >= next_sample:
+                        self._sample(now - t0, session)
+                        next_sample += self.sample_s
+                    if now - t0 >= self.seconds:
+                        break
+                    session = self._act(session)
+                    time.sleep(self.step_s)
+            finally:
+                session.close()
+                self.mw._runtime.engine.stop()
+            self._evaluate(baseline or self.samples[0])
+            if self.trace:
+                self._report_allocators()
+                tracemalloc.stop()
+        return not self.failures
+
+    def _evaluate(self, base: Sample):
+        tail = self.samples[-3:]
+        b = self.budget
+
+        def growth(attr):
+            # mínimo de las últimas muestras: ignora picos transitorios, no una fuga
+            return min(getattr(s, attr) for s in tail) - getattr(base, attr)
+
+        checks = [("rss_mb", b.rss_mb, "MB de RSS"), ("traced_mb", b.traced_mb, "MB trazados"),
+                  ("threads", b.threads, "hilos"), ("controls", b.controls, "controles en el árbol"),
+                  ("mounted", b.mounted, "controles montados")]
+        if not self.trace:
+            checks = [c for c in checks if c[0] != "traced_mb"]
+        for attr, limit, what in checks:
+            g = growth(attr)
+            if g > limit:
+                self.failures.append(f"{what}: +{g:g} (presupuesto {limit:g})")
+        p99 = max(s.frame_p99_ms for s in self.samples[self.samples.index(base):])
+        if self.trace:
+            # tracemalloc encarece cada asignación (y el diff de Flet asigna mucho)
+            print(f"latencia de cuadro p99 {p99:.1f} ms (con tracemalloc: sólo informativa, ver --no-trace)")
+        elif p99 > b.frame_p99_ms:
+            self.failures.append(f"latencia de cuadro p99: {p99:.1f} ms (presupuesto {b.frame_p99_ms:g} ms)")
+
+    def _report_allocators(self, top: int = 10):
+        if self._snap0 is None or not self.verbose:
+            return
+        diff = tracemalloc.take_snapshot().compare_to(self._snap0, "lineno")
+        print("\nMayor crecimiento desde el calentamiento (tracemalloc):")
+        for d in diff[:top]:
+            print(f"  {d.size_diff / 1024:+10.1f} KiB {d.count_diff:+8d} bloques  {d.traceback}")
+
+    def write_csv(self, path: str):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=[fl.name for fl in fields(Sample)])
+            w.writeheader()
+            for s in self.samples:
+                w.writerow(asdict(s))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Prueba de resistencia sin navegador de main_window.py")
+    ap.add_argument("--minutes", type=float, default=10.0)
+    ap.add_argument("--hours", type=float, default=None, help="si se da, sustituye a --minutes")
+    ap.add_argument("--step-s", type=float, default=0.5, help="pausa entre acciones")
+    ap.add_argument("--sample-s", type=float, default=10.0)
+    ap.add_argument("--warmup-s", type=float, default=None)
+    ap.add_argument("--speed", type=float, default=20.0, help="aceleración del reloj de las rutinas")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-trace", action="store_true", help="sin tracemalloc (latencias más fieles)")
+    ap.add_argument("--csv", default=None, help="serie temporal de las muestras")
+    for fl in fields(Budget):
+        ap.add_argument(f"--max-{fl.name.replace('_', '-')}", type=type(fl.default), default=fl.default)
+    a = ap.parse_args(argv)
+
+    seconds = a.hours * 3600.0 if a.hours is not None else a.minutes * 60.0
+    budget = Budget(**{fl.name: getattr(a, f"max_{fl.name}") for fl in fields(Budget)})
+    runner = SoakRunner(seconds, step_s=a.step_s, sample_s=a.sample_s, speed=a.speed, seed=a.seed,
+                        warmup_s=a.warmup_s, budget=budget, trace=not a.no_trace)
+    ok = runner.run()
+    if a.csv:
+        runner.write_csv(a.csv)
+    print(f"\n{len(runner.samples)} muestras, {runner.actions} acciones en {seconds:.0f} s: "
+          f"{'OK' if ok else 'FALLO'}")
+    for f in runner.failures:
+        print("  ✖ " + f)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,47 @@
 #!/usr/bin/env python3
+import sys
 import serial
 import time
+import numpy as np
 
-ser = serial.Serial('/dev/ttyUSB0', 115200, timeout = 1.0)
+from RaspberryPI5_server.emg_processing.calibration import ADCConverter, CalibrationProfile
+from RaspberryPI5_server.emg_processing.protocol import DEFAULT_BAUD, DEFAULT_FS, parse_line
+
+PORT = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyUSB0'   # p.ej. el pty de diagnostics/fake_device.py
+FS = DEFAULT_FS
+CHANNELS = 3
+
+ser = serial.Serial(PORT, DEFAULT_BAUD, timeout = 1.0)
 time.sleep(3)
 ser.reset_input_buffer()
 print("Serial OK")
 
+# Cuentas ADC -> mV con el perfil guardado del dispositivo (o el de fábrica)
+conv = ADCConverter(CalibrationProfile.load(PORT.rsplit('/', 1)[-1], CHANNELS), FS)
+
+# Línea a medias del último read(): se completa con el siguiente. None al
+# conectar: lo anterior al primer fin de línea puede venir cortado por delante
+partial = None
+
 try:
     while True:
         time.sleep(0.01)
         if ser.in_waiting > 0:
-            line = ser.readline().decode('utf-8').rstrip()
-            print(line)
-            
+            data = ser.read(ser.in_waiting)
+            if partial is None:
+                if b'\n' not in data:
+                    continue
+                partial, data = b'', data.split(b'\n', 1)[1]
+            lines = (partial + data).split(b'\n')
+            partial = lines.pop()
+            lines = [l.decode('utf-8', 'ignore') for l in lines]
+            rows = [r for r in (parse_line(l, CHANNELS) for l in lines) if r and len(r[0]) == CHANNELS]
+            if not rows:
+                continue
+            mv = conv.convert(np.array([r[0] for r in rows]))
+            for (_, lead_off, _), v in zip(rows, mv):
+                print(" ".join(f"{x:+.3f}mV{'(LO)' if lo else ''}" for x, lo in zip(v, lead_off)))
+
 except KeyboardInterrupt:
     print("Close Serial Communication.")
     ser.close()
\ No newline at end of file
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Agregador asyncio de varios dispositivos serie (EMG de antebrazo, sensores
+de fuerza de los dedos, ...), todos en un solo event loop.
+
+- Lecturas no bloqueantes: cada puerto se abre con O_NONBLOCK y se vigila
+  con loop.add_reader(); no hay un hilo por puerto.
+- Reconexión automática con espera exponencial, por dispositivo: si una
+  placa se desconecta las demás siguen publicando.
+- Cada dispositivo tiene su ClockSync (contador del micro -> tiempo del
+  host), así que las muestras se pueden alinear aunque las placas tengan
+  relojes y frecuencias distintos.
+- Mezcla: cada 'block_s' se interpola cada dispositivo sobre una rejilla
+  común a fs_out hasta (último instante de los dispositivos vivos -
+  latency_s). Un dispositivo sin datos para ese tramo repite su último
+  valor y marca lead-off, para que QualityMonitor lo trate como canal malo.
+- Contadores por dispositivo: muestras/s, líneas, errores de parseo y de
+  E/S, reconexiones y muestras perdidas.
+
+Uso (muestra las estadísticas cada segundo):
+    python3 -m RaspberryPI5_server.emg_processing.aggregator /dev/ttyUSB0:3 /dev/ttyACM0:2
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from RaspberryPI5_server.emg_processing.protocol import DEFAULT_BAUD, DEFAULT_FS, parse_line
+from RaspberryPI5_server.emg_processing.timing import ClockSync
+
+try:
+    import termios  # type: ignore
+    import tty      # type: ignore
+    _TERMIOS_OK = True
+except Exception:
+    _TERMIOS_OK = False
+
+
+@dataclass
+class DeviceSpec:
+    port: str
+    channels: int = 3
+    baud: int = DEFAULT_BAUD
+    fs: float = DEFAULT_FS           # frecuencia nominal del firmware
+    name: str = ""
+
+    def __post_init__(self):
+        self.name = self.name or os.path.basename(self.port)
+        if _TERMIOS_OK and not hasattr(termios, f"B{self.baud}"):
+            raise ValueError(f"{self.port}: {self.baud} baudios no es una velocidad de termios")
+
+    @classmethod
+    def parse(cls, text: str, **kw) -> "DeviceSpec":
+        """
+        '/dev/ttyUSB0' o '/dev/ttyUSB0:3' (puerto[:canales]). Sólo un sufijo
+        tras el último ':' todo de dígitos son canales: los nombres estables
+        de /dev/serial/by-path (…-usb-0:1:1.0-port0) llevan ':' propios.
+        """
+        port, _, ch = text.rpartition(":")
+        if not (port and ch.isdigit()):
+            return cls(text, **kw)
+        kw["channels"] = int(ch)
+        return cls(port, **kw)
+
+    @staticmethod
+    def has_channels(text: str) -> bool:
+        """True si 'text' lleva el sufijo ':canales'."""
+        port, _, ch = text.rpartition(":")
+        return bool(port) and ch.isdigit()
+
+
+@dataclass
+class _Device:
+    spec: DeviceSpec
+    clock: ClockSync
+    connected: bool = False
+    samples: int = 0
+    lines: int = 0
+    parse_errors: int = 0
+    io_errors: int = 0
+    reconnects: int = 0
+    rate_hz: float = 0.0
+    last_error: str = ""
+    last_rx: float = 0.0
+    _partial: bytes = b""
+    _synth_tick: int = 0
+    _framed: Optional[bool] = None           # True desde el primer contador de la conexión
+    _rate_mark: tuple = (0.0, 0)
+    _lost: Optional[asyncio.Future] = None
+    # muestras ya alineadas al reloj del host, pendientes de mezclar
+    t: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    v: Optional[np.ndarray] = None
+    lo: Optional[np.ndarray] = None
+
+    def stats(self) -> dict:
+        return {"name": self.spec.name, "port": self.spec.port, "connected": self.connected,
+                "rate_hz": round(self.rate_hz, 1), "samples": self.samples, "lines": self.lines,
+                "parse_errors": self.parse_errors, "io_errors": self.io_errors,
+                "reconnects": self.reconnects, "dropped": self.clock.dropped,
+                "rejected": self.clock.rejected,
+                "drift_ppm": round(float(self.clock.drift_ppm), 1), "last_error": self.last_error}
+
+
+class SerialAggregator:
+    def __init__(self, specs: List[DeviceSpec], fs_out: float = DEFAULT_FS,
+                 on_block: Optional[Callable[[float, np.ndarray, np.ndarray], None]] = None,
+                 block_s: float = 0.01, latency_s: float = 0.05, stale_s: float = 0.5,
+                 backoff_s: float = 0.25, backoff_max_s: float = 2.0):
+        self.devices = [_Device(s, ClockSync(s.fs)) for s in specs]
+        self.channels = sum(s.channels for s in specs)
+        self.fs_out = fs_out
+        self.on_block = on_block
+        self.block_s, self.latency_s, self.stale_s = block_s, latency_s, stale_s
+        self.backoff_s, self.backoff_max_s = backoff_s, backoff_max_s
+        self._next_t: Optional[float] = None      # instante de la próxima muestra mezclada
+        self._stopping: Optional[asyncio.Event] = None
+        self._last_v = np.zeros(self.channels)    # último valor emitido (para "hold")
+        self.blocks_out = 0
+
+    # ------------------------ ciclo de vida ---------------------------------
+    async def run(self):
+        self._stopping = asyncio.Event()
+        tasks = [asyncio.ensure_future(self._serve(d)) for d in self.devices]
+        tasks.append(asyncio.ensure_future(self._merge_loop()))
+        try:
+            await self._stopping.wait()
+        finally:
+            for d in self.devices:
+                if d._lost is not None and not d._lost.done():
+                    d._lost.set_result(None)
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def stats(self) -> List[dict]:
+        return [d.stats() for d in self.devices]
+
+    # ------------------------ E/S por dispositivo ---------------------------
+    def _open(self, spec: DeviceSpec) -> int:
+        fd = os.open(spec.port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        if _TERMIOS_OK:
+            try:
+                tty.setraw(fd)
+                attrs = termios.tcgetattr(fd)
+                speed = getattr(termios, f"B{spec.baud}")
+                attrs[4] = attrs[5] = speed
+                termios.tcsetattr(fd, termios.TCSANOW, attrs)
+                termios.tcflush(fd, termios.TCIFLUSH)
+            except termios.error:
+                pass                      # no es un tty (fifo/archivo de prueba)
+        return fd
+
+    async def _serve(self, dev: _Device):
+        loop = asyncio.get_running_loop()
+        backoff = self.backoff_s
+        first = True
+        while not self._stopping.is_set():
+            try:
+                fd = self._open(dev.spec)
+            except OSError as ex:
+                dev.io_errors += 1
+                dev.last_error = str(ex)
+                await asyncio.sleep(backoff)
+                backoff = min(2 * backoff, self.backoff_max_s)
+                continue
+            backoff = self.backoff_s
+            if not first:
+                dev.reconnects += 1
+            first = False
+            dev.connected, dev._partial, dev._framed = True, b"", None
+            dev.clock.reset()
+            dev._lost = loop.create_future()
+            loop.add_reader(fd, self._on_readable, dev, fd)
+            try:
+                await dev._lost
+            finally:
+                loop.remove_reader(fd)
+                os.close(fd)
+                dev.connected = False
+
+    def _on_readable(self, dev: _Device, fd: int):
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as ex:                     # EIO al desenchufar / cerrar el pty
+            data, dev.last_error = b"", str(ex)
+        if not data:
+            dev.io_errors += 1
+            if not dev._lost.done():
+                dev._lost.set_result(None)
+            return
+        now = time.monotonic()
+        dev.last_rx = now
+        lines = (dev._partial + data).split(b"\n")
+        dev._partial = lines.pop()
+        vals, flags, counters = [], [], []
+        for raw in lines:
+            dev.lines += 1
+            parsed = parse_line(raw.decode("ascii", "ignore"), dev.spec.channels, dev._framed)
+            if not parsed or len(parsed[0]) != dev.spec.channels:
+                dev.parse_errors += 1
+                continue
+            if parsed[2] is not None and not dev._framed:
+                dev._framed = True                # lo anterior sin contador era basura del arranque
+                vals, flags, counters = [], [], []
+            vals.append(parsed[0]); flags.append(parsed[1]); counters.append(parsed[2])
+        if vals:
+            self._ingest(dev, vals, flags, counters, now)
+
+    def _ingest(self, dev: _Device, vals, flags, counters, now: float):
+        """Bloque de un dispositivo -> ticks sin huecos -> tiempos del host."""
+        n = len(vals)
+        raw = np.hstack([np.asarray(vals, dtype=np.float64), np.asarray(flags, dtype=np.float64)])
+        if None in counters:
+            segments = [(dev._synth_tick + np.arange(n), raw, False)]
+            dev._synth_tick += n
+        else:
+            segments = dev.clock.split(np.asarray(counters), raw)
+        for ticks, seg, restart in segments:
+            if restart:
+                dev.clock.restart()
+            # Todas las líneas de un read() llegaron juntas: la última llegó 'now'
+            arrivals = now - (ticks[-1] - ticks) / dev.spec.fs
+            dev.clock.observe(ticks, arrivals)
+            ticks, seg, _ = dev.clock.fill_gaps(ticks, seg)
+            if ticks.size:
+                self._append(dev, ticks, seg)
+
+    def _append(self, dev: _Device, ticks: np.ndarray, raw: np.ndarray):
+        ch = dev.spec.channels
+        t = dev.clock.to_host(ticks)
+        lo = np.rint(raw[:, ch:]).astype(np.uint8)
+        if dev.v is None:
+            dev.t, dev.v, dev.lo = t, raw[:, :ch], lo
+        else:
+            dev.t = np.concatenate([dev.t, t])
+            dev.v = np.vstack([dev.v, raw[:, :ch]])
+            dev.lo = np.vstack([dev.lo, lo])
+        dev.samples += t.size
+
+    # ------------------------ mezcla ----------------------------------------
+    async def _merge_loop(self):
+        while True:
+            await asyncio.sleep(self.block_s)
+            self._update_rates()
+            self.merge()
+
+    def _update_rates(self):
+        now = time.monotonic()
+        for d in self.devices:
+            t0, n0 = d._rate_mark
+            if now - t0 >= 1.0:
+                d.rate_hz = (d.samples - n0) / (now - t0) if t0 else 0.0
+                d._rate_mark = (now, d.samples)
+
+    def merge(self, now: Optional[float] = None) -> int:
+        """Emite por on_block todas las muestras mezcladas disponibles. Devuelve cuántas."""
+        now = time.monotonic() if now is None else now
+        live = [d for d in self.devices
+                if d.t.size and now - d.last_rx <= self.stale_s]
+        if not live:
+            return 0
+        horizon = min(float(d.t[-1]) for d in live) - self.latency_s
+        if self._next_t is None:
+            self._next_t = max(float(d.t[0]) for d in live)
+        if horizon < self._next_t:
+            return 0
+        n = int((horizon - self._next_t) * self.fs_out) + 1
+        tg = self._next_t + np.arange(n) / self.fs_out
+        self._next_t = float(tg[-1]) + 1.0 / self.fs_out
+
+        out = np.empty((n, self.channels))
+        flags = np.ones((n, self.channels), dtype=np.uint8)
+        c = 0
+        for d in self.devices:
+            ch = d.spec.channels
+            sl = slice(c, c + ch)
+            c += ch
+            if d.v is None or d.t.size == 0:
+                out[:, sl] = self._last_v[sl]
+                continue
+            for k in range(ch):
+                out[:, sl][:, k] = np.interp(tg, d.t, d.v[:, k])
+            inside = (tg >= d.t[0]) & (tg <= d.t[-1])
+            idx = np.clip(np.searchsorted(d.t, tg, "right") - 1, 0, d.t.size - 1)
+            flags[:, sl] = np.where(inside[:, None], d.lo[idx], 1)
+            # Conserva sólo la última muestra anterior a la rejilla pendiente
+            keep = max(0, int(np.searchsorted(d.t, self._next_t, "right")) - 1)
+            d.t, d.v, d.lo = d.t[keep:], d.v[keep:], d.lo[keep:]
+        self._last_v = out[-1].copy()
+        self.blocks_out += 1
+        if self.on_block is not None:
+            self.on_block(float(tg[0]), out, flags)
+        return n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Agregador de varios puertos serie")
+    ap.add_argument("ports", nargs="+", help="puerto[:canales], p.ej. /dev/ttyUSB0:3")
+    ap.add_argument("--baud", type=int, default=DEFAULT_BAUD)
+    ap.add_argument("--fs", type=float, default=DEFAULT_FS, help="frecuencia de la mezcla")
+    a = ap.parse_args(argv)
+
+    specs = [DeviceSpec.parse(p, baud=a.baud) for p in a.ports]
+    total = [0]
+    agg = SerialAggregator(specs, fs_out=a.fs,
+                           on_block=lambda t0, x, lo: total.__setitem__(0, total[0] + len(x)))
+
+    async def report():
+        while True:
+            await asyncio.sleep(1.0)
+            print(f"mezcla: {total[0]} muestras x {agg.channels} canales")
+            for s in agg.stats():
+                print(f"  {s['name']:>10} {'OK ' if s['connected'] else '---'} "
+                      f"{s['rate_hz']:7.1f} Hz  err={s['parse_errors']}/{s['io_errors']} "
+                      f"rec={s['reconnects']} perdidas={s['dropped']}")
+
+    async def _main():
+        rep = asyncio.ensure_future(report())
+        try:
+            await agg.run()
+        finally:
+            rep.cancel()
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
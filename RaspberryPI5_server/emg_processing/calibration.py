@@ -0,0 +1,122 @@
+from __future__ import annotations
+import json
+import math
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Arduino (10 bits, 5 V) + AD8232 (ganancia total típica ~1100)
+ADC_BITS = 10
+ADC_VREF_MV = 5000.0
+AD8232_GAIN = 1100.0
+DEFAULT_MV_PER_COUNT = ADC_VREF_MV / ((1 << ADC_BITS) - 1) / AD8232_GAIN
+DEFAULT_OFFSET_COUNTS = float(1 << (ADC_BITS - 1))      # media escala
+
+CALIBRATION_DIR = os.environ.get(
+    "EXO_CALIBRATION_DIR", os.path.join(os.path.expanduser("~"), ".exo", "calibration"))
+
+
+@dataclass
+class ChannelCal:
+    mV_per_count: float = DEFAULT_MV_PER_COUNT
+    offset_counts: float = DEFAULT_OFFSET_COUNTS
+
+
+@dataclass
+class CalibrationProfile:
+    """Ganancia/offset por canal de un dispositivo concreto (persistido en JSON)."""
+    device_id: str
+    channels: List[ChannelCal] = field(default_factory=list)
+    baseline_tau_s: float = 0.5
+
+    @classmethod
+    def default(cls, device_id: str, n_channels: int) -> "CalibrationProfile":
+        return cls(device_id, [ChannelCal() for _ in range(n_channels)])
+
+    # ------------------------ persistencia ------------------------------
+    @staticmethod
+    def path_for(device_id: str, directory: str = CALIBRATION_DIR) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in device_id)
+        return os.path.join(directory, f"{safe}.json")
+
+    def save(self, directory: str = CALIBRATION_DIR) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = self.path_for(self.device_id, directory)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=2)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, device_id: str, n_channels: int,
+             directory: str = CALIBRATION_DIR) -> "CalibrationProfile":
+        """Perfil guardado del dispositivo, o el de fábrica si no existe."""
+        path = cls.path_for(device_id, directory)
+        if not os.path.exists(path):
+            return cls.default(device_id, n_channels)
+        with open(path, encoding="utf-8") as f:
+            raw: Dict = json.load(f)
+        chans = [ChannelCal(**c) for c in raw.get("channels", [])]
+        chans += [ChannelCal() for _ in range(n_channels - len(chans))]
+        return cls(raw.get("device_id", device_id), chans[:n_channels],
+                   float(raw.get("baseline_tau_s", 0.5)))
+
+    def fit_offsets(self, rest_counts: np.ndarray):
+        """Ajusta el offset con un registro en reposo [n, canales] (mediana)."""
+        med = np.median(np.asarray(rest_counts, dtype=np.float64), axis=0)
+        for ch, m in zip(self.channels, med):
+            ch.offset_counts = float(m)
+
+
+class ADCConverter:
+    """
+    Cuentas ADC -> mV (float32) con línea base (DC) por canal.
+
+    La línea base es una media exponencial (tau = baseline_tau_s) que se
+    actualiza muestra a muestra pero calculada por bloques con numpy:
+        b_i = r^i * (b_0 + a * sum_{k<=i} x_k * r^-k),   r = 1 - a
+    Los bloques se parten en trozos cortos para que r^-k no desborde.
+    """
+
+    def __init__(self, profile: CalibrationProfile, fs: float, subtract_baseline: bool = True):
+        self.profile = profile
+        self.fs = fs
+        self.subtract_baseline = subtract_baseline
+        self.gain = np.array([c.mV_per_count for c in profile.channels], dtype=np.float64)
+        self.offset = np.array([c.offset_counts for c in profile.channels], dtype=np.float64)
+        self.a = 1.0 - math.exp(-1.0 / (fs * max(profile.baseline_tau_s, 1e-6)))
+        r = 1.0 - self.a
+        self._chunk = 256 if r >= 1.0 else max(1, min(256, int(math.log(1e6) / -math.log(r))))
+        self._pow_cache: Dict[int, tuple] = {}
+        self.baseline: Optional[np.ndarray] = None     # mV, por canal
+
+    def _powers(self, n: int):
+        p = self._pow_cache.get(n)
+        if p is None:
+            k = np.arange(1, n + 1, dtype=np.float64)[:, None]
+            r = 1.0 - self.a
+            p = (r ** k, r ** -k)
+            self._pow_cache[n] = p
+        return p
+
+    def reset(self):
+        self.baseline = None
+
+    def convert(self, counts: np.ndarray) -> np.ndarray:
+        """counts: [n, canales] -> mV float32 [n, canales]."""
+        mv = (np.asarray(counts, dtype=np.float64) - self.offset) * self.gain
+        if not self.subtract_baseline or mv.shape[0] == 0:
+            return mv.astype(np.float32)
+        if self.baseline is None:
+            self.baseline = mv[0].copy()
+        out = np.empty(mv.shape, dtype=np.float32)
+        for i in range(0, mv.shape[0], self._chunk):
+            x = mv[i:i + self._chunk]
+            fwd, inv = self._powers(x.shape[0])
+            b = fwd * (self.baseline + self.a * np.cumsum(x * inv, axis=0))
+            out[i:i + x.shape[0]] = x - b
+            self.baseline = b[-1]
+        return out
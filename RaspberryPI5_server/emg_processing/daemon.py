@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Daemon de adquisición y control para la Raspberry Pi 5.
+
+Es dueño del puerto serie (AD8232) y de los GPIO (ControlActuadores):
+- Publica las muestras en un anillo de memoria compartida (ShmRing).
+- Atiende comandos JSON por un socket Unix local (ver daemon_client.py).
+- Se puede perfilar en marcha con el comando "profile" (diagnostics/profiler.py).
+
+La UI de Flet se conecta como cliente ligero, así que un bloqueo o caída
+de la UI no retrasa un paro de relés ni pierde muestras.
+
+Con varias placas, --port acepta una lista 'puerto[:canales],...'; se leen
+todas desde un solo event loop (SerialAggregator) y se mezclan alineadas.
+Una sola placa con ':canales' (p.ej. /dev/ttyUSB0:2) también va por el
+agregador, que toma de ahí el nº de canales.
+
+Uso:
+    python3 -m RaspberryPI5_server.emg_processing.daemon [--sim] [--port /dev/ttyUSB0]
+    python3 -m RaspberryPI5_server.emg_processing.daemon --port /dev/ttyUSB0:3,/dev/ttyACM0:2
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socketserver
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from Laptop_client.GUI.journal import EventJournal
+from Laptop_client.GUI.routines import ControlActuadores
+from RaspberryPI5_server.diagnostics import profiler
+from RaspberryPI5_server.emg_processing.aggregator import DeviceSpec, SerialAggregator
+from RaspberryPI5_server.emg_processing.calibration import ADCConverter, CalibrationProfile
+from RaspberryPI5_server.emg_processing.daemon_client import DEFAULT_SHM, DEFAULT_SOCKET
+from RaspberryPI5_server.emg_processing.protocol import DEFAULT_BAUD, DEFAULT_FS, DEFAULT_PORT, parse_line
+from RaspberryPI5_server.emg_processing.quality import QualityMonitor, encode_flags
+from RaspberryPI5_server.emg_processing.shm_ring import ShmRing
+from RaspberryPI5_server.emg_processing.signal_filter import EMGSimulator
+from RaspberryPI5_server.emg_processing.timing import ClockSync
+
+try:
+    import serial  # type: ignore
+    _SERIAL_OK = True
+except Exception:
+    _SERIAL_OK = False
+
+
+class AcqDaemon:
+    def __init__(self, port: str = DEFAULT_PORT, baud: int = DEFAULT_BAUD,
+                 sock_path: str = DEFAULT_SOCKET, shm_name: str = DEFAULT_SHM,
+                 fs: int = DEFAULT_FS, channels: int = 3, simulate: bool = False,
+                 block_s: float = 0.01, device_id: str | None = None):
+        self.port, self.baud = port, baud
+        # Con lista o con ':canales' (aunque sea una sola placa) lee el agregador
+        self.devices = ([DeviceSpec.parse(p, baud=baud, fs=fs) for p in port.split(",")]
+                        if "," in port or DeviceSpec.has_channels(port) else [])
+        if self.devices:
+            channels = sum(d.channels for d in self.devices)
+        self.device_id = device_id or "+".join(
+            os.path.basename(DeviceSpec.parse(p).port) for p in port.split(","))
+        self.sock_path = sock_path
+        self.fs, self.channels = fs, channels
+        self.aggregator: SerialAggregator | None = None
+        # El agregador lee los puertos directamente (no necesita pyserial)
+        self.simulate = simulate or not (_SERIAL_OK or self.devices)
+        self.block_s = block_s
+        self.ring = ShmRing.create(shm_name, channels=channels, fs=fs)
+        # Cuentas ADC -> mV con la calibración guardada del dispositivo
+        self.conv = ADCConverter(CalibrationProfile.load(self.device_id, channels), fs)
+        # Calidad por canal sobre cuentas crudas (rieles del ADC de 10 bits)
+        self.quality = QualityMonitor(fs, channels)
+        # Contador del micro -> tiempo del host (deriva + huecos)
+        self.clock = ClockSync(fs)
+        self._synth_tick = 0     # firmware antiguo sin contador
+
+        self._log: deque = deque(maxlen=500)
+        self._log_seq = 0
+        self._log_lock = threading.Lock()
+
+        self._quit = threading.Event()
+        self.stop_event = threading.Event()
+        self._busy = threading.Event()           # rutina en curso
+        self.ctrl = ControlActuadores(actualizar_estado=self._push_log, journal=EventJournal())
+        self._server: socketserver.ThreadingUnixStreamServer | None = None
+
+    # ------------------------ log -------------------------------------------
+    def _push_log(self, msg: str):
+        with self._log_lock:
+            self._log_seq += 1
+            self._log.append((self._log_seq, msg))
+
+    def _log_since(self, since: int) -> list:
+        with self._log_lock:
+            return [e for e in self._log if e[0] > since]
+
+    # ------------------------ adquisición -----------------------------------
+    def _acquire_sim(self):
+        sim = EMGSimulator(fs=self.fs, channels=self.channels)
+        n = max(1, int(self.fs * self.block_s))
+        next_t = time.monotonic()
+        lead_off = np.zeros((n, self.channels), dtype=np.uint8)
+        self.ring.set_clock(next_t, 1.0 / self.fs)
+        while not self._quit.is_set():
+            block = np.asarray(sim.next_chunk(n), dtype=np.float32).T
+            self.ring.write(block, lead_off)
+            next_t += n / self.fs
+            time.sleep(max(0.0, next_t - time.monotonic()))
+
+    def _acquire_serial(self):
+        while not self._quit.is_set():
+            try:
+                ser = serial.Serial(self.port, self.baud, timeout=0.2)
+                ser.reset_input_buffer()
+            except Exception as ex:
+                self._push_log(f"Serie no disponible ({ex}); reintento en 1 s.")
+                self._quit.wait(1.0)
+                continue
+            self._push_log(f"Serie OK: {self.port} @ {self.baud}")
+            self.conv.reset()
+            vals, flags, counters, arrivals = [], [], [], []
+            last = time.monotonic()
+            self.clock.reset()
+            framed = None            # True desde el primer contador de esta conexión
+            try:
+                while not self._quit.is_set():
+                    parsed = parse_line(ser.readline().decode("ascii", "ignore"), self.channels, framed)
+                    now = time.monotonic()
+                    if parsed and len(parsed[0]) == self.channels:
+                        if parsed[2] is not None and not framed:
+                            # Lo anterior sin contador era basura del arranque
+                            framed = True
+                            vals, flags, counters, arrivals = [], [], [], []
+                        vals.append(parsed[0]); flags.append(parsed[1])
+                        counters.append(parsed[2]); arrivals.append(now)
+                    if vals and now - last >= self.block_s:
+                        self._publish(vals, flags, counters, arrivals)
+                        vals, flags, counters, arrivals = [], [], [], []
+                        last = now
+            except Exception as ex:
+                self._push_log(f"Error serie: {ex}")
+            finally:
+                try:
+                    ser.close()
+                except Exception:
+                    pass
+
+    def _acquire_multi(self):
+        """Varias placas: un event loop para todos los puertos; la mezcla llega ya alineada."""
+        self.aggregator = SerialAggregator(self.devices, fs_out=self.fs,
+                                           on_block=self._publish_merged, block_s=self.block_s)
+        self._push_log("Agregador: " + ", ".join(f"{d.port} ({d.channels} can.)" for d in self.devices))
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            stop = loop.run_in_executor(None, self._quit.wait)   # despierta al cerrar
+            stop.add_done_callback(lambda _: self.aggregator.stop())
+            await self.aggregator.run()
+
+        asyncio.run(run())
+
+    def _publish_merged(self, t0: float, counts: np.ndarray, lead_off: np.ndarray):
+        self.quality.update(counts, lead_off)
+        t_first = t0 - self.ring.written / self.fs          # instante de la muestra 0 del anillo
+        self.ring.write(self.conv.convert(counts), encode_flags(lead_off, self.quality.state))
+        self.ring.set_clock(t_first, 1.0 / self.fs,
+                            sum(d.clock.dropped for d in self.aggregator.devices))
+
+    def _publish(self, vals, flags, counters, arrivals):
+        """Bloque serie -> tramos de ticks sin huecos -> calidad + mV -> anillo + reloj."""
+        # La llegada va como última columna para que viaje con su línea
+        raw = np.hstack([np.asarray(vals, dtype=np.float64), np.asarray(flags, dtype=np.float64),
+                         np.asarray(arrivals, dtype=np.float64)[:, None]])
+        if None in counters:
+            segments = [(self._synth_tick + np.arange(len(vals)), raw, False)]
+            self._synth_tick += len(vals)
+        else:
+            # Un reinicio del micro parte el bloque: cada tramo con su ajuste
+            segments = self.clock.split(np.asarray(counters), raw)
+        for ticks, seg, restart in segments:
+            if restart:
+                self.clock.restart()
+            self.clock.observe(ticks, seg[:, -1])
+            ticks, seg, _ = self.clock.fill_gaps(ticks, seg[:, :-1])
+            if ticks.size:
+                self._write(ticks, seg)
+
+    def _write(self, ticks: np.ndarray, raw: np.ndarray):
+        counts = raw[:, :self.channels]
+        lead_off = np.rint(raw[:, self.channels:]).astype(np.uint8)
+        self.quality.update(counts, lead_off)
+        tick0 = int(ticks[0]) - self.ring.written          # tick de la muestra 0 del anillo
+        self.ring.write(self.conv.convert(counts), encode_flags(lead_off, self.quality.state))
+        self.ring.set_clock(float(self.clock.to_host(tick0)), self.clock.period, self.clock.dropped)
+
+    # ------------------------ comandos --------------------------------------
+    def _spawn(self, fn):
+        threading.Thread(target=fn, daemon=True).start()
+
+    def _run_routine(self, name: str, cycles: int):
+        try:
+            self.ctrl.run_routine(name, cycles=cycles, stop_event=self.stop_event)
+        except Exception as ex:
+            self._push_log(f"✖ Error en {name}: {ex}")
+        finally:
+            self._busy.clear()
+
+    def handle(self, req: dict) -> dict:
+        cmd = req.get("cmd")
+        if cmd == "status":
+            return {"ok": True, "busy": self._busy.is_set(), "written": self.ring.written,
+                    "fs": self.fs, "channels": self.channels, "log_seq": self._log_seq,
+                    "simulate": self.simulate,
+                    "drift_ppm": round(self.clock.drift_ppm, 1), "dropped": self.clock.dropped,
+                    "rejected": self.clock.rejected,
+                    "quality": [round(float(q), 3) for q in self.quality.quality],
+                    "quality_state": [int(v) for v in self.quality.state],
+                    "stop_ms_max": round(max(self.ctrl.arbiter.stop_latency, default=0.0) * 1000, 3),
+                    "devices": self.aggregator.stats() if self.aggregator else []}
+        if cmd == "log":
+            return {"ok": True, "entries": self._log_since(int(req.get("since", 0)))}
+        if cmd == "stop":
+            # El evento y el corte de relés van aquí mismo, antes de responder;
+            # sólo el HOME (que tarda segundos) se lanza en otro hilo
+            self.stop_event.set()
+            dt = self.ctrl.stop_now()
+            self._spawn(lambda: self.ctrl.home_now(float(req.get("close_seconds", 3.0)), cause="paro"))
+            return {"ok": True, "stop_ms": round(dt * 1000, 3)}
+        if cmd == "stop_routine":
+            # Sólo la rutina en curso (su stop_event); pulsos y HOME siguen
+            self.stop_event.set()
+            return {"ok": True}
+        if cmd == "reposo":
+            self.ctrl.posicion_reposo()
+            return {"ok": True}
+        if cmd == "home":
+            self._spawn(lambda: self.ctrl.home_now(float(req.get("close_seconds", 3.0))))
+            return {"ok": True}
+        if cmd == "move":
+            args = (int(req["num"]), float(req.get("avance", 1.0)),
+                    float(req.get("pausa", 0.0)), float(req.get("retroceso", 0.0)))
+            sentido = req.get("sentido", "open")
+            self._spawn(lambda: self.ctrl.mover_actuador(*args, sentido_inicio=sentido))
+            return {"ok": True}
+        if cmd == "run_routine":
+            if self._busy.is_set():
+                return {"ok": False, "error": "Hay una rutina en curso."}
+            self._busy.set()
+            self.stop_event.clear()
+            name, cycles = str(req.get("name", "Rutina 1")), int(req.get("cycles", 1))
+            self._spawn(lambda: self._run_routine(name, cycles))
+            return {"ok": True}
+        if cmd == "journal_session":
+            self.ctrl.begin_journal_session(str(req["session"]))
+            return {"ok": True}
+        if cmd == "relay_events":
+            return {"ok": True, "events": self.ctrl.relay_events(float(req["t0"]), float(req["t1"]))}
+        if cmd in ("profile", "profile_status"):
+            # Por defecto espera al final de la ventana: cada conexión tiene su hilo
+            return profiler.handle_request(req, label="daemon")
+        if cmd == "shutdown":
+            threading.Timer(0.1, self.shutdown).start()   # deja salir la respuesta
+            return {"ok": True}
+        return {"ok": False, "error": f"Comando desconocido: {cmd}"}
+
+    # ------------------------ ciclo de vida ---------------------------------
+    def serve_forever(self):
+        daemon = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        resp = daemon.handle(json.loads(line))
+                    except Exception as ex:
+                        resp = {"ok": False, "error": str(ex)}
+                    self.wfile.write((json.dumps(resp) + "\n").encode())
+
+        if os.path.exists(self.sock_path):
+            os.unlink(self.sock_path)
+        self._server = socketserver.ThreadingUnixStreamServer(self.sock_path, _Handler)
+        self._server.daemon_threads = True
+
+        acq = (self._acquire_sim if self.simulate
+               else self._acquire_multi if self.devices else self._acquire_serial)
+        threading.Thread(target=acq, daemon=True).start()
+        print(f"[daemon] socket={self.sock_path} shm={self.ring.shm.name} "
+              f"fs={self.fs} ch={self.channels} {'SIM' if self.simulate else self.port}")
+        try:
+            self._server.serve_forever(poll_interval=0.2)
+        finally:
+            self._close()
+
+    def shutdown(self):
+        self._quit.set()
+        self.stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+
+    def _close(self):
+        try:
+            self.ctrl.posicion_reposo()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.sock_path):
+                os.unlink(self.sock_path)
+            self.ring.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Daemon de adquisición EMG + GPIO")
+    ap.add_argument("--port", default=DEFAULT_PORT, help="puerto, o lista 'puerto[:canales],...'")
+    ap.add_argument("--baud", type=int, default=DEFAULT_BAUD)
+    ap.add_argument("--device", default=None, help="id del perfil de calibración (por defecto: nombre del puerto)")
+    ap.add_argument("--socket", default=DEFAULT_SOCKET)
+    ap.add_argument("--shm", default=DEFAULT_SHM)
+    ap.add_argument("--fs", type=int, default=DEFAULT_FS)
+    ap.add_argument("--channels", type=int, default=3)
+    ap.add_argument("--sim", action="store_true", help="sin puerto serie: EMGSimulator")
+    a = ap.parse_args(argv)
+
+    d = AcqDaemon(port=a.port, baud=a.baud, sock_path=a.socket, shm_name=a.shm,
+                  fs=a.fs, channels=a.channels, simulate=a.sim, device_id=a.device)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=d.shutdown).start())
+    try:
+        d.serve_forever()
+    except KeyboardInterrupt:
+        d.shutdown()
+
+
+if __name__ == "__main__":
+    main()
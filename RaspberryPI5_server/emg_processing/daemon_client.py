@@ -0,0 +1,132 @@
+from __future__ import annotations
+import json
+import os
+import socket
+import threading
+import time
+from typing import Callable, Optional
+
+# Rutas compartidas entre el daemon y la UI
+DEFAULT_SOCKET = os.environ.get("EXO_DAEMON_SOCKET", "/tmp/exo_daemon.sock")
+DEFAULT_SHM = os.environ.get("EXO_DAEMON_SHM", "exo_emg")
+
+
+def daemon_available(sock_path: str = DEFAULT_SOCKET, timeout: float = 0.3) -> bool:
+    """True si hay un daemon escuchando en el socket local."""
+    if not os.path.exists(sock_path):
+        return False
+    try:
+        return bool(DaemonClient(sock_path, timeout=timeout).call("status").get("ok"))
+    except OSError:
+        return False
+
+
+def wait_for_daemon(timeout_s: float, sock_path: str = DEFAULT_SOCKET) -> bool:
+    """Espera hasta 'timeout_s' a que el daemon responda (recién lanzado puede tardar en abrir el socket)."""
+    end = time.monotonic() + timeout_s
+    while True:
+        if daemon_available(sock_path, timeout=1.0):
+            return True
+        if time.monotonic() >= end:
+            return False
+        time.sleep(0.1)
+
+
+class DaemonClient:
+    """
+    Petición/respuesta JSON (una línea cada una) sobre el socket Unix del
+    daemon. Abre una conexión por llamada: cuesta microsegundos y sobrevive
+    a reinicios del daemon sin estado extra.
+    """
+
+    def __init__(self, sock_path: str = DEFAULT_SOCKET, timeout: float = 1.0):
+        self.sock_path = sock_path
+        self.timeout = timeout
+
+    def call(self, cmd: str, **args) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(self.timeout)
+            s.connect(self.sock_path)
+            s.sendall((json.dumps({"cmd": cmd, **args}) + "\n").encode())
+            buf = b""
+            while not buf.endswith(b"\n"):
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                buf += chunk
+        return json.loads(buf or b"{}")
+
+
+class ControlRemoto:
+    """
+    Misma API que ControlActuadores, pero los relés los maneja el daemon.
+    Los mensajes del daemon se reenvían a 'actualizar_estado'.
+    """
+
+    def __init__(self, actualizar_estado: Optional[Callable[[str], None]] = None,
+                 sock_path: str = DEFAULT_SOCKET, poll_s: float = 0.1):
+        self.actualizar_estado = actualizar_estado
+        self.client = DaemonClient(sock_path)
+        self.poll_s = poll_s
+        self._log_seq = int(self.client.call("status").get("log_seq", 0))
+        threading.Thread(target=self._poll_log, daemon=True).start()
+
+    # ------------------------ log remoto --------------------------------
+    def _poll_log(self):
+        while True:
+            try:
+                r = self.client.call("log", since=self._log_seq)
+                for seq, msg in r.get("entries", []):
+                    self._log_seq = seq
+                    if self.actualizar_estado:
+                        try:
+                            self.actualizar_estado(msg)
+                        except Exception:
+                            pass
+            except OSError:
+                pass  # daemon reiniciándose
+            time.sleep(self.poll_s)
+
+    def _call(self, cmd: str, **args) -> dict:
+        r = self.client.call(cmd, **args)
+        if not r.get("ok"):
+            raise RuntimeError(r.get("error", f"daemon: fallo en {cmd}"))
+        return r
+
+    def _wait_idle(self, stop_event=None):
+        while self.client.call("status").get("busy"):
+            if stop_event is not None and stop_event.is_set():
+                return
+            time.sleep(self.poll_s)
+
+    # ------------------------ API de ControlActuadores -------------------
+    def posicion_reposo(self):
+        self._call("reposo")
+
+    def home_now(self, close_seconds: float = 3.0):
+        self._call("home", close_seconds=float(close_seconds))
+
+    def stop_and_home(self, stop_event=None, close_seconds: float = 3.0):
+        if stop_event:
+            stop_event.set()
+        self._call("stop", close_seconds=float(close_seconds))
+
+    def mover_actuador(self, actuador_num: int, tiempo_avance: float,
+                       tiempo_pause: float, tiempo_retroceso: float,
+                       sentido_inicio: str = "open", stop_event=None):
+        self._call("move", num=int(actuador_num), avance=float(tiempo_avance),
+                   pausa=float(tiempo_pause), retroceso=float(tiempo_retroceso),
+                   sentido=sentido_inicio)
+
+    def begin_journal_session(self, session: str):
+        self._call("journal_session", session=session)
+
+    def relay_events(self, t0: float, t1: float) -> list:
+        return self.client.call("relay_events", t0=t0, t1=t1).get("events", [])
+
+    def run_routine(self, name: str, cycles: int = 1, stop_event=None):
+        self._call("run_routine", name=name, cycles=int(cycles))
+        self._wait_idle(stop_event)
+        # Como en ControlActuadores, stop_event para la rutina (no los relés de otros)
+        if stop_event is not None and stop_event.is_set():
+            self._call("stop_routine")
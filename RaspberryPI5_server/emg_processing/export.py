@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Exportación de sesiones grabadas (recording.py) a EDF+, CSV y Parquet.
+
+- Todo se lee por bloques del memmap de la sesión, así que la memoria no
+  depende de la duración de la sesión.
+- EDF+ (EDF+C): una señal por canal (int16, rango físico medido en una
+  primera pasada) + la señal "EDF Annotations" con los eventos de relés
+  del diario (journal.py), el paso de rutina/ciclo y los disparos.
+- CSV: t_s + un campo por canal (mV).
+- Parquet: requiere pyarrow; un row group por bloque.
+- Sesiones sólo de disparos (sin emg.f32): se exportan los segmentos.
+  En EDF+ como EDF+D (registros discontinuos, cada uno con su inicio en
+  la TAL de tiempo) y en CSV/Parquet como un bloque de filas por
+  segmento, con t_s respecto al inicio de la sesión. Los segmentos que se
+  pisan se unen sin repetir muestras.
+- Exportar todo el historial de un paciente reparte las sesiones entre
+  procesos (una sesión por tarea).
+
+Nombres de canal, fs e inicio salen del meta.json de la sesión.
+
+Uso:
+    python3 -m RaspberryPI5_server.emg_processing.export P001 --formats edf,csv --out ./export
+    python3 -m RaspberryPI5_server.emg_processing.export ~/.exo/sessions/P001/20250101-101010 --formats edf
+"""
+from __future__ import annotations
+import argparse
+import math
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from RaspberryPI5_server.emg_processing.recording import SESSIONS_DIR, SessionReader, list_sessions
+
+try:
+    import pyarrow as pa            # type: ignore
+    import pyarrow.parquet as pq    # type: ignore
+    _ARROW_OK = True
+except Exception:
+    _ARROW_OK = False
+
+FORMATS = ("edf", "csv", "parquet")
+BLOCK_SAMPLES = 1 << 16
+
+
+# ---------------------- Anotaciones ------------------------------------------
+def session_annotations(reader: SessionReader, journal_root: Optional[str] = None) -> List[Tuple[float, str]]:
+    """(onset_s respecto a la muestra 0, texto) ordenadas: relés, rutina/ciclo y disparos."""
+    start = float(reader.meta.get("start_time", 0.0))
+    out: List[Tuple[float, str]] = []
+    try:
+        from Laptop_client.GUI.journal import JOURNAL_DIR, JournalReader
+        sessions_root = os.path.dirname(os.path.dirname(os.path.abspath(reader.path)))
+        jr = JournalReader(os.path.relpath(os.path.abspath(reader.path), sessions_root),
+                           journal_root or JOURNAL_DIR)
+        last_step = None
+        for e in jr.decode(jr.range(start, None)):
+            step = (e["routine"], e["cycle"])
+            if e["routine"] and step != last_step:
+                out.append((e["t"] - start, f"{e['routine']} ciclo {e['cycle']}"))
+            last_step = step
+            lado = "A" if e["A"] else "B" if e["B"] else "OFF"
+            out.append((e["t"] - start, f"act{e['actuator']} {lado} ({e['cause']})"))
+    except (OSError, ValueError):
+        pass                           # sesión sin diario de relés
+    for seg in reader.segments():
+        out.append((seg["sample"] / reader.fs, f"disparo C{seg['channel'] + 1}"))
+    return sorted(out)
+
+
+# ---------------------- Tramos de señal --------------------------------------
+def _segment_spans(reader: SessionReader, join: int = 1) -> List[Tuple[int, np.ndarray]]:
+    """
+    (primera muestra, datos [n, canales]) de los segmentos de disparo, en
+    orden. Un segmento que empieza antes de que acabe el tramo anterior
+    redondeado a 'join' muestras se une a él: sin solapes y, con 'join' =
+    muestras por registro EDF, sin registros que se pisen (el hueco se
+    rellena con la última muestra).
+    """
+    spans: List[Tuple[int, np.ndarray]] = []
+    for seg in sorted(reader.segments(), key=lambda e: e["sample"] - e["pre"]):
+        s0, data = seg["sample"] - seg["pre"], np.asarray(seg["data"], dtype=np.float32)
+        if s0 < 0:
+            s0, data = 0, data[-s0:]
+        if spans:
+            p0, prev = spans[-1]
+            p1 = p0 + prev.shape[0]
+            if s0 < p0 + math.ceil(prev.shape[0] / join) * join:
+                fill = np.repeat(prev[-1:], max(0, s0 - p1), axis=0)
+                spans[-1] = (p0, np.vstack([prev, fill, data[max(0, p1 - s0):]]))
+                continue
+        if data.shape[0]:
+            spans.append((s0, data))
+    return spans
+
+
+def _spans(reader: SessionReader, join: int = 1) -> List[Tuple[int, np.ndarray]]:
+    """La señal continua como un solo tramo o, si la sesión es sólo de disparos, sus segmentos."""
+    return [(0, reader.emg)] if reader.samples else _segment_spans(reader, join)
+
+
+def _span_blocks(spans: Sequence[Tuple[int, np.ndarray]], n: int = BLOCK_SAMPLES):
+    """(primera muestra, bloque) de hasta 'n' muestras, tramo a tramo."""
+    for s0, x in spans:
+        for i in range(0, x.shape[0], n):
+            yield s0 + i, np.asarray(x[i:i + n])
+
+
+# ---------------------- EDF+ -------------------------------------------------
+def _field(value, width: int) -> bytes:
+    txt = str(value)
+    if isinstance(value, float):
+        for p in range(width, 0, -1):          # la mayor precisión que quepa en el campo
+            txt = f"{value:.{p}g}"
+            if len(txt) <= width:
+                break
+    return txt.encode("ascii", "replace")[:width].ljust(width)
+
+
+def _tal(onset: float, text: str = "") -> bytes:
+    return f"{onset:+.4f}".rstrip("0").rstrip(".").encode() + b"\x14" + text.encode("latin-1", "replace") + b"\x14\x00"
+
+
+def _record_layout(fs: float) -> Tuple[int, float]:
+    """(muestras por registro, duración del registro s) con muestras enteras."""
+    fr = Fraction(fs).limit_denominator(1000)
+    dur = fr.denominator
+    while fr.numerator * dur / fr.denominator > 30000:      # registros < 61 kB por señal
+        dur /= 2
+    return max(1, int(round(fs * dur))), float(dur)
+
+
+def export_edf(reader: SessionReader, path: str, annotations: Sequence[Tuple[float, str]] = ()):
+    ch, fs = reader.channels, reader.fs
+    spr, dur = _record_layout(fs)
+    continuous = reader.samples > 0
+    spans = _spans(reader, join=spr) or [(0, reader.emg)]
+    # Inicio (s) de cada registro; en EDF+D los tramos dejan huecos entre registros
+    onsets = np.array([(s0 + k * spr) / fs for s0, x in spans
+                       for k in range(max(1, math.ceil(x.shape[0] / spr)))])
+    n_rec = len(onsets)
+
+    # 1ª pasada (por bloques): rango físico de cada canal
+    lo = np.full(ch, np.inf); hi = np.full(ch, -np.inf)
+    for _, blk in _span_blocks(spans):
+        lo = np.minimum(lo, blk.min(axis=0)); hi = np.maximum(hi, blk.max(axis=0))
+    lo = np.where(np.isfinite(lo), lo, -1.0); hi = np.where(np.isfinite(hi), hi, 1.0)
+    # Se usan los valores tal como quedan escritos en la cabecera (8 caracteres)
+    lo = np.array([float(_field(float(v), 8)) for v in lo])
+    hi = np.array([float(_field(float(v), 8)) for v in np.maximum(hi, lo + 1e-3)])
+    span = hi - lo
+    dmin, dmax = -32768, 32767
+    scale = (dmax - dmin) / span
+
+    # Anotaciones por registro; la señal de anotaciones tiene tamaño fijo
+    per_rec: Dict[int, List[bytes]] = {}
+    for onset, text in annotations:
+        r = min(n_rec - 1, max(0, int(np.searchsorted(onsets, onset + 1e-9, "right")) - 1))
+        per_rec.setdefault(r, []).append(_tal(onset, text))
+    t_end = float(onsets[-1]) + dur
+    ann_bytes = max([len(_tal(t_end)) + sum(len(t) for t in v) for v in per_rec.values()]
+                    + [len(_tal(t_end))])
+    ann_spr = (ann_bytes + 1) // 2
+
+    names = reader.meta.get("channel_names") or [f"EMG{i+1}" for i in range(ch)]
+    start = time.localtime(float(reader.meta.get("start_time", time.time())))
+    ns = ch + 1
+    hdr = b"".join([
+        _field("0", 8),
+        _field(f"{reader.meta.get('patient_id') or 'X'} X X X", 80),
+        _field(f"Startdate {time.strftime('%d-%b-%Y', start).upper()} X "
+               f"{reader.meta.get('user_id') or 'X'} ExoRehability", 80),
+        _field(time.strftime("%d.%m.%y", start), 8), _field(time.strftime("%H.%M.%S", start), 8),
+        _field(256 * (ns + 1), 8), _field("EDF+C" if continuous else "EDF+D", 44), _field(n_rec, 8), _field(float(dur), 8),
+        _field(ns, 4),
+        b"".join(_field(n, 16) for n in names) + _field("EDF Annotations", 16),
+        b"".join(_field("AgAgCl electrodes AD8232", 80) for _ in range(ch)) + _field("", 80),
+        b"".join(_field("mV", 8) for _ in range(ch)) + _field("", 8),
+        b"".join(_field(float(v), 8) for v in lo) + _field(-1, 8),
+        b"".join(_field(float(v), 8) for v in hi) + _field(1, 8),
+        b"".join(_field(dmin, 8) for _ in range(ch)) + _field(dmin, 8),
+        b"".join(_field(dmax, 8) for _ in range(ch)) + _field(dmax, 8),
+        b"".join(_field(reader.meta.get("prefilter", ""), 80) for _ in range(ch)) + _field("", 80),
+        b"".join(_field(spr, 8) for _ in range(ch)) + _field(ann_spr, 8),
+        b"".join(_field("", 32) for _ in range(ns)),
+    ])
+    assert len(hdr) == 256 * (ns + 1)
+
+    recs_per_blk = max(1, BLOCK_SAMPLES // spr)
+    with open(path, "wb") as f:
+        f.write(hdr)
+        rec = 0                                              # índice global de registro
+        for _, src in spans:
+            span_recs = max(1, math.ceil(src.shape[0] / spr))
+            for r0 in range(0, span_recs, recs_per_blk):
+                r1 = min(span_recs, r0 + recs_per_blk)
+                x = np.asarray(src[r0 * spr:r1 * spr], dtype=np.float64)
+                if x.shape[0] < (r1 - r0) * spr:             # último registro incompleto
+                    x = np.vstack([x, np.repeat(x[-1:] if len(x) else np.zeros((1, ch)),
+                                                (r1 - r0) * spr - x.shape[0], axis=0)])
+                dig = np.clip(np.rint((x - lo) * scale + dmin), dmin, dmax).astype("<i2")
+                # [registros, muestras, canales] -> [registros, canales, muestras]
+                dig = dig.reshape(r1 - r0, spr, ch).transpose(0, 2, 1)
+                out = bytearray()
+                for k in range(r1 - r0):
+                    out += dig[k].tobytes()
+                    ann = _tal(float(onsets[rec])) + b"".join(per_rec.get(rec, []))
+                    out += ann.ljust(2 * ann_spr, b"\x00")
+                    rec += 1
+                f.write(out)
+
+
+# ---------------------- CSV / Parquet ----------------------------------------
+def export_csv(reader: SessionReader, path: str):
+    names = reader.meta.get("channel_names") or [f"EMG{i+1}" for i in range(reader.channels)]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(["t_s"] + names) + "\n")
+        for i, blk in _span_blocks(_spans(reader)):
+            t = (i + np.arange(blk.shape[0])) / reader.fs
+            np.savetxt(f, np.column_stack([t, blk]), delimiter=",",
+                       fmt=["%.6f"] + ["%.5f"] * reader.channels)
+
+
+def export_parquet(reader: SessionReader, path: str):
+    if not _ARROW_OK:
+        raise RuntimeError("Parquet requiere pyarrow (pip install pyarrow)")
+    names = reader.meta.get("channel_names") or [f"EMG{i+1}" for i in range(reader.channels)]
+    schema = pa.schema([("t_s", pa.float64())] + [(n, pa.float32()) for n in names],
+                       metadata={"fs": str(reader.fs), "patient_id": str(reader.meta.get("patient_id", ""))})
+    with pq.ParquetWriter(path, schema) as w:
+        for i, blk in _span_blocks(_spans(reader)):
+            t = (i + np.arange(blk.shape[0])) / reader.fs
+            w.write_table(pa.Table.from_arrays([pa.array(t)] + [pa.array(blk[:, c]) for c in range(reader.channels)],
+                                               schema=schema))
+
+
+# ---------------------- Sesión / lote ----------------------------------------
+def export_session(session_path: str, out_dir: str, formats: Sequence[str] = ("edf",),
+                   journal_root: Optional[str] = None) -> List[str]:
+    reader = SessionReader(session_path)
+    if reader.samples == 0 and not reader.segments():
+        return []                       # sin señal continua ni segmentos de disparo
+    stem = os.path.join(out_dir, "_".join(os.path.normpath(session_path).split(os.sep)[-2:]))
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for fmt in formats:
+        if fmt == "edf":
+            export_edf(reader, stem + ".edf", session_annotations(reader, journal_root))
+        elif fmt == "csv":
+            export_csv(reader, stem + ".csv")
+        elif fmt == "parquet":
+            export_parquet(reader, stem + ".parquet")
+        else:
+            raise ValueError(f"formato desconocido: {fmt}")
+        written.append(f"{stem}.{fmt}")
+    return written
+
+
+def export_many(session_paths: Sequence[str], out_dir: str, formats: Sequence[str] = ("edf",),
+                workers: Optional[int] = None, journal_root: Optional[str] = None) -> List[str]:
+    """Exporta varias sesiones en paralelo (una por proceso)."""
+    workers = workers or min(len(session_paths), os.cpu_count() or 1)
+    if workers <= 1 or len(session_paths) <= 1:
+        return [p for s in session_paths for p in export_session(s, out_dir, formats, journal_root)]
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as ex:
+        futs = [ex.submit(export_session, s, out_dir, formats, journal_root) for s in session_paths]
+        return [p for f in futs for p in f.result()]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Exporta sesiones a EDF+/CSV/Parquet")
+    ap.add_argument("target", help="id de paciente o carpeta de sesión")
+    ap.add_argument("--formats", default="edf", help=f"lista separada por comas de {FORMATS}")
+    ap.add_argument("--out", default="export")
+    ap.add_argument("--root", default=SESSIONS_DIR)
+    ap.add_argument("--workers", type=int, default=None)
+    a = ap.parse_args(argv)
+
+    paths = [a.target] if os.path.isdir(a.target) else list_sessions(a.target, a.root)
+    if not paths:
+        ap.error(f"sin sesiones para {a.target}")
+    t = time.perf_counter()
+    files = export_many(paths, a.out, [f.strip() for f in a.formats.split(",") if f.strip()], a.workers)
+    for p in files:
+        print(p)
+    print(f"{len(paths)} sesión(es) -> {len(files)} archivo(s) en {time.perf_counter() - t:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
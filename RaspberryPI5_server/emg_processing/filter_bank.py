@@ -0,0 +1,177 @@
+from __future__ import annotations
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+# scipy es opcional: si no está usamos la versión en Python (más lenta)
+try:
+    from scipy.signal import sosfilt as _sosfilt  # type: ignore
+    _SCIPY_OK = True
+except Exception:
+    _SCIPY_OK = False
+
+# Orden de las filas de features()
+FEATURES = ("rms", "mav", "wl", "zc")
+
+
+# ---------------------- Diseño de biquads (RBJ cookbook) ---------------------
+def _biquad(kind: str, f0: float, fs: float, q: float = 1 / math.sqrt(2)) -> np.ndarray:
+    w0 = 2 * math.pi * f0 / fs
+    cw, alpha = math.cos(w0), math.sin(w0) / (2 * q)
+    if kind == "hp":
+        b = [(1 + cw) / 2, -(1 + cw), (1 + cw) / 2]
+    elif kind == "lp":
+        b = [(1 - cw) / 2, 1 - cw, (1 - cw) / 2]
+    elif kind == "notch":
+        b = [1.0, -2 * cw, 1.0]
+    else:
+        raise ValueError(f"Tipo de biquad desconocido: {kind}")
+    a = [1 + alpha, -2 * cw, 1 - alpha]
+    return np.array([b[0] / a[0], b[1] / a[0], b[2] / a[0], 1.0, a[1] / a[0], a[2] / a[0]])
+
+
+def design_sos(fs: float, hp: Optional[float] = 20.0, lp: Optional[float] = 450.0,
+               notch: Optional[float] = 50.0, notch_q: float = 30.0) -> np.ndarray:
+    """Secciones de segundo orden (formato scipy 'sos') para EMG de superficie."""
+    secs = []
+    if hp:
+        secs.append(_biquad("hp", hp, fs))
+    if lp and lp < 0.5 * fs:
+        secs.append(_biquad("lp", lp, fs))
+    if notch and notch < 0.5 * fs:
+        secs.append(_biquad("notch", notch, fs, q=notch_q))
+    return np.array(secs, dtype=np.float64).reshape(-1, 6)
+
+
+_SS_BLOCK = 64                    # muestras por bloque en _sosfilt_py
+_ss_cache: dict = {}
+
+
+def _ss_matrices(sec: np.ndarray, L: int):
+    """
+    Una sección en forma de estados (forma directa II transpuesta):
+    z' = A z + B x, y = z[0] + b0 x. Para un bloque de L muestras devuelve
+    H [L, L] (respuesta con estado cero), O [L, 2] (respuesta al estado
+    inicial), G [2, L] (estado final por la entrada) y A^L.
+    """
+    key = (sec.tobytes(), L)
+    m = _ss_cache.get(key)
+    if m is None:
+        b0, b1, b2, _, a1, a2 = sec
+        A = np.array([[-a1, 1.0], [-a2, 0.0]])
+        B = np.array([b1 - a1 * b0, b2 - a2 * b0])
+        P = np.empty((L + 1, 2, 2))              # A^k
+        P[0] = np.eye(2)
+        for k in range(L):
+            P[k + 1] = A @ P[k]
+        h = np.empty(L)                          # respuesta al impulso
+        h[0] = b0
+        h[1:] = (P[:L - 1] @ B)[:, 0]
+        idx = np.arange(L)
+        d = idx[:, None] - idx[None, :]
+        H = np.where(d >= 0, h[np.clip(d, 0, None)], 0.0)
+        O = P[:L, 0, :]
+        G = (P[L - 1::-1] @ B).T if L else np.zeros((2, 0))
+        m = _ss_cache[key] = (H, O, G, P[L])
+    return m
+
+
+def _sosfilt_py(sos: np.ndarray, x: np.ndarray, zi: np.ndarray) -> np.ndarray:
+    """
+    Sin scipy. Cada sección se aplica por bloques de _SS_BLOCK muestras con
+    productos de matrices (forma de estados): el bucle en Python es sobre
+    bloques, no sobre muestras. Actualiza zi. Igual a sosfilt salvo
+    redondeo de float64.
+    """
+    y = np.array(x, dtype=np.float64)
+    n = y.shape[0]
+    for s in range(sos.shape[0]):
+        z = zi[s].copy()                         # [2, canales]
+        i = 0
+        while i < n:
+            L = min(_SS_BLOCK, n - i)
+            m = (n - i) // L
+            H, O, G, AL = _ss_matrices(sos[s], L)
+            xb = y[i:i + m * L].reshape(m, L, -1)
+            zin = G @ xb
+            zs = np.empty((m,) + z.shape)
+            for k in range(m):                   # estado al inicio de cada bloque
+                zs[k] = z
+                z = AL @ z + zin[k]
+            y[i:i + m * L] = (H @ xb + O @ zs).reshape(m * L, -1)
+            i += m * L
+        zi[s] = z
+    return y
+
+
+# ---------------------- Banco de filtros en streaming -----------------------
+class FilterBank:
+    """
+    Filtro paso-banda + notch por canal con estado entre bloques, y
+    features por bloque (RMS, MAV, longitud de onda, cruces por cero).
+
+    Entrada/salida: bloques [n, canales]. Procesar un flujo en bloques da
+    el mismo resultado que procesarlo de una vez (sin scipy, salvo
+    redondeo de float64).
+    """
+
+    def __init__(self, fs: float, channels: int, hp: Optional[float] = 20.0,
+                 lp: Optional[float] = 450.0, notch: Optional[float] = 50.0):
+        self.fs, self.channels = fs, channels
+        self.sos = design_sos(fs, hp=hp, lp=lp, notch=notch)
+        self.zi = np.zeros((self.sos.shape[0], 2, channels))
+        self._last = np.zeros(channels)     # última muestra filtrada (WL/ZC entre bloques)
+
+    def reset(self):
+        self.zi[:] = 0.0
+        self._last[:] = 0.0
+
+    def filter(self, x: np.ndarray) -> np.ndarray:
+        if x.shape[0] == 0 or self.sos.shape[0] == 0:
+            return np.asarray(x, dtype=np.float32)
+        if _SCIPY_OK:
+            y, self.zi = _sosfilt(self.sos, x, axis=0, zi=self.zi)
+        else:
+            y = _sosfilt_py(self.sos, x, self.zi)
+        return y.astype(np.float32)
+
+    def features(self, y: np.ndarray) -> np.ndarray:
+        """[len(FEATURES), canales] para el bloque ya filtrado."""
+        if y.shape[0] == 0:
+            return np.zeros((len(FEATURES), self.channels), dtype=np.float32)
+        prev = np.vstack([self._last[None, :], y])
+        d = np.diff(prev, axis=0)
+        out = np.empty((len(FEATURES), y.shape[1]), dtype=np.float32)
+        out[0] = np.sqrt(np.mean(np.square(y, dtype=np.float64), axis=0))
+        out[1] = np.mean(np.abs(y), axis=0)
+        out[2] = np.sum(np.abs(d), axis=0)
+        out[3] = np.count_nonzero(np.signbit(prev[1:]) != np.signbit(prev[:-1]), axis=0)
+        self._last = y[-1].astype(np.float64)
+        return out
+
+    def features_blocks(self, y: np.ndarray, n: int) -> np.ndarray:
+        """
+        features() de cada bloque consecutivo de 'n' muestras de 'y' (ya
+        filtrado, longitud múltiplo de n) en una sola pasada:
+        [bloques, len(FEATURES), canales]. Para reprocesar sesiones grabadas.
+        """
+        m = y.shape[0] // n
+        if m == 0:
+            return np.zeros((0, len(FEATURES), self.channels), dtype=np.float32)
+        y = y[:m * n]
+        prev = np.vstack([self._last[None, :], y])
+        yb = y.reshape(m, n, -1)
+        out = np.empty((m, len(FEATURES), y.shape[1]), dtype=np.float32)
+        out[:, 0] = np.sqrt(np.mean(np.square(yb, dtype=np.float64), axis=1))
+        out[:, 1] = np.mean(np.abs(yb), axis=1)
+        out[:, 2] = np.sum(np.abs(np.diff(prev, axis=0)).reshape(m, n, -1), axis=1)
+        sb = np.signbit(prev)
+        out[:, 3] = np.count_nonzero((sb[1:] != sb[:-1]).reshape(m, n, -1), axis=1)
+        self._last = y[-1].astype(np.float64)
+        return out
+
+    def process(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Filtra y calcula features."""
+        y = self.filter(x)
+        return y, self.features(y)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Clasificador de intención (LDA, sólo numpy) sobre features EMG por bloque.
+
+- Entrenamiento incremental: guarda estadísticos suficientes (n, suma y
+  dispersión por clase); partial_fit() sólo los acumula y la proyección
+  (W, b) se recalcula una vez, en la siguiente predicción.
+- Inferencia por lotes: predict(X) = argmax(X @ W + b) con W/b en caché.
+- Calibración rápida: fit_segments() con una sesión grabada corta y los
+  tramos (t0, t1, gesto) que pidió el terapeuta.
+- IntentController(clf, ctrl.intent_command) lleva cada gesto estable al
+  ActuatorArbiter con su propia causa, "intencion": cede ante PARO, HOME
+  y los clics manuales y le quita el turno a una rutina.
+
+Benchmark con datos sintéticos de EMGSimulator:
+    python3 -m RaspberryPI5_server.emg_processing.intent --bench
+"""
+from __future__ import annotations
+import argparse
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from RaspberryPI5_server.emg_processing.filter_bank import FilterBank
+
+# Gesto -> (actuadores, sentido) para ControlActuadores; None = no mover
+GESTURE_COMMANDS: Dict[str, Optional[Tuple[Tuple[int, ...], str]]] = {
+    "reposo": None,
+    "abrir": ((1, 2, 3, 4, 5), "open"),
+    "cerrar": ((1, 2, 3, 4, 5), "close"),
+    "pinza": ((1, 2), "close"),
+    "indice": ((2,), "close"),
+}
+
+
+def feature_vector(feats: np.ndarray) -> np.ndarray:
+    """[F, canales] de FilterBank.features -> vector 1D (log para RMS/MAV/WL)."""
+    f = np.array(feats, dtype=np.float64)
+    f[:3] = np.log(f[:3] + 1e-6)
+    return f.ravel()
+
+
+class IntentClassifier:
+    def __init__(self, classes: Sequence[str], shrinkage: float = 0.05):
+        self.classes = list(classes)
+        self.shrinkage = shrinkage
+        self._idx = {c: i for i, c in enumerate(self.classes)}
+        self.dim: Optional[int] = None
+        self._W: Optional[np.ndarray] = None
+        self._b: Optional[np.ndarray] = None
+
+    def _init_stats(self, d: int):
+        k = len(self.classes)
+        self.dim = d
+        self.n = np.zeros(k)
+        self.s = np.zeros((k, d))
+        self.ss = np.zeros((k, d, d))
+
+    # ------------------------ entrenamiento ---------------------------------
+    def partial_fit(self, X: np.ndarray, y: Iterable[str]):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        yi = np.array([self._idx[c] for c in y])
+        if self.dim is None:
+            self._init_stats(X.shape[1])
+        for k in np.unique(yi):
+            Xk = X[yi == k]
+            self.n[k] += Xk.shape[0]
+            self.s[k] += Xk.sum(axis=0)
+            self.ss[k] += Xk.T @ Xk
+        self._W = None          # invalidar caché
+        return self
+
+    def fit(self, X: np.ndarray, y: Iterable[str]):
+        self.dim = None
+        return self.partial_fit(X, y)
+
+    def _solve(self):
+        seen = self.n > 0
+        mu = np.zeros_like(self.s)
+        mu[seen] = self.s[seen] / self.n[seen, None]
+        # Covarianza común (pooled) con shrinkage hacia la diagonal
+        scatter = sum(self.ss[k] - self.n[k] * np.outer(mu[k], mu[k]) for k in np.flatnonzero(seen))
+        dof = max(1.0, self.n.sum() - seen.sum())
+        cov = scatter / dof
+        cov = (1 - self.shrinkage) * cov + self.shrinkage * np.diag(np.diag(cov) + 1e-9)
+        inv_mu = np.linalg.solve(cov, mu.T)                 # [d, k]
+        prior = np.log(np.where(seen, self.n / max(1.0, self.n.sum()), 1e-12))
+        self._W = inv_mu
+        self._b = -0.5 * np.einsum("kd,dk->k", mu, inv_mu) + prior
+        self._b[~seen] = -np.inf
+
+    # ------------------------ inferencia ------------------------------------
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        if self._W is None:
+            if self.dim is None:
+                raise RuntimeError("Clasificador sin entrenar")
+            self._solve()
+        return np.atleast_2d(X) @ self._W + self._b
+
+    def predict_idx(self, X: np.ndarray) -> np.ndarray:
+        return np.argmax(self.decision_function(X), axis=1)
+
+    def predict(self, X: np.ndarray) -> List[str]:
+        return [self.classes[i] for i in self.predict_idx(X)]
+
+    # ------------------------ calibración con sesión grabada ----------------
+    def fit_segments(self, reader, segments: Sequence[Tuple[float, float, str]],
+                     block_s: float = 0.05, incremental: bool = False, **filter_kw):
+        """
+        reader: SessionReader; segments: [(t0_s, t1_s, gesto), ...].
+        Las features se calculan con el mismo FilterBank que en vivo.
+        """
+        X, y = [], []
+        n = max(1, int(reader.fs * block_s))
+        for t0, t1, label in segments:
+            bank = FilterBank(reader.fs, reader.channels, **filter_kw)
+            first = True
+            for blk in reader.blocks(n, start=int(t0 * reader.fs), stop=int(t1 * reader.fs)):
+                _, feats = bank.process(blk)
+                if first:           # transitorio del filtro
+                    first = False
+                    continue
+                X.append(feature_vector(feats)); y.append(label)
+        if X:
+            (self.partial_fit if incremental else self.fit)(np.array(X), y)
+        return self
+
+
+class IntentController:
+    """
+    Suaviza las decisiones (mayoría en las últimas 'votes') y sólo llama a
+    on_command cuando el gesto estable cambia, para no hacer castañetear
+    los relés.
+    """
+
+    def __init__(self, clf: IntentClassifier,
+                 on_command: Callable[[str, Optional[Tuple[Tuple[int, ...], str]]], None],
+                 votes: int = 5):
+        self.clf = clf
+        self.on_command = on_command
+        self._hist: deque = deque(maxlen=votes)
+        self.current: Optional[str] = None
+
+    def step(self, feats: np.ndarray) -> Optional[str]:
+        label = self.clf.predict(feature_vector(feats)[None, :])[0]
+        self._hist.append(label)
+        top, cnt = Counter(self._hist).most_common(1)[0]
+        if cnt > len(self._hist) // 2 and top != self.current:
+            self.current = top
+            self.on_command(top, GESTURE_COMMANDS.get(top))
+        return self.current
+
+
+# ---------------------- Benchmark --------------------------------------------
+def _synthetic(classes: Sequence[str], channels: int, fs: int, seconds_per_class: float,
+               block: int, seed: int = 0):
+    """Bloques de features por gesto: EMGSimulator con patrón de ganancias por canal."""
+    from RaspberryPI5_server.emg_processing.signal_filter import EMGSimulator
+    rng = np.random.default_rng(seed)
+    patterns = {c: 0.2 + 1.8 * rng.random(channels) for c in classes}
+    patterns[classes[0]] = np.full(channels, 0.1)        # reposo: casi sin actividad
+    X, y = [], []
+    for c in classes:
+        sim = EMGSimulator(fs=fs, channels=channels, seed=int(rng.integers(1 << 30)))
+        bank = FilterBank(fs, channels)
+        for _ in range(int(seconds_per_class * fs / block)):
+            raw = np.asarray(sim.next_chunk(block), dtype=np.float64).T * patterns[c]
+            _, feats = bank.process(raw)
+            X.append(feature_vector(feats)); y.append(c)
+    return np.array(X), np.array(y)
+
+
+def bench(channels: int = 8, fs: int = 1000, block_ms: float = 50.0, seconds_per_class: float = 20.0):
+    classes = list(GESTURE_COMMANDS)
+    block = int(fs * block_ms / 1000)
+    X, y = _synthetic(classes, channels, fs, seconds_per_class, block)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(y))
+    X, y = X[order], y[order]
+    half = len(y) // 2
+    clf = IntentClassifier(classes)
+    t = time.perf_counter()
+    clf.fit(X[:half], y[:half]); clf.decision_function(X[:1])
+    t_fit = time.perf_counter() - t
+    acc = np.mean(np.array(clf.predict(X[half:])) == y[half:])
+
+    # Actualización incremental con la mitad de test (simula recalibración)
+    t = time.perf_counter()
+    clf.partial_fit(X[half:half + 50], y[half:half + 50]); clf.decision_function(X[:1])
+    t_inc = time.perf_counter() - t
+
+    one = X[half:half + 1]
+    reps = 2000
+    t = time.perf_counter()
+    for _ in range(reps):
+        clf.predict_idx(one)
+    lat = (time.perf_counter() - t) / reps
+    t = time.perf_counter()
+    for _ in range(20):
+        clf.predict_idx(X)
+    thr = 20 * len(X) / (time.perf_counter() - t)
+    print(f"{len(classes)} gestos, {channels} canales @ {fs} Hz, bloques de {block_ms:.0f} ms, "
+          f"{len(y)} ejemplos")
+    print(f" - exactitud (test)        : {acc*100:.1f} %")
+    print(f" - entrenamiento           : {t_fit*1000:.2f} ms")
+    print(f" - actualización incr. (50): {t_inc*1000:.2f} ms")
+    print(f" - latencia por decisión   : {lat*1e6:.1f} µs")
+    print(f" - throughput por lotes    : {thr:,.0f} decisiones/s")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Clasificador de intención EMG (LDA)")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--channels", type=int, default=8)
+    a = ap.parse_args(argv)
+    if a.bench:
+        bench(channels=a.channels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Pool de procesos para filtrar y extraer features de muchos canales EMG
+usando los 4 núcleos de la Pi 5.
+
+Cada worker es dueño de un grupo fijo de canales (y de su estado de
+filtro), así que el resultado es idéntico al de un FilterBank único.
+Los bloques viajan por memoria compartida: por las colas sólo pasan
+números de secuencia.
+
+- Orden determinista: poll()/drain() entregan los bloques en el orden de submit().
+- Contrapresión: como mucho 'depth' bloques en vuelo; submit() espera si no hay hueco.
+
+Benchmark:
+    python3 -m RaspberryPI5_server.emg_processing.parallel_pool --bench
+"""
+from __future__ import annotations
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from RaspberryPI5_server.emg_processing.filter_bank import _SCIPY_OK, FEATURES, FilterBank
+
+LIVENESS_S = 0.5         # cada cuánto se comprueba que los workers siguen vivos al esperar
+
+
+def _views(shm_in, shm_out, shm_feat, depth, block, channels):
+    x = np.ndarray((depth, block, channels), dtype=np.float32, buffer=shm_in.buf)
+    y = np.ndarray((depth, block, channels), dtype=np.float32, buffer=shm_out.buf)
+    f = np.ndarray((depth, len(FEATURES), channels), dtype=np.float32, buffer=shm_feat.buf)
+    return x, y, f
+
+
+def _worker(wid, c0, c1, names, depth, block, channels, fs, filt_kw, tasks, done):
+    shms = [shared_memory.SharedMemory(name=n) for n in names]
+    x, y, f = _views(*shms, depth, block, channels)
+    bank = FilterBank(fs, c1 - c0, **filt_kw)
+    try:
+        while True:
+            msg = tasks.get()
+            if msg is None:
+                break
+            seq, n = msg
+            slot = seq % depth
+            yy, ff = bank.process(x[slot, :n, c0:c1])
+            y[slot, :n, c0:c1] = yy
+            f[slot, :, c0:c1] = ff
+            done.put((seq, wid))
+    finally:
+        del x, y, f
+        for s in shms:
+            s.close()
+
+
+class ChannelPool:
+    def __init__(self, fs: float, channels: int, workers: Optional[int] = None,
+                 block: int = 64, depth: int = 8, **filter_kw):
+        self.fs, self.channels, self.block, self.depth = fs, channels, block, depth
+        workers = max(1, min(workers or os.cpu_count() or 1, channels))
+        self.shards = [(int(s[0]), int(s[-1]) + 1)
+                       for s in np.array_split(np.arange(channels), workers) if len(s)]
+
+        feat_bytes = depth * len(FEATURES) * channels * 4
+        blk_bytes = depth * block * channels * 4
+        self._shms = [shared_memory.SharedMemory(create=True, size=blk_bytes),
+                      shared_memory.SharedMemory(create=True, size=blk_bytes),
+                      shared_memory.SharedMemory(create=True, size=feat_bytes)]
+        self._x, self._y, self._f = _views(*self._shms, depth, block, channels)
+
+        ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+        self._done = ctx.Queue()
+        self._tasks = [ctx.Queue() for _ in self.shards]
+        names = [s.name for s in self._shms]
+        self._procs = [
+            ctx.Process(target=_worker, daemon=True,
+                        args=(w, c0, c1, names, depth, block, channels, fs, filter_kw,
+                              self._tasks[w], self._done))
+            for w, (c0, c1) in enumerate(self.shards)
+        ]
+        for p in self._procs:
+            p.start()
+
+        self._seq = 0            # siguiente secuencia a enviar
+        self._next_out = 0       # siguiente secuencia a entregar
+        self._remaining: dict[int, int] = {}
+        self._lens: dict[int, int] = {}
+        self._ready: List[Tuple[int, np.ndarray, np.ndarray]] = []
+
+    # ------------------------ API -------------------------------------------
+    def submit(self, data: np.ndarray) -> int:
+        """Encola un bloque [n<=block, canales]; espera si hay 'depth' en vuelo."""
+        n = data.shape[0]
+        if n > self.block:
+            raise ValueError(f"Bloque de {n} muestras > block={self.block}")
+        while self._seq - self._next_out >= self.depth:
+            self._collect(block=True)
+        seq = self._seq
+        self._x[seq % self.depth, :n] = data
+        self._remaining[seq] = len(self.shards)
+        self._lens[seq] = n
+        for q, (c0, c1) in zip(self._tasks, self.shards):
+            q.put((seq, n))
+        self._seq += 1
+        return seq
+
+    def poll(self) -> List[Tuple[int, np.ndarray, np.ndarray]]:
+        """Resultados (seq, filtrado [n, ch], features [F, ch]) ya completos, en orden."""
+        self._collect(block=False)
+        out, self._ready = self._ready, []
+        return out
+
+    def drain(self) -> List[Tuple[int, np.ndarray, np.ndarray]]:
+        while self._next_out < self._seq:
+            self._collect(block=True)
+        out, self._ready = self._ready, []
+        return out
+
+    def close(self):
+        for q in self._tasks:
+            q.put(None)
+        for p in self._procs:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        del self._x, self._y, self._f
+        for s in self._shms:
+            s.close(); s.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------ interno ---------------------------------------
+    def _collect(self, block: bool):
+        """
+        Procesa los avisos de los workers; con block=True espera al menos uno.
+        La espera es por tramos de LIVENESS_S: si un worker murió (su aviso
+        ya no llegará) se lanza RuntimeError en vez de colgarse.
+        """
+        while True:
+            try:
+                seq, _ = self._done.get(block=block, timeout=LIVENESS_S if block else None)
+            except queue.Empty:
+                if not block:
+                    return
+                self._check_workers()
+                continue
+            self._remaining[seq] -= 1
+            self._release()
+            block = False
+
+    def _check_workers(self):
+        for w, p in enumerate(self._procs):
+            if not p.is_alive():
+                raise RuntimeError(f"El worker {w} (canales {self.shards[w][0]}-"
+                                   f"{self.shards[w][1] - 1}) terminó con código {p.exitcode}")
+
+    def _release(self):
+        while self._remaining.get(self._next_out) == 0:
+            seq = self._next_out
+            slot, n = seq % self.depth, self._lens.pop(seq)
+            del self._remaining[seq]
+            self._ready.append((seq, self._y[slot, :n].copy(), self._f[slot].copy()))
+            self._next_out += 1
+
+
+# ---------------------- Benchmark --------------------------------------------
+def bench(channels_list=(2, 4, 8, 16), workers_list=(1, 2, 4), fs=2000,
+          seconds=5.0, block=100):
+    print(f"fs={fs} Hz, {seconds:.0f} s de señal por prueba, bloque={block}, "
+          f"{os.cpu_count()} CPU, scipy={'sí' if _SCIPY_OK else 'no'}")
+    print(f"{'canales':>8} {'workers':>8} {'muestras/s':>14} {'x tiempo real':>14} {'speedup':>8}")
+    rng = np.random.default_rng(0)
+    for ch in channels_list:
+        n_blocks = int(fs * seconds / block)
+        data = rng.standard_normal((n_blocks, block, ch)).astype(np.float32)
+        # Referencia: mismo FilterBank en este proceso, sin pool
+        bank = FilterBank(fs, ch)
+        t = time.perf_counter()
+        for b in data:
+            bank.process(b)
+        dt = time.perf_counter() - t
+        print(f"{ch:>8} {'inline':>8} {n_blocks * block * ch / dt:>14,.0f} {seconds / dt:>14.1f} {'-':>8}")
+        base = None
+        for w in workers_list:
+            if w > ch:
+                continue
+            with ChannelPool(fs, ch, workers=w, block=block) as pool:
+                t = time.perf_counter()
+                for b in data:
+                    pool.submit(b)
+                    pool.poll()
+                pool.drain()
+                dt = time.perf_counter() - t
+            rate = n_blocks * block * ch / dt
+            base = base or rate
+            print(f"{ch:>8} {w:>8} {rate:>14,.0f} {seconds / dt:>14.1f} {rate / base:>8.2f}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pool multinúcleo de filtrado EMG")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--fs", type=int, default=2000)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    a = ap.parse_args(argv)
+    if a.bench:
+        bench(fs=a.fs, seconds=a.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+
+# Formato de línea de sensores_AD8232.ino:  n,v1,lo1,v2,lo2,v3,lo3
+#   n   : contador de muestras del micro (módulo 65536)
+#   v*  : cuenta ADC (analogRead, 10 bits)
+#   lo* : lead-off (0 = electrodos conectados, 1 = desconectados)
+DEFAULT_BAUD = 500000     # Serial.begin del firmware; ver LINE_MAX_BYTES
+DEFAULT_PORT = "/dev/ttyUSB0"
+DEFAULT_FS = 400          # PERIODO_US = 2500 en el firmware
+LINE_MAX_BYTES = 28       # "65535,1023,1,1023,1,1023,1\r\n": la línea más larga (3 canales)
+
+
+def link_load(fs: float = DEFAULT_FS, baud: int = DEFAULT_BAUD, line_bytes: int = LINE_MAX_BYTES) -> float:
+    """Fracción del UART 8N1 (baud/10 bytes/s) que ocupan 'fs' líneas/s en el peor caso."""
+    return fs * line_bytes / (baud / 10.0)
+
+
+def parse_line(line: str, channels: Optional[int] = None,
+               counter: Optional[bool] = None) -> Optional[Tuple[List[int], List[int], Optional[int]]]:
+    """
+    Convierte una línea del firmware en (valores, lead_off, contador).
+    Devuelve None si la línea está incompleta o corrupta.
+
+    Acepta también el firmware antiguo, sin contador (contador = None) y
+    al que le faltaba la coma entre leadOff2 y ecg3 (p.ej. "512,0,498,0503,1").
+    Con 'channels' conocido se evita confundir ese caso con una placa de 2
+    canales con contador (también 5 campos).
+
+    counter=True: la conexión ya mandó contador, así que una línea sin él es
+    un resto truncado (p.ej. "512,0,498,0,503,1") y se rechaza, y no se
+    intenta el arreglo de la coma ("7,512,0,498,0" no es firmware antiguo).
+    """
+    parts = line.strip().split(",")
+    if len(parts) == 5 and channels in (None, 3) and len(parts[3]) >= 2 and not counter:
+        parts = parts[:3] + [parts[3][0], parts[3][1:]] + parts[4:]
+    if len(parts) < 2:
+        return None
+    try:
+        nums = [int(p) for p in parts]
+    except ValueError:
+        return None
+    n = None
+    if len(nums) % 2:
+        n, nums = nums[0], nums[1:]
+        if not nums:
+            return None
+    elif counter:
+        return None
+    return nums[0::2], nums[1::2], n
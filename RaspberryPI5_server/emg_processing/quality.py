@@ -0,0 +1,110 @@
+from __future__ import annotations
+import math
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Estados de calidad por canal (código -> etiqueta). El código viaja en los
+# bits 1..3 de las banderas del ShmRing; el bit 0 es el lead-off crudo.
+Q_OK, Q_NOISE, Q_FLAT, Q_SATURATED, Q_LEAD_OFF = range(5)
+STATE_LABELS = {
+    Q_OK: "OK",
+    Q_NOISE: "RUIDO DE RED",
+    Q_FLAT: "SEÑAL PLANA",
+    Q_SATURATED: "SATURADO",
+    Q_LEAD_OFF: "SIN ELECTRODO",
+}
+BAD_STATES = (Q_FLAT, Q_SATURATED, Q_LEAD_OFF)
+
+
+def encode_flags(lead_off: np.ndarray, states: np.ndarray) -> np.ndarray:
+    """lead_off [n, ch] (0/1) + estado por canal [ch] -> banderas uint8 [n, ch]."""
+    return (np.asarray(lead_off, dtype=np.uint8) & 1) | (np.asarray(states, dtype=np.uint8) << 1)
+
+
+def decode_states(flags: np.ndarray) -> np.ndarray:
+    """Estado por canal a partir de una fila de banderas [ch]."""
+    return (np.asarray(flags, dtype=np.uint8) >> 1) & 0x7
+
+
+def good_mask(states) -> np.ndarray:
+    """Canales utilizables (bool [ch]): la misma regla para la UI y para el procesado."""
+    return ~np.isin(np.asarray(states), BAD_STATES)
+
+
+class QualityMonitor:
+    """
+    Índice de calidad por canal (0..1), actualizado en cada bloque [n, ch].
+
+    Combina el lead-off del AD8232 con métricas vectorizadas del bloque:
+    - saturación: fracción de muestras pegadas a los rieles del ADC
+    - recorte: muestras repetidas exactamente en el máximo/mínimo
+    - plano: desviación típica por debajo de 'flat_std'
+    - red eléctrica: potencia a line_hz (Goertzel) / potencia total
+    Cada métrica se suaviza con una media exponencial para no parpadear.
+    Los canales con estado malo quedan fuera de 'mask' (good_mask).
+    """
+
+    def __init__(self, fs: float, channels: int, rail_lo: float = 0.0, rail_hi: float = 1023.0,
+                 rail_margin: float = 2.0, flat_std: float = 1.0, line_hz: float = 50.0,
+                 smoothing: float = 0.3):
+        self.fs, self.channels = fs, channels
+        self.rail_lo, self.rail_hi, self.rail_margin = rail_lo, rail_hi, rail_margin
+        self.flat_std = flat_std
+        self.line_hz = line_hz
+        self.s = smoothing
+        self._basis: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        z = lambda: np.zeros(channels)
+        self.lead_off, self.saturation, self.clipping, self.powerline = z(), z(), z(), z()
+        self.std = np.full(channels, np.inf)
+        self.quality = np.ones(channels)
+        self.state = np.zeros(channels, dtype=np.uint8)
+        self.mask = np.ones(channels, dtype=bool)
+
+    def _line_basis(self, n: int):
+        b = self._basis.get(n)
+        if b is None:
+            w = 2 * math.pi * self.line_hz / self.fs * np.arange(n)
+            b = (np.cos(w)[:, None], np.sin(w)[:, None])
+            self._basis[n] = b
+        return b
+
+    def _ema(self, old: np.ndarray, new: np.ndarray) -> np.ndarray:
+        return old + self.s * (new - old)
+
+    def update(self, x: np.ndarray, lead_off: Optional[np.ndarray] = None) -> np.ndarray:
+        """x: [n, ch] en las mismas unidades que los rieles. Devuelve 'quality'."""
+        x = np.asarray(x, dtype=np.float64)
+        n = x.shape[0]
+        if n < 2:
+            return self.quality
+        if lead_off is not None:
+            self.lead_off = self._ema(self.lead_off, np.mean(lead_off, axis=0))
+
+        at_rail = (x <= self.rail_lo + self.rail_margin) | (x >= self.rail_hi - self.rail_margin)
+        self.saturation = self._ema(self.saturation, at_rail.mean(axis=0))
+
+        mx, mn = x.max(axis=0), x.min(axis=0)
+        rep = x[1:] == x[:-1]
+        at_ext = (x[1:] == mx) | (x[1:] == mn)
+        # Una señal constante es "plana", no recortada
+        self.clipping = self._ema(self.clipping, (rep & at_ext).mean(axis=0) * (mx > mn))
+
+        xc = x - x.mean(axis=0)
+        var = np.mean(xc * xc, axis=0)
+        self.std = np.sqrt(var) if np.isinf(self.std).all() else self._ema(self.std, np.sqrt(var))
+        c, s = self._line_basis(n)
+        p_line = 2.0 * ((xc * c).sum(axis=0) ** 2 + (xc * s).sum(axis=0) ** 2) / (n * n)
+        self.powerline = self._ema(self.powerline, np.minimum(1.0, p_line / (var + 1e-12)))
+
+        flat = self.std < self.flat_std
+        self.quality = ((1 - self.lead_off) * (1 - self.saturation) * (1 - self.clipping)
+                        * (1 - self.powerline) * ~flat)
+        st = np.full(self.channels, Q_OK, dtype=np.uint8)
+        st[self.powerline > 0.5] = Q_NOISE
+        st[flat] = Q_FLAT
+        st[(self.saturation > 0.2) | (self.clipping > 0.2)] = Q_SATURATED
+        st[self.lead_off > 0.5] = Q_LEAD_OFF
+        self.state = st
+        self.mask = good_mask(st)
+        return self.quality
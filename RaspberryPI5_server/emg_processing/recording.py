@@ -0,0 +1,162 @@
+from __future__ import annotations
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+SESSIONS_DIR = os.environ.get(
+    "EXO_SESSIONS_DIR", os.path.join(os.path.expanduser("~"), ".exo", "sessions"))
+
+# Archivos de una sesión:
+#   meta.json    fs, canales, nombres, paciente/usuario, inicio, nº de muestras
+#   emg.f32      float32 [muestras, canales] en mV (orden C, se puede mapear)
+#   fatigue.f32  float32 [ventanas, 1 + 2*canales]: t_s, MNF por canal, MDF por canal
+#   segments.f32 / segments.jsonl  captura por disparo: muestras de cada
+#                segmento seguidas + una línea JSON por segmento (offset,
+#                longitud, disparo, canal, eventos de relés)
+META_FILE, EMG_FILE, FATIGUE_FILE = "meta.json", "emg.f32", "fatigue.f32"
+SEGMENTS_FILE, SEGMENTS_INDEX = "segments.f32", "segments.jsonl"
+
+
+def _new_dir(parent: str, stamp: str) -> str:
+    """Crea parent/stamp; si ya existe (dos sesiones en el mismo segundo), stamp-2, stamp-3..."""
+    os.makedirs(parent, exist_ok=True)
+    for k in range(1, 1000):
+        path = os.path.join(parent, stamp if k == 1 else f"{stamp}-{k}")
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"Demasiadas sesiones en {parent} con la marca {stamp}")
+
+
+class SessionRecorder:
+    """
+    Graba una sesión en disco en modo append (sin cargarla nunca en memoria).
+    Con continuous=False sólo se guardan los segmentos de disparo (y la fatiga).
+    """
+
+    def __init__(self, patient_id: str, fs: float, channels: int,
+                 channel_names: Optional[List[str]] = None, user_id: str = "",
+                 root: str = SESSIONS_DIR, extra: Optional[Dict] = None,
+                 continuous: bool = True):
+        self.start_time = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.start_time))
+        self.path = _new_dir(os.path.join(root, patient_id or "sin_paciente"), stamp)
+        self.channels = channels
+        self.continuous = continuous
+        self.samples = 0
+        self.segments = 0
+        self._seg_samples = 0
+        self.meta = {
+            "patient_id": patient_id, "user_id": user_id,
+            "fs": fs, "channels": channels,
+            "channel_names": channel_names or [f"EMG{i+1}" for i in range(channels)],
+            "start_time": self.start_time, "samples": 0, "continuous": continuous,
+            "fatigue_fields": ["t_s"] + [f"mnf{i+1}" for i in range(channels)]
+                              + [f"mdf{i+1}" for i in range(channels)],
+            **(extra or {}),
+        }
+        self._emg = open(os.path.join(self.path, EMG_FILE), "ab")
+        self._fatigue = open(os.path.join(self.path, FATIGUE_FILE), "ab")
+        self._segs = self._seg_index = None          # se abren con el primer segmento
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def append(self, block: np.ndarray):
+        """block: [n, canales] en mV (ignorado si la sesión no es continua)."""
+        if not self.continuous:
+            return
+        self._emg.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+        self.samples += block.shape[0]
+
+    def append_fatigue(self, t_s: float, mnf: np.ndarray, mdf: np.ndarray):
+        row = np.concatenate([[t_s], mnf, mdf]).astype(np.float32)
+        self._fatigue.write(row.tobytes())
+
+    def append_segment(self, seg):
+        """Guarda un TriggerSegment (trigger.py) con sus eventos de relés."""
+        if self._segs is None:
+            self._segs = open(os.path.join(self.path, SEGMENTS_FILE), "ab")
+            self._seg_index = open(os.path.join(self.path, SEGMENTS_INDEX), "a", encoding="utf-8")
+        data = np.ascontiguousarray(seg.data, dtype=np.float32)
+        self._segs.write(data.tobytes())
+        self._seg_index.write(json.dumps({
+            "offset": self._seg_samples, "length": data.shape[0], "pre": seg.pre,
+            "sample": seg.sample, "channel": seg.channel, "t_wall": seg.t_wall,
+            "relay_events": seg.relay_events or []}) + "\n")
+        self._seg_index.flush()
+        self._seg_samples += data.shape[0]
+        self.segments += 1
+
+    def close(self, **extra_meta):
+        if self._emg.closed:
+            return
+        self._emg.close(); self._fatigue.close()
+        if self._segs is not None:
+            self._segs.close(); self._seg_index.close()
+        self.meta.update(samples=self.samples, segments=self.segments,
+                         end_time=time.time(), **extra_meta)
+        self._write_meta()
+
+
+class SessionReader:
+    """Lectura de una sesión grabada por bloques (memoria mapeada)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta: Dict = json.load(f)
+        self.fs = float(self.meta["fs"])
+        self.channels = int(self.meta["channels"])
+        emg_path = os.path.join(path, EMG_FILE)
+        n = os.path.getsize(emg_path) // (4 * self.channels)
+        self.emg = (np.memmap(emg_path, dtype=np.float32, mode="r", shape=(n, self.channels))
+                    if n else np.zeros((0, self.channels), dtype=np.float32))
+
+    @property
+    def samples(self) -> int:
+        return self.emg.shape[0]
+
+    def blocks(self, n: int = 4096, start: int = 0, stop: Optional[int] = None) -> Iterator[np.ndarray]:
+        stop = self.samples if stop is None else min(stop, self.samples)
+        for i in range(start, stop, n):
+            yield np.asarray(self.emg[i:min(i + n, stop)])
+
+    def fatigue(self) -> np.ndarray:
+        p = os.path.join(self.path, FATIGUE_FILE)
+        if not os.path.exists(p):
+            return np.zeros((0, 1 + 2 * self.channels), dtype=np.float32)
+        return np.fromfile(p, dtype=np.float32).reshape(-1, 1 + 2 * self.channels)
+
+    def segments(self) -> List[Dict]:
+        """Segmentos de disparo: el índice de cada uno con 'data' mapeado en memoria."""
+        idx_path = os.path.join(self.path, SEGMENTS_INDEX)
+        if not os.path.exists(idx_path):
+            return []
+        with open(idx_path, encoding="utf-8") as f:
+            index = [json.loads(line) for line in f if line.strip()]
+        seg_path = os.path.join(self.path, SEGMENTS_FILE)
+        n = os.path.getsize(seg_path) // (4 * self.channels)
+        if not n:
+            return []
+        data = np.memmap(seg_path, dtype=np.float32, mode="r", shape=(n, self.channels))
+        return [dict(e, data=data[e["offset"]:e["offset"] + e["length"]])
+                for e in index if e["offset"] + e["length"] <= n]
+
+
+def list_sessions(patient_id: str, root: str = SESSIONS_DIR) -> List[str]:
+    """Carpetas de sesión de un paciente, de la más antigua a la más reciente."""
+    d = os.path.join(root, patient_id)
+    if not os.path.isdir(d):
+        return []
+    return sorted(os.path.join(d, s) for s in os.listdir(d)
+                  if os.path.exists(os.path.join(d, s, META_FILE)))
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Reprocesado por lotes de sesiones grabadas con otros parámetros de
+filtrado/features (p.ej. al cambiar cortes del paso-banda).
+
+- Corre el mismo código que en vivo: FilterBank (filtro con estado +
+  RMS/MAV/WL/ZC por bloque de block_s, como el bloque de ~30 ms del
+  EMGEngine) y FatigueAnalyzer (MNF/MDF sobre la señal en mV). El filtro
+  se aplica a trozos grandes del memmap de la sesión (mismo resultado que
+  bloque a bloque) y las features de todos los bloques de un trozo salen
+  de una pasada (FilterBank.features_blocks).
+- Paralelo por archivos: una sesión por tarea en un pool de procesos (el
+  estado del filtro es secuencial dentro de una sesión), las más largas
+  primero para repartir bien los núcleos.
+- Caché por versión: el resultado va a <sesión>/reprocessed/<clave>/,
+  con clave = PIPELINE_VERSION + hash de PipelineConfig. Una sesión cuya
+  clave ya existe para la misma señal (muestras y fin) se salta; subir
+  PIPELINE_VERSION al cambiar el código del procesado.
+- Progreso (muestras procesadas, también dentro de cada sesión) y
+  rendimiento final en muestras/s.
+
+Archivos del resultado:
+    features.f32  float32 [bloques, 1 + F*canales]: t_s fin de bloque y,
+                  por feature (orden de FEATURES), un valor por canal
+    fatigue.f32   mismo formato que el de recording.py
+    result.json   clave, parámetros, muestras, bloques, ventanas, origen
+
+    python3 -m RaspberryPI5_server.emg_processing.reprocess P001 --hp 30 --lp 400
+    python3 -m RaspberryPI5_server.emg_processing.reprocess --all --workers 4
+    python3 -m RaspberryPI5_server.emg_processing.reprocess --bench
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from RaspberryPI5_server.emg_processing.filter_bank import _SCIPY_OK, FEATURES, FilterBank
+from RaspberryPI5_server.emg_processing.recording import (EMG_FILE, META_FILE, SESSIONS_DIR,
+                                                          SessionReader, list_sessions)
+from RaspberryPI5_server.emg_processing.spectral import FatigueAnalyzer, frame_size
+
+PIPELINE_VERSION = 1
+REPROCESS_DIR = "reprocessed"
+RESULT_FILE, FEATURES_FILE, FATIGUE_FILE = "result.json", "features.f32", "fatigue.f32"
+CHUNK_SAMPLES = 1 << 16
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    hp: Optional[float] = 20.0
+    lp: Optional[float] = 450.0
+    notch: Optional[float] = 50.0
+    block_s: float = 0.03                       # bloque de features (el del EMGEngine)
+    fatigue_win_s: float = 0.5
+    fatigue_avg_frames: int = 4
+    fatigue_band: Tuple[float, float] = (20.0, 450.0)
+
+    def key(self) -> str:
+        blob = json.dumps({"version": PIPELINE_VERSION, **asdict(self)}, sort_keys=True)
+        return f"v{PIPELINE_VERSION}-{hashlib.sha1(blob.encode()).hexdigest()[:10]}"
+
+    def block_samples(self, fs: float) -> int:
+        return max(3, int(fs * self.block_s))
+
+
+# ---------------------- Una sesión -------------------------------------------
+def _source(reader: SessionReader) -> Dict:
+    """Identifica la señal de origen: si cambia, la caché deja de valer."""
+    return {"samples": reader.samples, "end_time": reader.meta.get("end_time"),
+            "bytes": os.path.getsize(os.path.join(reader.path, EMG_FILE))}
+
+
+def result_dir(session_path: str, cfg: PipelineConfig) -> str:
+    return os.path.join(session_path, REPROCESS_DIR, cfg.key())
+
+
+def _read_result(out_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(out_dir, RESULT_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_cached(session_path: str, cfg: PipelineConfig) -> bool:
+    res = _read_result(result_dir(session_path, cfg))
+    return res is not None and res.get("source") == _source(SessionReader(session_path))
+
+
+def process_session(session_path: str, cfg: PipelineConfig = PipelineConfig(), force: bool = False,
+                    progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """Reprocesa una sesión (o devuelve su resultado en caché). progress(n) por cada trozo leído."""
+    reader = SessionReader(session_path)
+    fs, ch = reader.fs, reader.channels
+    out_dir = result_dir(session_path, cfg)
+    src = _source(reader)
+    if not force:
+        res = _read_result(out_dir)
+        if res is not None and res.get("source") == src:
+            return dict(res, cached=True)
+
+    t = time.perf_counter()
+    bank = FilterBank(fs, ch, hp=cfg.hp, lp=cfg.lp, notch=cfg.notch)
+    win = frame_size(fs, cfg.fatigue_win_s)
+    fat = FatigueAnalyzer(fs, ch, win=win, hop=win // 2, avg_frames=cfg.fatigue_avg_frames,
+                          band=cfg.fatigue_band)
+    n = cfg.block_samples(fs)
+    chunk = n * max(1, CHUNK_SAMPLES // n)           # trozos con bloques enteros
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    done = blocks = windows = 0
+    with open(os.path.join(tmp, FEATURES_FILE), "wb") as ff, \
+            open(os.path.join(tmp, FATIGUE_FILE), "wb") as fw:
+        for blk in reader.blocks(chunk):
+            y = bank.filter(blk)
+            m = (y.shape[0] // n) * n
+            feats = bank.features_blocks(y[:m], n)
+            ends = done + n * np.arange(1, feats.shape[0] + 1)
+            if m < y.shape[0]:                       # último bloque, incompleto
+                feats = np.concatenate([feats, bank.features(y[m:])[None]])
+                ends = np.append(ends, done + y.shape[0])
+            rows = np.hstack([(ends / fs)[:, None], feats.reshape(feats.shape[0], -1)])
+            ff.write(rows.astype(np.float32).tobytes())
+            for t_s, mnf, mdf in fat.update(blk):
+                fw.write(np.concatenate([[t_s], mnf, mdf]).astype(np.float32).tobytes())
+                windows += 1
+            blocks += feats.shape[0]
+            done += blk.shape[0]
+            if progress is not None:
+                progress(blk.shape[0])
+
+    res = {"key": cfg.key(), "version": PIPELINE_VERSION, "config": asdict(cfg),
+           "session": session_path, "source": src, "fs": fs, "channels": ch,
+           "features": list(FEATURES), "block_samples": n, "fatigue_win": win,
+           "samples": done, "blocks": blocks, "windows": windows,
+           "elapsed_s": round(time.perf_counter() - t, 3)}
+    with open(os.path.join(tmp, RESULT_FILE), "w", encoding="utf-8") as f:
+        json.dump(res, f, indent=1)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    return dict(res, cached=False)
+
+
+def load_result(session_path: str, cfg: PipelineConfig = PipelineConfig()) -> Optional[Dict]:
+    """result.json + 'features' [bloques, F, canales] y 'fatigue' mapeados; None si no existe."""
+    out_dir = result_dir(session_path, cfg)
+    res = _read_result(out_dir)
+    if res is None:
+        return None
+    ch, nf = int(res["channels"]), len(res["features"])
+    feats = _map(os.path.join(out_dir, FEATURES_FILE), 1 + nf * ch)
+    res["t_s"] = feats[:, 0]
+    res["features"] = feats[:, 1:].reshape(-1, nf, ch)
+    res["fatigue"] = _map(os.path.join(out_dir, FATIGUE_FILE), 1 + 2 * ch)
+    return res
+
+
+def _map(path: str, cols: int) -> np.ndarray:
+    rows = os.path.getsize(path) // (4 * cols)
+    if not rows:
+        return np.zeros((0, cols), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(rows, cols))
+
+
+# ---------------------- Lote --------------------------------------------------
+_queue = None                                     # avisos de progreso del worker al padre
+
+
+def _init_worker(q):
+    global _queue
+    _queue = q
+
+
+def _task(session_path: str, cfg: PipelineConfig, force: bool) -> Dict:
+    try:
+        return process_session(session_path, cfg, force, progress=_queue.put)
+    except Exception as ex:
+        return {"session": session_path, "error": str(ex), "samples": 0}
+
+
+def closed_sessions(patients: Optional[Sequence[str]] = None, root: str = SESSIONS_DIR) -> List[str]:
+    """Sesiones terminadas (con end_time) de los pacientes dados, o de todos."""
+    if patients is None:
+        patients = sorted(p for p in os.listdir(root) if os.path.isdir(os.path.join(root, p))) \
+            if os.path.isdir(root) else []
+    out = []
+    for p in patients:
+        for s in list_sessions(p, root):
+            try:
+                with open(os.path.join(s, META_FILE), encoding="utf-8") as f:
+                    if "end_time" in json.load(f):
+                        out.append(s)
+            except (OSError, ValueError):
+                continue
+    return out
+
+
+def reprocess_many(session_paths: Sequence[str], cfg: PipelineConfig = PipelineConfig(),
+                   workers: Optional[int] = None, force: bool = False,
+                   on_progress: Optional[Callable[[int, int, int, int], None]] = None) -> List[Dict]:
+    """
+    Reprocesa varias sesiones en paralelo (una por proceso); las que ya
+    están en caché no llegan al pool. on_progress(muestras_hechas,
+    muestras_totales, sesiones_hechas, sesiones_totales).
+    """
+    results: List[Dict] = []
+    todo = []
+    for s in session_paths:
+        if not force and is_cached(s, cfg):
+            results.append(dict(_read_result(result_dir(s, cfg)), cached=True))
+        else:
+            todo.append((SessionReader(s).samples, s))
+    todo.sort(reverse=True)                       # las más largas primero
+    total = sum(n for n, _ in todo)
+    state = [0, 0]                                # muestras, sesiones
+
+    def tick(n: int = 0, finished: int = 0):
+        state[0] += n; state[1] += finished
+        if on_progress is not None:
+            on_progress(state[0], total, state[1], len(todo))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(todo) or 1))
+    if workers <= 1:
+        for _, s in todo:
+            try:
+                results.append(process_session(s, cfg, force, progress=tick))
+            except Exception as ex:
+                results.append({"session": s, "error": str(ex), "samples": 0})
+            tick(finished=1)
+        return results
+
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    q = ctx.Queue()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(q,)) as ex:
+        pending = {ex.submit(_task, s, cfg, force) for _, s in todo}
+        while pending:
+            finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            _drain(q, tick)
+            for f in finished:
+                results.append(f.result())
+                tick(finished=1)
+    _drain(q, tick)
+    return results
+
+
+def _drain(q, tick):
+    while True:
+        try:
+            n = q.get_nowait()
+        except queue.Empty:
+            return
+        tick(n)
+
+
+# ---------------------- Benchmark --------------------------------------------
+def bench(sessions: int = 4, seconds: float = 60.0, fs: int = 1000, channels: int = 4):
+    """Sesiones sintéticas en un directorio temporal: 1 proceso vs todos los núcleos, y pasada en caché."""
+    from RaspberryPI5_server.emg_processing.recording import SessionRecorder
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as root:
+        paths = []
+        for i in range(sessions):
+            rec = SessionRecorder(f"BENCH{i}", fs, channels, root=root)   # mismo segundo: un paciente por sesión
+            for _ in range(int(seconds)):
+                rec.append(rng.standard_normal((fs, channels)).astype(np.float32))
+            rec.close()
+            paths.append(rec.path)
+        n = sessions * int(seconds) * fs
+        print(f"{sessions} sesiones x {seconds:.0f} s, {channels} canales @ {fs} Hz "
+              f"({n:,} muestras); {platform.machine()}, {os.cpu_count()} CPU, "
+              f"scipy={'sí' if _SCIPY_OK else 'no'}")
+        for w in sorted({1, os.cpu_count() or 1}):
+            t = time.perf_counter()
+            reprocess_many(paths, workers=w, force=True)
+            dt = time.perf_counter() - t
+            print(f"  {w} proceso(s): {dt:6.2f} s  {n / dt:>12,.0f} muestras/s  "
+                  f"({n * channels / dt:,.0f} muestras·canal/s, {n / fs / dt:.0f}x tiempo real)")
+        t = time.perf_counter()
+        res = reprocess_many(paths)
+        print(f"  en caché: {(time.perf_counter() - t) * 1000:.1f} ms "
+              f"({sum(r['cached'] for r in res)}/{len(res)} saltadas)")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Reprocesado por lotes de sesiones grabadas")
+    ap.add_argument("target", nargs="*", help="ids de paciente o carpetas de sesión")
+    ap.add_argument("--all", action="store_true", help="todas las sesiones de --root")
+    ap.add_argument("--root", default=SESSIONS_DIR)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--force", action="store_true", help="ignora la caché")
+    ap.add_argument("--hp", type=float, default=20.0, help="0 = sin paso-alto")
+    ap.add_argument("--lp", type=float, default=450.0, help="0 = sin paso-bajo")
+    ap.add_argument("--notch", type=float, default=50.0, help="0 = sin notch")
+    ap.add_argument("--block-s", type=float, default=0.03)
+    ap.add_argument("--fatigue-win-s", type=float, default=0.5)
+    ap.add_argument("--bench", action="store_true")
+    a = ap.parse_args(argv)
+
+    if a.bench:
+        bench()
+        return
+    cfg = PipelineConfig(hp=a.hp or None, lp=a.lp or None, notch=a.notch or None,
+                         block_s=a.block_s, fatigue_win_s=a.fatigue_win_s)
+    paths = [t for t in a.target if os.path.isdir(t)]
+    patients = [t for t in a.target if not os.path.isdir(t)]
+    if a.all or patients:
+        paths += closed_sessions(None if a.all else patients, a.root)
+    if not paths:
+        ap.error("sin sesiones (indica pacientes, carpetas de sesión o --all)")
+
+    t0 = time.perf_counter()
+
+    def show(done, total, fin, n):
+        dt = max(1e-9, time.perf_counter() - t0)
+        pct = 100.0 * done / total if total else 100.0
+        print(f"\r[{pct:5.1f}%] {fin}/{n} sesiones  {done / dt:>12,.0f} muestras/s", end="", flush=True)
+
+    res = reprocess_many(paths, cfg, a.workers, a.force, on_progress=show)
+    dt = time.perf_counter() - t0
+    print()
+    done = [r for r in res if not r.get("cached") and "error" not in r]
+    errors = [r for r in res if "error" in r]
+    for r in errors:
+        print(f"✖ {r['session']}: {r['error']}")
+    n = sum(r["samples"] for r in done)
+    print(f"clave {cfg.key()}: {len(done)} reprocesadas, {len(res) - len(done) - len(errors)} en caché, "
+          f"{len(errors)} con error; {n:,} muestras en {dt:.2f} s = {n / dt:,.0f} muestras/s "
+          f"({platform.machine()}, {os.cpu_count()} CPU)")
+
+
+if __name__ == "__main__":
+    main()
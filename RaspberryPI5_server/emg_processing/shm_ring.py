@@ -0,0 +1,163 @@
+from __future__ import annotations
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Cabecera int64 al inicio del bloque compartido
+_H_WRITE = 0      # muestras escritas en total (monótono)
+_H_CH = 1         # canales
+_H_CAP = 2        # capacidad del anillo (muestras)
+_H_FS = 3         # Hz
+_H_BEAT = 4       # time.monotonic_ns() de la última escritura
+_H_CLK_T0 = 5     # ns monotónicos del host para la muestra 0 del anillo
+_H_CLK_PS = 6     # periodo de muestreo medido (picosegundos)
+_H_DROPPED = 7    # muestras perdidas e interpoladas
+_H_RESERVE = 8    # fin de la escritura en curso (se anuncia antes de copiar)
+_H_LEN = 9
+_HDR_BYTES = _H_LEN * 8
+
+
+def _layout(channels: int, capacity: int) -> Tuple[int, int, int]:
+    data_bytes = capacity * channels * 4          # float32
+    flags_bytes = capacity * channels             # uint8 (lead-off)
+    return data_bytes, flags_bytes, _HDR_BYTES + data_bytes + flags_bytes
+
+
+class ShmRing:
+    """
+    Anillo de muestras en memoria compartida: un único escritor (el daemon)
+    y cualquier número de lectores en otros procesos.
+
+    El escritor anuncia primero hasta dónde va a escribir (_H_RESERVE), copia
+    las muestras y sólo después avanza el contador de la cabecera. El lector
+    sólo lee hasta el contador y, tras copiar, descarta las filas que una
+    escritura anunciada (terminada o en curso) pudo pisar: nunca devuelve
+    datos a medio escribir. Cada lector lleva su propia posición; si se
+    queda atrás más de 'capacity' muestras pierde las más antiguas y lo
+    registra en 'overruns'.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.hdr = np.ndarray((_H_LEN,), dtype=np.int64, buffer=shm.buf)
+        self.channels = int(self.hdr[_H_CH])
+        self.capacity = int(self.hdr[_H_CAP])
+        self.fs = int(self.hdr[_H_FS])
+        data_bytes, flags_bytes, _ = _layout(self.channels, self.capacity)
+        self.data = np.ndarray((self.capacity, self.channels), dtype=np.float32,
+                               buffer=shm.buf, offset=_HDR_BYTES)
+        self.flags = np.ndarray((self.capacity, self.channels), dtype=np.uint8,
+                                buffer=shm.buf, offset=_HDR_BYTES + data_bytes)
+        self.pos = int(self.hdr[_H_WRITE])   # lectores empiezan en "ahora"
+        self.overruns = 0
+
+    # ------------------------ creación / apertura ----------------------
+    @classmethod
+    def create(cls, name: str, channels: int, fs: int, capacity: int = 1 << 16) -> "ShmRing":
+        _, _, total = _layout(channels, capacity)
+        try:  # restos de una ejecución anterior
+            old = shared_memory.SharedMemory(name=name)
+            old.close(); old.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        hdr = np.ndarray((_H_LEN,), dtype=np.int64, buffer=shm.buf)
+        hdr[:] = 0
+        hdr[_H_CH], hdr[_H_CAP], hdr[_H_FS] = channels, capacity, fs
+        hdr[_H_CLK_PS] = round(1e12 / fs)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "ShmRing":
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            # Sin esto el resource_tracker del lector borraría el segmento al salir
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+        except Exception:
+            pass
+        return cls(shm, owner=False)
+
+    def close(self):
+        # Las vistas numpy deben soltarse antes de cerrar el buffer
+        del self.hdr, self.data, self.flags
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    # ------------------------ escritor ---------------------------------
+    def write(self, block: np.ndarray, lead_off: Optional[np.ndarray] = None):
+        """block: [n, channels] float32 en mV."""
+        n = block.shape[0]
+        if n == 0:
+            return
+        if n > self.capacity:
+            block = block[-self.capacity:]
+            lead_off = lead_off[-self.capacity:] if lead_off is not None else None
+            n = self.capacity
+        w = int(self.hdr[_H_WRITE])
+        self.hdr[_H_RESERVE] = w + n      # anunciar antes de pisar filas
+        i = w % self.capacity
+        k = min(n, self.capacity - i)
+        self.data[i:i + k] = block[:k]
+        self.data[:n - k] = block[k:]
+        if lead_off is not None:
+            self.flags[i:i + k] = lead_off[:k]
+            self.flags[:n - k] = lead_off[k:]
+        self.hdr[_H_BEAT] = time.monotonic_ns()
+        self.hdr[_H_WRITE] = w + n        # publicar al final
+
+    def set_clock(self, t0_s: float, period_s: float, dropped: int = 0):
+        """Publica el mapeo índice de muestra -> tiempo monotónico del host."""
+        self.hdr[_H_CLK_T0] = int(t0_s * 1e9)
+        self.hdr[_H_CLK_PS] = int(round(period_s * 1e12))
+        self.hdr[_H_DROPPED] = dropped
+
+    # ------------------------ lectores ---------------------------------
+    @property
+    def written(self) -> int:
+        return int(self.hdr[_H_WRITE])
+
+    def time_of(self, idx: np.ndarray) -> np.ndarray:
+        """Índices de muestra -> segundos de time.monotonic() del host."""
+        return (int(self.hdr[_H_CLK_T0]) * 1e-9
+                + np.asarray(idx, dtype=np.float64) * (int(self.hdr[_H_CLK_PS]) * 1e-12))
+
+    @property
+    def dropped(self) -> int:
+        return int(self.hdr[_H_DROPPED])
+
+    def heartbeat_age_s(self) -> float:
+        return (time.monotonic_ns() - int(self.hdr[_H_BEAT])) / 1e9
+
+    def read(self, max_n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Devuelve (datos [n, ch], lead_off [n, ch], índice de la primera muestra)
+        con todo lo escrito desde la última llamada (copias, no vistas).
+        """
+        w = int(self.hdr[_H_WRITE])
+        if w - self.pos > self.capacity:
+            self.overruns += w - self.pos - self.capacity
+            self.pos = w - self.capacity
+        n = w - self.pos
+        if max_n is not None:
+            n = min(n, max_n)
+        start = self.pos
+        idx = (start + np.arange(n)) % self.capacity
+        out = self.data[idx]
+        flg = self.flags[idx]
+        self.pos += n
+        # Filas que una escritura anunciada mientras copiábamos pudo pisar
+        # (aunque aún no haya avanzado _H_WRITE): ya no valen
+        lost = (int(self.hdr[_H_RESERVE]) - self.capacity) - start
+        if lost > 0:
+            lost = min(lost, n)
+            self.overruns += lost
+            out, flg, start = out[lost:], flg[lost:], start + lost
+        return out, flg, start
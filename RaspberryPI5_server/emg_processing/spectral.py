@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Analizador espectral en streaming para fatiga muscular.
+
+Por cada ventana (hop configurable) y para todos los canales a la vez:
+- MNF: frecuencia media   = sum(f * P) / sum(P)
+- MDF: frecuencia mediana = f donde la potencia acumulada llega a la mitad
+
+El espectro es un Welch incremental: cada trama (Hann, solapada) se
+transforma una sola vez y se suma/resta de una media móvil de las últimas
+'avg_frames' tramas. Ventana, eje de frecuencias y máscara de banda se
+precalculan; las tramas de un bloque se transforman en un solo rfft.
+
+Benchmark (8 canales a 2 kHz):
+    python3 -m RaspberryPI5_server.emg_processing.spectral --bench
+"""
+from __future__ import annotations
+import argparse
+import math
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:
+    from scipy import fft as _fft  # type: ignore  # (más rápido y con caché de planes)
+except Exception:
+    _fft = np.fft
+
+
+def slope(t: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Pendiente por mínimos cuadrados de cada columna de y [n, ch]; ignora NaN (NaN si <2 puntos)."""
+    y = np.asarray(y, dtype=np.float64)
+    ok = ~np.isnan(y)
+    n = ok.sum(axis=0)
+    tt = np.where(ok, np.asarray(t, dtype=np.float64)[:, None], 0.0)
+    yy = np.where(ok, y, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tm, ym = tt.sum(axis=0) / n, yy.sum(axis=0) / n
+        tc = np.where(ok, tt - tm, 0.0)
+        den = (tc ** 2).sum(axis=0)
+        out = (tc * (yy - ym)).sum(axis=0) / den
+    return np.where((n >= 2) & (den > 0), out, np.nan)
+
+
+def frame_size(fs: float, seconds: float = 0.5) -> int:
+    """Trama de análisis: potencia de 2 más cercana a 'seconds' (mínimo 32 muestras)."""
+    return 1 << max(5, int(round(math.log2(fs * seconds))))
+
+
+class FatigueAnalyzer:
+    def __init__(self, fs: float, channels: int, win: int = 512, hop: int = 256,
+                 avg_frames: int = 4, band: Tuple[float, float] = (20.0, 450.0),
+                 history: int = 4096):
+        self.fs, self.channels = fs, channels
+        self.win, self.hop, self.avg_frames = win, hop, avg_frames
+        self.window = np.hanning(win).astype(np.float32)[None, :, None]
+        freqs = np.fft.rfftfreq(win, 1.0 / fs)
+        self.band = (freqs >= band[0]) & (freqs <= min(band[1], fs / 2))
+        self.freqs = freqs[self.band]
+        self._buf = np.zeros((0, channels), dtype=np.float32)   # muestras aún sin trama completa
+        self._consumed = 0                                       # índice absoluto de _buf[0]
+        self._frames: deque = deque()
+        self._psd_sum = np.zeros((self.freqs.size, channels))
+        # historial acotado: (t_s, mnf [ch], mdf [ch])
+        self.history: deque = deque(maxlen=history)
+
+    def reset(self):
+        self._buf = self._buf[:0]
+        self._consumed = 0
+        self._frames.clear()
+        self._psd_sum[:] = 0.0
+        self.history.clear()
+
+    def update(self, x: np.ndarray, mask: Optional[np.ndarray] = None) -> List[Tuple[float, np.ndarray, np.ndarray]]:
+        """
+        x: [n, canales]. Devuelve las ventanas nuevas (t_s fin de trama, mnf,
+        mdf). Con 'mask' (bool [canales], p.ej. quality.good_mask) los
+        canales malos no se transforman: salen NaN y su media se reinicia.
+        """
+        self._buf = np.concatenate([self._buf, np.asarray(x, dtype=np.float32)])
+        n_frames = 0 if self._buf.shape[0] < self.win else (self._buf.shape[0] - self.win) // self.hop + 1
+        if n_frames == 0:
+            return []
+        bad = None if mask is None or np.all(mask) else ~np.asarray(mask, dtype=bool)
+        # [frames, win, ch] sin copiar; luego un único rfft por bloque
+        frames = sliding_window_view(self._buf, self.win, axis=0)[::self.hop][:n_frames]
+        frames = np.moveaxis(frames, -1, 1)
+        if bad is not None:
+            frames = frames[:, :, ~bad]
+            for f in self._frames:
+                f[:, bad] = 0.0
+            self._psd_sum[:, bad] = 0.0
+        spec = _fft.rfft((frames - frames.mean(axis=1, keepdims=True)) * self.window, axis=1)
+        psd = (spec.real ** 2 + spec.imag ** 2)[:, self.band, :]
+        if bad is not None:
+            full = np.zeros((n_frames, self.freqs.size, self.channels), dtype=psd.dtype)
+            full[:, :, ~bad] = psd
+            psd = full
+
+        out = []
+        for k in range(n_frames):
+            self._frames.append(psd[k]); self._psd_sum += psd[k]
+            if len(self._frames) > self.avg_frames:
+                self._psd_sum -= self._frames.popleft()
+            t_end = (self._consumed + k * self.hop + self.win) / self.fs
+            mnf, mdf = self._mnf_mdf(self._psd_sum)
+            if bad is not None:
+                mnf[bad] = mdf[bad] = np.nan
+            self.history.append((t_end, mnf, mdf))
+            out.append((t_end, mnf, mdf))
+
+        drop = n_frames * self.hop
+        self._buf = self._buf[drop:]
+        self._consumed += drop
+        return out
+
+    def _mnf_mdf(self, p: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        total = p.sum(axis=0) + 1e-20
+        mnf = (self.freqs[:, None] * p).sum(axis=0) / total
+        cum = np.cumsum(p, axis=0)
+        mdf = self.freqs[np.argmax(cum >= 0.5 * total, axis=0)]
+        return mnf.astype(np.float32), mdf.astype(np.float32)
+
+    def trend(self, last_s: Optional[float] = None) -> np.ndarray:
+        """Pendiente de la MDF (Hz/s) por canal; negativa = fatiga. NaN si el canal no tiene datos."""
+        if len(self.history) < 2:
+            return np.zeros(self.channels)
+        t = np.array([h[0] for h in self.history])
+        mdf = np.array([h[2] for h in self.history])
+        if last_s is not None:
+            sel = t >= t[-1] - last_s
+            t, mdf = t[sel], mdf[sel]
+        if t.size < 2:
+            return np.zeros(self.channels)
+        return slope(t, mdf)
+
+
+# ---------------------- Benchmark --------------------------------------------
+def bench(fs: int = 2000, channels: int = 8, seconds: float = 60.0, block_s: float = 0.03):
+    rng = np.random.default_rng(0)
+    n = int(fs * seconds)
+    x = rng.standard_normal((n, channels)).astype(np.float32)
+    fa = FatigueAnalyzer(fs, channels)
+    blk = max(1, int(fs * block_s))
+    t = time.perf_counter()
+    windows = 0
+    for i in range(0, n, blk):
+        windows += len(fa.update(x[i:i + blk]))
+    dt = time.perf_counter() - t
+    print(f"{channels} canales @ {fs} Hz, {seconds:.0f} s de señal: {dt*1000:.0f} ms "
+          f"({seconds / dt:.0f}x tiempo real, {windows} ventanas)")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Analizador de fatiga (MNF/MDF)")
+    ap.add_argument("--bench", action="store_true")
+    ap.add_argument("--fs", type=int, default=2000)
+    ap.add_argument("--channels", type=int, default=8)
+    a = ap.parse_args(argv)
+    if a.bench:
+        bench(fs=a.fs, channels=a.channels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Resúmenes materializados por sesión para ver el progreso de un paciente
+sin volver a leer la señal.
+
+Por sesión (una fila):
+- peak_rms_mV: máximo por canal del RMS en ventanas de RMS_WIN_S (sin
+  la media de cada ventana); en sesiones sólo de disparos, sobre los
+  segmentos.
+- fatigue_slope_hz_min: pendiente de la MDF por canal (recta por mínimos
+  cuadrados sobre fatigue.f32), en Hz/min; negativa = fatiga.
+- routines: pasadas de rutina del diario de relés (journal.py) y cuántas
+  terminaron sin PARO; completion = completadas / pasadas.
+- active_range_s: por actuador, la activación continua más larga (A o B)
+  en segundos, que con velocidad fija es proporcional al recorrido.
+
+Las filas de un paciente viven en <sesiones>/<paciente>/progress.json:
+- Al cerrar una sesión se calcula sólo esa fila (summarize_async).
+- Cada fila lleva SUMMARY_VERSION; refresh_stale() recalcula en segundo
+  plano las que falten o sean de otra versión. No se sube a mano entera:
+  es un hash de SUMMARY_CODE (subirlo al cambiar cómo se calcula un
+  resumen) y de sus parámetros. La fila sale de emg.f32 en bruto y del
+  fatigue.f32 grabado en vivo, no de reprocess, así que cambiar el
+  procesado no la invalida.
+- load_progress() sólo lee ese archivo (y lo guarda en caché hasta que
+  cambie su mtime), así que abrir el historial tarda milisegundos.
+
+    python3 -m RaspberryPI5_server.emg_processing.summary P001
+    python3 -m RaspberryPI5_server.emg_processing.summary --refresh
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from RaspberryPI5_server.emg_processing.recording import META_FILE, SESSIONS_DIR, SessionReader, list_sessions
+from RaspberryPI5_server.emg_processing.spectral import slope
+
+SUMMARY_CODE = 1                               # subir al cambiar el cálculo de una fila
+PROGRESS_FILE = "progress.json"
+RMS_WIN_S = 0.25
+ROUTINE_GRACE_S = 10.0
+BLOCK_SAMPLES = 1 << 16
+
+
+def _summary_version() -> str:
+    blob = json.dumps({"code": SUMMARY_CODE, "rms_win_s": RMS_WIN_S,
+                       "grace_s": ROUTINE_GRACE_S}, sort_keys=True)
+    return f"s{SUMMARY_CODE}-{hashlib.sha1(blob.encode()).hexdigest()[:10]}"
+
+
+SUMMARY_VERSION = _summary_version()
+
+_lock = threading.Lock()                       # un escritor por proceso
+_cache: Dict[str, tuple] = {}                  # ruta -> (mtime_ns, filas)
+
+
+# ---------------------- Cálculo de una sesión --------------------------------
+def _peak_rms(blocks, fs: float, channels: int) -> np.ndarray:
+    win = max(1, int(round(RMS_WIN_S * fs)))
+    peak = np.zeros(channels)
+    for b in blocks:
+        m = b.shape[0] // win
+        if m == 0:
+            continue
+        w = np.asarray(b[:m * win], dtype=np.float64).reshape(m, win, channels)
+        peak = np.maximum(peak, np.sqrt(w.var(axis=1).max(axis=0)))
+    return peak
+
+
+def _fatigue_slope(fat: np.ndarray, channels: int) -> List[Optional[float]]:
+    if fat.shape[0] < 3:
+        return [None] * channels
+    t_min = fat[:, 0].astype(np.float64) / 60.0
+    if np.ptp(t_min) <= 0:
+        return [None] * channels
+    mdf = fat[:, 1 + channels:1 + 2 * channels].astype(np.float64)
+    # NaN = ventanas con el canal enmascarado por calidad (spectral.slope las ignora)
+    return [None if np.isnan(s) else round(float(s), 3) for s in slope(t_min, mdf)]
+
+
+def _journal_events(reader: SessionReader, journal_root: Optional[str]) -> List[Dict]:
+    try:
+        from Laptop_client.GUI.journal import JOURNAL_DIR, JournalReader
+        sessions_root = os.path.dirname(os.path.dirname(os.path.abspath(reader.path)))
+        jr = JournalReader(os.path.relpath(os.path.abspath(reader.path), sessions_root),
+                           journal_root or JOURNAL_DIR)
+        start = float(reader.meta.get("start_time", 0.0))
+        end = reader.meta.get("end_time")
+        return jr.decode(jr.range(start, None if end is None else float(end) + 5.0))
+    except (OSError, ValueError):
+        return []                              # sesión sin diario de relés
+
+
+def _routine_runs(events: List[Dict], grace_s: float = ROUTINE_GRACE_S) -> Dict:
+    """
+    Pasadas = tramos seguidos de eventos 'rutina' de la misma rutina. Es
+    interrumpida si hay un PARO durante la pasada o hasta 'grace_s' después
+    de su último evento (un paro en mitad de una pausa larga llega tarde),
+    sin pasar del inicio de la pasada siguiente.
+    """
+    runs: List[List[float]] = []               # [t_ini, t_fin, interrumpida]
+    names: List[str] = []
+    cycles = last_cycle = 0
+    cur = None
+    for e in events:
+        if e["cause"] == "rutina":
+            cycles = max(cycles, e["cycle"])
+            # El ciclo vuelve a empezar: otra pasada aunque sea la misma rutina
+            if cur is None or names[-1] != e["routine"] or e["cycle"] < last_cycle:
+                cur = [e["t"], e["t"], 0.0]
+                runs.append(cur); names.append(e["routine"])
+            cur[1], last_cycle = e["t"], e["cycle"]
+        elif e["cause"] != "reposo":
+            cur = None
+    paros = [e["t"] for e in events if e["cause"] == "paro"]
+    for i, r in enumerate(runs):
+        until = min(r[1] + grace_s, runs[i + 1][0] if i + 1 < len(runs) else float("inf"))
+        r[2] = float(any(r[0] <= t < until for t in paros))
+    done = sum(1 for r in runs if not r[2])
+    return {"runs": len(runs), "completed": done, "max_cycle": cycles,
+            "completion": round(done / len(runs), 3) if runs else None,
+            "names": sorted(set(names))}
+
+
+def _active_range(events: List[Dict]) -> Dict[str, float]:
+    from Laptop_client.GUI.clock import RelayEvent, on_intervals
+    rel = [RelayEvent(e["t"], e["actuator"], e["A"], e["B"]) for e in events]
+    out: Dict[str, float] = {}
+    for act, _side, _t0, dur in on_intervals(rel):
+        out[str(act)] = round(max(out.get(str(act), 0.0), dur), 3)
+    return out
+
+
+def summarize_session(path: str, journal_root: Optional[str] = None) -> Dict:
+    """Fila de resumen de la sesión en 'path' (lee la señal por bloques)."""
+    reader = SessionReader(path)
+    meta, ch = reader.meta, reader.channels
+    if reader.samples:
+        blocks = reader.blocks(BLOCK_SAMPLES)
+    else:
+        blocks = (np.asarray(s["data"]) for s in reader.segments())
+    events = _journal_events(reader, journal_root)
+    start = float(meta.get("start_time", 0.0))
+    end = meta.get("end_time")
+    return {
+        "session": os.path.basename(os.path.normpath(path)),
+        "version": SUMMARY_VERSION,
+        "start_time": start,
+        "duration_s": round(float(end) - start if end else reader.samples / reader.fs, 1),
+        "samples": reader.samples,
+        "segments": int(meta.get("segments", 0)),
+        "peak_rms_mV": [round(float(v), 4) for v in _peak_rms(blocks, reader.fs, ch)],
+        "fatigue_slope_hz_min": _fatigue_slope(reader.fatigue(), ch),
+        "routines": _routine_runs(events),
+        "active_range_s": _active_range(events),
+    }
+
+
+# ---------------------- Tabla por paciente -----------------------------------
+def _progress_path(patient_dir: str) -> str:
+    return os.path.join(patient_dir, PROGRESS_FILE)
+
+
+def _read_table(patient_dir: str) -> Dict[str, Dict]:
+    try:
+        with open(_progress_path(patient_dir), encoding="utf-8") as f:
+            return json.load(f).get("sessions", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_table(patient_dir: str, rows: Dict[str, Dict]):
+    path = _progress_path(patient_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"sessions": rows}, f, indent=1)
+    os.replace(tmp, path)
+
+
+def update_progress(session_path: str, journal_root: Optional[str] = None) -> Dict:
+    """Calcula la fila de una sesión y la guarda en la tabla de su paciente."""
+    row = summarize_session(session_path, journal_root)
+    patient_dir = os.path.dirname(os.path.abspath(session_path))
+    with _lock:
+        rows = _read_table(patient_dir)
+        rows[row["session"]] = row
+        _write_table(patient_dir, rows)
+    return row
+
+
+def summarize_async(session_path: str, delay_s: float = 1.0,
+                    journal_root: Optional[str] = None) -> threading.Thread:
+    """update_progress() en segundo plano, tras dar tiempo al diario a volcar sus lotes."""
+    def run():
+        time.sleep(delay_s)
+        try:
+            update_progress(session_path, journal_root)
+        except Exception as ex:
+            print(f"[summary] {session_path}: {ex}")
+    th = threading.Thread(target=run, name="session-summary", daemon=True)
+    th.start()
+    return th
+
+
+def load_progress(patient_id: str, root: str = SESSIONS_DIR) -> List[Dict]:
+    """Filas de resumen del paciente ordenadas por inicio (sin tocar la señal)."""
+    path = _progress_path(os.path.join(root, patient_id))
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return []
+    hit = _cache.get(path)
+    if hit is None or hit[0] != mtime:
+        rows = sorted(_read_table(os.path.dirname(path)).values(), key=lambda r: r.get("start_time", 0.0))
+        hit = _cache[path] = (mtime, rows)
+    return hit[1]
+
+
+def stale_sessions(root: str = SESSIONS_DIR) -> List[str]:
+    """Sesiones sin fila o con una fila de otra SUMMARY_VERSION (las abiertas no cuentan)."""
+    out = []
+    if not os.path.isdir(root):
+        return out
+    for patient in sorted(os.listdir(root)):
+        pdir = os.path.join(root, patient)
+        if not os.path.isdir(pdir):
+            continue
+        rows = _read_table(pdir)
+        for s in list_sessions(patient, root):
+            row = rows.get(os.path.basename(s))
+            if row is not None and row.get("version") == SUMMARY_VERSION:
+                continue
+            try:
+                with open(os.path.join(s, META_FILE), encoding="utf-8") as f:
+                    if "end_time" not in json.load(f):
+                        continue           # aún grabando: se resume al cerrar
+            except (OSError, ValueError):
+                continue
+            out.append(s)
+    return out
+
+
+def refresh_stale(root: str = SESSIONS_DIR, journal_root: Optional[str] = None,
+                  background: bool = True):
+    """Recalcula las filas que falten o estén desactualizadas (una sesión cada vez)."""
+    def run():
+        n = 0
+        for s in stale_sessions(root):
+            try:
+                update_progress(s, journal_root)
+                n += 1
+            except Exception as ex:
+                print(f"[summary] {s}: {ex}")
+        if n:
+            print(f"[summary] {n} resumen(es) de sesión actualizados")
+        return n
+    if not background:
+        return run()
+    th = threading.Thread(target=run, name="summary-refresh", daemon=True)
+    th.start()
+    return th
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Resúmenes por sesión (progreso del paciente)")
+    ap.add_argument("patient", nargs="?", help="id de paciente (muestra su tabla)")
+    ap.add_argument("--root", default=SESSIONS_DIR)
+    ap.add_argument("--refresh", action="store_true", help="recalcula filas faltantes o desactualizadas")
+    a = ap.parse_args(argv)
+
+    if a.refresh:
+        t = time.perf_counter()
+        n = refresh_stale(a.root, background=False)
+        print(f"{n} sesión(es) resumidas en {time.perf_counter() - t:.2f} s")
+    if a.patient:
+        t = time.perf_counter()
+        rows = load_progress(a.patient, a.root)
+        dt = (time.perf_counter() - t) * 1000
+        for r in rows:
+            rt = r["routines"]
+            print(f"{r['session']}  {r['duration_s']:7.0f} s  RMS pico {max(r['peak_rms_mV'] or [0]):6.3f} mV  "
+                  f"MDF {r['fatigue_slope_hz_min']} Hz/min  rutinas {rt['completed']}/{rt['runs']}  "
+                  f"rango {r['active_range_s']}")
+        print(f"{len(rows)} sesión(es) leídas en {dt:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
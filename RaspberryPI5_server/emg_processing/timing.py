@@ -0,0 +1,216 @@
+from __future__ import annotations
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+COUNTER_BITS = 16          # el firmware envía el contador de muestras módulo 2^16
+MAX_GAP_S = 0.25           # salto de contador máximo que se acepta como muestras perdidas
+RESYNC_LINES = 3           # líneas seguidas y coherentes para aceptar un reinicio o corte largo
+
+
+class ClockSync:
+    """
+    Mapea ticks del microcontrolador (contador de muestras) a tiempo
+    monotónico del host.
+
+    - split(): contador de 16 bits -> ticks absolutos (int64) por tramos.
+      Un paso de +1 se acepta al momento. Cualquier otro salto queda en
+      espera hasta que la línea siguiente lo continúe con +1: si es de hasta
+      max_gap_s son muestras perdidas; si es mayor o hacia atrás (reinicio
+      del micro o corte largo) hacen falta RESYNC_LINES líneas seguidas y
+      empieza un tramo nuevo con el ajuste reiniciado. Una línea que nadie
+      continúa es corrupta y se descarta (no inventa huecos).
+    - observe(): añade pares (tick, t_host) de un bloque a una ventana
+      deslizante y ajusta t_host = t0 + period * tick por mínimos cuadrados.
+      Las sumas se mantienen por bloque (entra uno, salen los viejos).
+    - to_host(): ticks -> segundos del host, vectorizado.
+    - fill_gaps(): rellena ticks perdidos (también entre bloques) por
+      interpolación lineal.
+
+    El retardo USB sólo puede sumar, así que tras el ajuste el intercepto se
+    lleva al mínimo residuo de la ventana (envolvente inferior).
+    """
+
+    def __init__(self, nominal_fs: float, window_s: float = 10.0, bits: int = COUNTER_BITS,
+                 max_gap_s: float = MAX_GAP_S):
+        self.nominal_fs = nominal_fs
+        self.mod = 1 << bits
+        self.max_points = max(16, int(window_s * nominal_fs))
+        self.max_jump = max(1, min(self.mod // 2, int(max_gap_s * nominal_fs)))
+        self.dropped = 0
+        self.rejected = 0                    # líneas descartadas por contador incoherente
+        self.resets = 0
+        self._init_state()
+
+    def _init_state(self):
+        self._last_raw: Optional[int] = None
+        self._last_tick = 0
+        self._cand: List[Tuple[int, np.ndarray]] = []   # (crudo, fila) pendientes de confirmar
+        self._init_fit()
+
+    def _init_fit(self):
+        self._blocks: deque = deque()        # (x, y) centrados en _ref
+        self._n = 0
+        self._sums = np.zeros(4)             # sx, sy, sxx, sxy
+        self._ref: Optional[Tuple[int, float]] = None
+        self._tail: Optional[Tuple[int, np.ndarray]] = None
+        self.period = 1.0 / self.nominal_fs
+        self.t0 = 0.0
+
+    def reset(self):
+        """Reconexión: olvida contador y ajuste."""
+        self._init_state()
+        self.resets += 1
+
+    def restart(self):
+        """Tramo nuevo de split(): el contador ya está resincronizado, se reinicia el ajuste."""
+        self._init_fit()
+        self.resets += 1
+
+    # ------------------------ contador --------------------------------------
+    def split(self, raw: np.ndarray, values: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray, bool]]:
+        """
+        Contador crudo [n] + filas [n, k] -> [(ticks int64, filas, reinicio)],
+        en orden. Cada tramo tiene ticks crecientes; con reinicio=True hay
+        que llamar a restart() antes de observe()/fill_gaps() de ese tramo.
+        Las filas de líneas en espera se guardan y salen en una llamada
+        posterior; las de líneas corruptas se descartan ('rejected').
+        """
+        raw = np.asarray(raw, dtype=np.int64)
+        values = np.asarray(values)
+        if raw.size == 0:
+            return []
+        if self._last_raw is not None and not self._cand:
+            if np.all(np.diff(np.concatenate([[self._last_raw], raw])) % self.mod == 1):   # caso normal
+                ticks = self._last_tick + 1 + np.arange(raw.size)
+                self._last_raw, self._last_tick = int(raw[-1]), int(ticks[-1])
+                return [(ticks, values, False)]
+
+        out: List[Tuple[np.ndarray, np.ndarray, bool]] = []
+        seg: List[Tuple[int, np.ndarray]] = []
+        restart = False
+
+        def close():
+            if seg:
+                out.append((np.array([t for t, _ in seg], dtype=np.int64),
+                            np.stack([v for _, v in seg]), restart))
+
+        for r, v in zip(raw.tolist(), values):
+            if self._last_raw is None:                           # primera línea tras conectar
+                self._last_raw = self._last_tick = r
+                seg.append((r, v))
+                continue
+            if self._cand:
+                if (r - self._cand[-1][0]) % self.mod == 1:
+                    self._cand.append((r, v))
+                    head = (self._cand[0][0] - self._last_raw) % self.mod
+                    small = head <= self.max_jump
+                    if len(self._cand) < (2 if small else RESYNC_LINES):
+                        continue
+                    if small:                                    # muestras perdidas de verdad
+                        tick = self._last_tick
+                        prev = self._last_raw
+                    else:                                        # reinicio o corte largo: tramo nuevo
+                        close()
+                        seg, restart = [], True
+                        tick = prev = self._cand[0][0]
+                        tick -= 1; prev -= 1
+                    for c, cv in self._cand:
+                        tick += (c - prev) % self.mod
+                        prev = c
+                        seg.append((tick, cv))
+                    self._last_raw, self._last_tick = r, tick
+                    self._cand = []
+                    continue
+                self.rejected += len(self._cand)                 # nadie la continuó: corrupta
+                self._cand = []
+            step = (r - self._last_raw) % self.mod
+            if step == 1:
+                self._last_raw, self._last_tick = r, self._last_tick + 1
+                seg.append((self._last_tick, v))
+            elif step == 0:                                      # repetida
+                self.rejected += 1
+            else:
+                self._cand = [(r, v)]
+        close()
+        return out
+
+    # ------------------------ ajuste reloj ----------------------------------
+    def _add(self, x: np.ndarray, y: np.ndarray, sign: float):
+        self._sums += sign * np.array([x.sum(), y.sum(), (x * x).sum(), (x * y).sum()])
+        self._n += int(sign) * x.size
+
+    def observe(self, ticks: np.ndarray, t_host: np.ndarray):
+        ticks = np.asarray(ticks, dtype=np.int64)
+        t_host = np.asarray(t_host, dtype=np.float64)
+        if ticks.size == 0:
+            return
+        if self._ref is None or ticks[-1] - self._ref[0] > 4 * self.max_points:
+            self._rebase(int(ticks[0]), float(t_host[0]))
+        k0, h0 = self._ref
+        x, y = (ticks - k0).astype(np.float64), t_host - h0
+        self._blocks.append((x, y)); self._add(x, y, 1.0)
+        while self._n - self._blocks[0][0].size >= self.max_points:
+            self._add(*self._blocks.popleft(), -1.0)
+
+        sx, sy, sxx, sxy = self._sums
+        n = self._n
+        den = n * sxx - sx * sx
+        if n >= 2 and den > 0:
+            slope = (n * sxy - sx * sy) / den
+            # Rechaza pendientes absurdas (>5 % de la nominal) con pocos puntos
+            if abs(slope * self.nominal_fs - 1.0) < 0.05:
+                self.period = slope
+        icpt = (sy - self.period * sx) / n
+        xs = np.concatenate([b[0] for b in self._blocks])
+        ys = np.concatenate([b[1] for b in self._blocks])
+        icpt += float(np.min(ys - (icpt + self.period * xs)))
+        self.t0 = h0 + icpt - self.period * k0       # t_host(tick) = t0 + period * tick
+
+    def _rebase(self, k0: int, h0: float):
+        """Cambia la referencia de centrado para que las sumas no pierdan precisión."""
+        old = self._ref
+        blocks = list(self._blocks)
+        self._ref = (k0, h0)
+        self._blocks.clear(); self._sums[:] = 0.0; self._n = 0
+        if old is not None:
+            for x, y in blocks:
+                self._blocks.append((x + (old[0] - k0), y + (old[1] - h0)))
+                self._add(*self._blocks[-1], 1.0)
+
+    def to_host(self, ticks: np.ndarray) -> np.ndarray:
+        return self.t0 + self.period * np.asarray(ticks, dtype=np.float64)
+
+    @property
+    def drift_ppm(self) -> float:
+        return (self.period * self.nominal_fs - 1.0) * 1e6
+
+    # ------------------------ huecos ----------------------------------------
+    def fill_gaps(self, ticks: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        ticks [n] + valores [n, ch] -> (ticks contiguos, valores interpolados,
+        máscara de muestras inventadas). Usa la última muestra del bloque
+        anterior para cubrir huecos en la frontera. Actualiza 'dropped'.
+        """
+        ticks = np.asarray(ticks, dtype=np.int64)
+        values = np.asarray(values)
+        if ticks.size == 0:
+            return ticks, values, np.zeros(0, dtype=bool)
+        keep = np.concatenate([[True], np.diff(ticks) > 0])     # fuera duplicados
+        ticks, values = ticks[keep], values[keep]
+        src_t, src_v = ticks, values
+        if self._tail is not None and self._tail[0] < ticks[0]:
+            src_t = np.concatenate([[self._tail[0]], ticks])
+            src_v = np.vstack([self._tail[1][None, :], values])
+        self._tail = (int(ticks[-1]), values[-1].copy())
+        first = int(src_t[0]) + (1 if src_t is not ticks else 0)
+        full = np.arange(first, int(ticks[-1]) + 1, dtype=np.int64)
+        if full.size == ticks.size:
+            return ticks, values, np.zeros(ticks.size, dtype=bool)
+        out = np.empty((full.size, values.shape[1]), dtype=values.dtype)
+        for ch in range(values.shape[1]):
+            out[:, ch] = np.interp(full, src_t, src_v[:, ch])
+        filled = ~np.isin(full, ticks)
+        self.dropped += int(filled.sum())
+        return full, out, filled
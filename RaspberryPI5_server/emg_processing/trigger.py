@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Captura por disparo (tipo osciloscopio) sobre el EMG en mV.
+
+- Señal de disparo por canal: la muestra tal cual ('threshold') o la
+  envolvente |x| promediada en 'env_s' ('envelope', mejor para EMG).
+- Flanco de subida: la señal cruza 'level_mV' hacia arriba en cualquiera de
+  los canales vigilados; después se ignoran flancos durante 'holdoff_s'
+  (y mientras se completa el post-disparo).
+- Cada disparo produce un segmento fijo de pre_s + post_s: el pre sale de
+  un anillo con las últimas muestras, el post se completa con los bloques
+  siguientes.
+
+La detección es vectorizada por bloque y sólo se recorre en Python la
+lista de flancos candidatos, así que el coste depende del número de
+eventos y no de la duración de la sesión.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class TriggerConfig:
+    level_mV: float = 0.5
+    mode: str = "envelope"                     # "envelope" | "threshold"
+    channels: Optional[Sequence[int]] = None   # None = cualquiera
+    pre_s: float = 0.5
+    post_s: float = 1.5
+    holdoff_s: float = 0.5
+    env_s: float = 0.05
+
+
+@dataclass
+class TriggerSegment:
+    sample: int                # índice absoluto de la muestra de disparo
+    channel: int               # canal que disparó
+    pre: int                   # muestras antes del disparo dentro de 'data'
+    data: np.ndarray           # [pre + post, canales] mV
+    t_wall: float = 0.0        # instante (time.time) del disparo, lo pone quien llama
+    relay_events: Optional[list] = None
+
+
+class TriggeredCapture:
+    def __init__(self, fs: float, channels: int, config: Optional[TriggerConfig] = None):
+        self.fs, self.channels = fs, channels
+        self.cfg = config or TriggerConfig()
+        if self.cfg.mode not in ("envelope", "threshold"):
+            raise ValueError(f"modo de disparo desconocido: {self.cfg.mode}")
+        self.pre_n = max(1, int(round(self.cfg.pre_s * fs)))
+        self.post_n = max(1, int(round(self.cfg.post_s * fs)))
+        self.holdoff_n = max(self.post_n, int(round(self.cfg.holdoff_s * fs)))
+        self.env_n = max(1, int(round(self.cfg.env_s * fs)))
+        sel = self.cfg.channels
+        self._sel = np.arange(channels) if sel is None else np.asarray(sel, dtype=int)
+        self.reset()
+
+    def reset(self):
+        self._n = 0                                    # índice absoluto de la próxima muestra
+        self._ring = np.zeros((self.pre_n, self.channels), dtype=np.float32)
+        self._abs_tail = np.zeros((self.env_n - 1, self._sel.size))
+        self._prev_above = np.zeros(self._sel.size, dtype=bool)
+        self._armed_at = 0                             # primer índice en que se puede disparar
+        self._pending: List[TriggerSegment] = []       # segmentos esperando post-disparo
+        self.count = 0
+
+    def _trigger_signal(self, x: np.ndarray) -> np.ndarray:
+        xs = x[:, self._sel].astype(np.float64)
+        if self.cfg.mode == "threshold":
+            return xs
+        a = np.vstack([self._abs_tail, np.abs(xs)])
+        c = np.cumsum(np.vstack([np.zeros((1, a.shape[1])), a]), axis=0)
+        env = (c[self.env_n:] - c[:-self.env_n]) / self.env_n
+        self._abs_tail = a[a.shape[0] - (self.env_n - 1):]
+        return env
+
+    def update(self, x: np.ndarray, mask: Optional[np.ndarray] = None) -> List[TriggerSegment]:
+        """
+        x: [n, canales] mV. Devuelve los segmentos completados en este bloque.
+        Un canal fuera de 'mask' (bool [canales]) no dispara: un electrodo
+        suelto en el raíl no es una contracción.
+        """
+        x = np.asarray(x, dtype=np.float32)
+        n = x.shape[0]
+        if n == 0:
+            return []
+        base = self._n
+        hist = np.vstack([self._ring, x])              # pre-disparo disponible + bloque
+
+        # 1) completar segmentos pendientes
+        done = []
+        for seg in self._pending:
+            filled = seg.pre + (base - seg.sample)
+            take = min(n, seg.data.shape[0] - filled)
+            seg.data[filled:filled + take] = x[:take]
+            if filled + take == seg.data.shape[0]:
+                done.append(seg)
+
+        # 2) flancos de subida (vectorizado); sólo se iteran los candidatos
+        above = self._trigger_signal(x) >= self.cfg.level_mV
+        if mask is not None:
+            above &= np.asarray(mask, dtype=bool)[self._sel]
+        prev = np.vstack([self._prev_above[None, :], above[:-1]])
+        rows, cols = np.nonzero(above & ~prev)
+        self._prev_above = above[-1]
+        for r in np.unique(rows):
+            idx = base + int(r)
+            if idx < self._armed_at:
+                continue
+            ch = int(self._sel[cols[rows == r][0]])
+            seg = TriggerSegment(sample=idx, channel=ch, pre=self.pre_n,
+                                 data=np.zeros((self.pre_n + self.post_n, self.channels), dtype=np.float32))
+            h = self.pre_n + int(r)                  # posición del disparo en 'hist'
+            seg.data[:self.pre_n] = hist[h - self.pre_n:h]
+            take = min(self.post_n, n - int(r))
+            seg.data[self.pre_n:self.pre_n + take] = x[int(r):int(r) + take]
+            if take == self.post_n:
+                done.append(seg)
+            else:
+                self._pending.append(seg)
+            self._armed_at = idx + self.holdoff_n
+            self.count += 1
+
+        closed = {id(s) for s in done}
+        self._pending = [s for s in self._pending if id(s) not in closed]
+        self._ring = hist[-self.pre_n:].copy()
+        self._n += n
+        return done
@@ -1,29 +1,110 @@
 # main_window.py
 from __future__ import annotations
+import errno
+import importlib
+import os
 import threading
 import time
 import socket
+from collections import deque
 from dataclasses import dataclass
 from typing import List, Dict, Optional, Callable
-import flet as ft
-from flet import canvas as cv
-import webbrowser
 
 # ================= CONFIG (Raspberry Pi 5) =================
 HOST = "169.254.69.170"   # IP fija de la Pi
 START_PORT = 5000
 ASSETS_DIR = "assets"
 OPEN_BROWSER_ON_SERVER = True
+LOG_MAX_LINES = 200       # líneas visibles en la bitácora
+DAEMON_WAIT_S = 20.0      # con EXO_REQUIRE_DAEMON=1 (run.sh): espera máxima al daemon
 # ===========================================================
 
-def _find_free_port(host: str, start_port: int, tries: int = 50) -> int:
+# ---------------------- Arranque rápido -------------------------------------
+class _LazyModule:
+    """Importa el módulo real en el primer acceso a un atributo."""
+    def __init__(self, name: str):
+        self._name = name
+        self._mod = None
+
+    def __getattr__(self, attr):
+        if self._mod is None:
+            self._mod = importlib.import_module(self._name)
+        return getattr(self._mod, attr)
+
+# flet/canvas pesan ~0.5 s en la Pi: se importan cuando se usan por primera vez
+ft = _LazyModule("flet")
+cv = _LazyModule("flet.canvas")
+
+class StartupTimer:
+    """Acumula la duración de cada fase del arranque para imprimir un desglose."""
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def timed(self, name: str, fn: Callable[[], object]):
+        t = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self.phases.append((name, time.perf_counter() - t))
+
+    def report(self, final_phase: str):
+        with self._lock:
+            if self._reported:
+                return
+            self._reported = True
+            total = time.perf_counter() - self.t0
+            print("\n[Arranque] desglose:")
+            for name, dt in self.phases:
+                print(f" - {name:<28} {dt*1000:8.1f} ms")
+            print(f" - {final_phase:<28} {total*1000:8.1f} ms (total desde inicio)")
+
+_startup = StartupTimer()
+
+def _bind_port(host: str, start_port: int, tries: int = 50) -> socket.socket:
+    """
+    Abre el socket de escucha con bind() directo (microsegundos por intento,
+    sin connect() ni timeouts) y lo conserva: el servidor web arranca sobre
+    este mismo socket (_serve), así que nadie puede ocupar el puerto entre
+    la búsqueda y el arranque. SO_REUSEADDR sólo permite reutilizar un
+    puerto en TIME_WAIT tras un reinicio, no uno con otro servidor escuchando.
+    """
     for p in range(start_port, start_port + tries):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(0.15)
-            if s.connect_ex((host, p)) != 0:
-                return p
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind((host, p))
+        except OSError as ex:
+            s.close()
+            if ex.errno != errno.EADDRINUSE:
+                raise
+            continue
+        s.listen(128)
+        return s
     raise RuntimeError("No hay puertos libres en el rango solicitado.")
 
+def _asgi_app():
+    """
+    App web de flet como ASGI para servirla sobre el socket ya abierto.
+    Necesita uvicorn y flet-web (pip install uvicorn flet-web); sin ellos
+    devuelve None y el lanzador vuelve al ft.app(host, port) de siempre.
+    """
+    try:
+        import uvicorn  # noqa: F401
+        import flet_web  # noqa: F401
+    except ImportError:
+        return None
+    assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), ASSETS_DIR)
+    return ft.app(target=window_main, assets_dir=assets, export_asgi_app=True)
+
+def _serve(sock: socket.socket, asgi):
+    """Sirve la app ASGI con uvicorn sobre el socket ya abierto."""
+    import uvicorn
+    uvicorn.Server(uvicorn.Config(asgi, log_level="warning")).run(sockets=[sock])
+
 # ---------------------- Datos usuarios/pacientes -----------------------------
 @dataclass
 class User:
@@ -62,218 +143,394 @@ def sample_patients_by_user() -> Dict[str, List[Patient]]:
         "U-004": [],
     }
 
-# ---------------------- BottomSheets usuarios/pacientes ----------------------
-def open_users_sheet(page: ft.Page, on_user_selected: Callable[[User], None]):
-    data = sample_users()
-
-    detail_title = ft.Text("Selecciona un usuario", size=18, weight=ft.FontWeight.BOLD)
-    detail_col = ft.Column([detail_title, ft.Divider(), ft.Text("—", selectable=True)], spacing=8, expand=True)
-    detail_container = ft.Container(
-        content=detail_col, padding=12,
-        bgcolor=ft.Colors.with_opacity(0.04, ft.Colors.WHITE),
-        border_radius=8, expand=True
-    )
-
-    def show_detail(u: User):
-        detail_col.controls = [
-            ft.Text(f"Usuario: {u.nombre}", size=18, weight=ft.FontWeight.BOLD),
-            ft.Divider(),
-            ft.Row([ft.Text("ID:", weight=ft.FontWeight.BOLD), ft.Text(u.user_id)]),
-            ft.Row([ft.Text("Correo:", weight=ft.FontWeight.BOLD), ft.Text(u.correo or "—")]),
-            ft.Row([ft.Text("Teléfono:", weight=ft.FontWeight.BOLD), ft.Text(u.telefono or "—")]),
-            ft.Text("Notas:", weight=ft.FontWeight.BOLD),
-            ft.Container(
-                content=ft.Text(u.notas or "—", selectable=True),
-                padding=ft.Padding(8, 6, 8, 6),
-                bgcolor=ft.Colors.with_opacity(0.06, ft.Colors.WHITE),
-                border_radius=8,
-            ),
-        ]
-        detail_title.value = f"{u.nombre}"; page.update()
-
-    list_panel = ft.ListView(spacing=2, expand=True, auto_scroll=False)
-    items_state = []
-
-    def recolor(container: ft.Container, selected: bool, hover: bool):
-        if selected:
-            container.bgcolor = ft.Colors.with_opacity(0.45, ft.Colors.PURPLE_200)
-        else:
-            container.bgcolor = ft.Colors.with_opacity(0.18, ft.Colors.WHITE) if hover else ft.Colors.with_opacity(0.08, ft.Colors.WHITE)
-
-    def on_click_factory(item):
-        def _clk(e):
-            for st in items_state:
-                st["selected"] = False
-                recolor(st["ctrl"], False, False)
-            item["selected"] = True
-            recolor(item["ctrl"], True, False)
-            on_user_selected(item["user"])
-            show_detail(item["user"])
-        return _clk
-
-    def on_hover_factory(item):
-        def _hv(e: ft.HoverEvent):
-            if not item["selected"]:
-                recolor(item["ctrl"], False, (e.data == "true")); page.update()
-        return _hv
-
-    header = ft.Container(
-        content=ft.Row([ft.Text("Usuarios", weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)]),
-        padding=ft.Padding(10, 8, 10, 8),
-        bgcolor=ft.Colors.with_opacity(0.16, ft.Colors.WHITE),
-    )
-    list_panel.controls.append(header)
-
-    search = ft.TextField(hint_text="Buscar…", prefix_icon=ft.Icons.SEARCH, width=260,
-                          on_change=lambda e: apply_filter())
-    list_panel.controls.append(ft.Container(content=search, padding=ft.Padding(8, 8, 8, 4)))
+# ---------------------- Lista virtualizada ---------------------------------
+class VirtualList:
+    """
+    Lista con altura de fila fija que sólo construye controles para las filas
+    visibles + un pequeño buffer. Al hacer scroll se reutilizan los mismos
+    contenedores (sólo cambian texto/color) y dos espaciadores ocupan el alto
+    de las filas no construidas, así que el número de controles enviados al
+    cliente no depende del tamaño de la lista.
+    """
+
+    def __init__(self, page: ft.Page, label_of: Callable[[object], str],
+                 key_of: Callable[[object], str], on_select: Callable[[object], None],
+                 accent=None, row_height: int = 36,
+                 viewport_rows: int = 14, buffer_rows: int = 6):
+        self.page = page
+        self.label_of, self.key_of, self.on_select = label_of, key_of, on_select
+        self.accent = accent or ft.Colors.PURPLE_200
+        self.row_h = row_height
+        self.buffer = buffer_rows
+        self.items: list = []
+        self.selected_key: Optional[str] = None
+        self._first = -1              # índice del primer registro enlazado al pool
+        self._hover_slot = -1
+
+        self.top_spacer = ft.Container(height=0)
+        self.bottom_spacer = ft.Container(height=0)
+        self.pool: list[dict] = [self._build_slot(i) for i in range(viewport_rows + 2 * buffer_rows)]
+        self.column = ft.Column(
+            [self.top_spacer, *[s["ctrl"] for s in self.pool], self.bottom_spacer],
+            spacing=0, expand=True, scroll=ft.ScrollMode.AUTO,
+            on_scroll=self._on_scroll, on_scroll_interval=40,
+        )
 
-    def build_item(u: User):
-        name = ft.Text(u.nombre, color=ft.Colors.WHITE, size=13)
+    # ------------------------ construcción del pool ----------------------
+    def _build_slot(self, i: int) -> dict:
+        name = ft.Text("", color=ft.Colors.WHITE, size=13)
         cont = ft.Container(
             content=ft.Row([name], alignment=ft.MainAxisAlignment.START),
-            padding=ft.Padding(12, 8, 12, 8),
-            border_radius=4,
-            bgcolor=ft.Colors.with_opacity(0.08, ft.Colors.WHITE),
-            ink=True,
+            padding=ft.Padding(12, 8, 12, 8), border_radius=4,
+            height=self.row_h - 2, margin=ft.Margin(0, 0, 0, 2),
+            bgcolor=ft.Colors.with_opacity(0.08, ft.Colors.WHITE), ink=True, visible=False,
         )
-        state = {"ctrl": cont, "user": u, "selected": False}
-        cont.on_click = on_click_factory(state)
-        cont.on_hover = on_hover_factory(state)
-        items_state.append(state)
-        return cont
-
-    list_panel.controls.extend([build_item(u) for u in data])
-
-    def apply_filter():
-        term = (search.value or "").strip().lower()
-        list_panel.controls = list_panel.controls[:2]
-        for st in items_state:
-            u = st["user"]
-            if (not term) or (term in u.nombre.lower()) or (term in u.user_id.lower()):
-                list_panel.controls.append(st["ctrl"])
-        page.update()
+        slot = {"ctrl": cont, "text": name, "idx": -1}
+        cont.on_click = lambda e, i=i: self._click(i)
+        cont.on_hover = lambda e, i=i: self._hover(i, e.data == "true")
+        return slot
+
+    def _recolor(self, slot: dict, hover: bool = False):
+        item = self.items[slot["idx"]] if 0 <= slot["idx"] < len(self.items) else None
+        if item is not None and self.key_of(item) == self.selected_key:
+            slot["ctrl"].bgcolor = ft.Colors.with_opacity(0.45, self.accent)
+        else:
+            slot["ctrl"].bgcolor = ft.Colors.with_opacity(0.18 if hover else 0.08, ft.Colors.WHITE)
+
+    # ------------------------ API pública --------------------------------
+    def set_items(self, items: list):
+        """Sustituye los registros (p.ej. tras filtrar) y vuelve al inicio."""
+        self.items = items
+        self._first = -1
+        self._bind(0)
+        try:
+            self.column.scroll_to(offset=0, duration=0)
+        except Exception:
+            pass  # aún no está montada en la página
+
+    # ------------------------ eventos ------------------------------------
+    def _on_scroll(self, e: ft.OnScrollEvent):
+        first = max(0, int(e.pixels // self.row_h) - self.buffer)
+        if first != self._first:
+            self._bind(first)
+            self.page.update()
+
+    def _click(self, i: int):
+        slot = self.pool[i]
+        if not (0 <= slot["idx"] < len(self.items)):
+            return
+        item = self.items[slot["idx"]]
+        self.selected_key = self.key_of(item)
+        for s in self.pool:
+            self._recolor(s)
+        self.on_select(item)
+
+    def _hover(self, i: int, hover: bool):
+        self._recolor(self.pool[i], hover)
+        self.page.update()
 
-    sheet_content = ft.Container(
-        content=ft.Row([ft.Container(list_panel, width=300, padding=8), detail_container], spacing=12),
-        padding=12, width=860, bgcolor=ft.Colors.BLUE_GREY_900
-    )
-    bs = ft.BottomSheet(content=sheet_content, open=True, show_drag_handle=True, is_scroll_controlled=True)
-    page.overlay.append(bs); bs.open = True; page.update()
-
-def open_patients_sheet(page: ft.Page, selected_user: Optional[User], on_patient_selected: Callable[[Patient], None]):
-    if not selected_user:
-        page.snack_bar = ft.SnackBar(ft.Text("Selecciona un usuario primero."), bgcolor=ft.Colors.RED_700)
-        page.snack_bar.open = True; page.update(); return
-
-    mapping = sample_patients_by_user()
-    patients = mapping.get(selected_user.user_id, [])
-
-    detail_title = ft.Text("Selecciona un paciente", size=18, weight=ft.FontWeight.BOLD)
-    detail_col = ft.Column([detail_title, ft.Divider(), ft.Text("—", selectable=True)], spacing=8, expand=True)
-    detail_container = ft.Container(
-        content=detail_col, padding=12,
-        bgcolor=ft.Colors.with_opacity(0.04, ft.Colors.WHITE),
-        border_radius=8, expand=True
-    )
+    # ------------------------ enlace registros -> pool --------------------
+    def _bind(self, first: int):
+        n = len(self.items)
+        first = max(0, min(first, max(0, n - len(self.pool))))
+        self._first = first
+        for k, slot in enumerate(self.pool):
+            idx = first + k
+            if idx < n:
+                slot["idx"] = idx
+                slot["text"].value = self.label_of(self.items[idx])
+                slot["ctrl"].visible = True
+                self._recolor(slot)
+            else:
+                slot["idx"] = -1
+                slot["ctrl"].visible = False
+        shown = min(len(self.pool), max(0, n - first))
+        self.top_spacer.height = first * self.row_h
+        self.bottom_spacer.height = max(0, n - first - shown) * self.row_h
 
-    def show_detail(p: Patient):
-        detail_col.controls = [
-            ft.Text(f"Paciente: {p.nombre}", size=18, weight=ft.FontWeight.BOLD),
-            ft.Divider(),
-            ft.Row([ft.Text("ID:", weight=ft.FontWeight.BOLD), ft.Text(p.patient_id)]),
-            ft.Row([ft.Text("Edad:", weight=ft.FontWeight.BOLD), ft.Text(str(p.edad))]),
-            ft.Row([ft.Text("Diagnóstico:", weight=ft.FontWeight.BOLD), ft.Text(p.diagnostico or "—")]),
-            ft.Text("Notas:", weight=ft.FontWeight.BOLD),
-            ft.Container(
-                content=ft.Text(p.notas or "—", selectable=True),
-                padding=ft.Padding(8, 6, 8, 6),
-                bgcolor=ft.Colors.with_opacity(0.06, ft.Colors.WHITE),
-                border_radius=8,
-            ),
-        ]
-        detail_title.value = f"{p.nombre}"; page.update()
 
-    list_panel = ft.ListView(spacing=2, expand=True, auto_scroll=False)
-    items_state = []
+# ---------------------- BottomSheets usuarios/pacientes ----------------------
+@dataclass(frozen=True)
+class DetailSpec:
+    kind: str                                  # "Usuario" / "Paciente"
+    labels: tuple                              # etiquetas de los campos
+    values_of: Callable[[object], tuple]       # textos de los campos, mismo orden
+    notes_of: Callable[[object], str]
+    history_of: Optional[Callable[[object], List[str]]] = None   # líneas de progreso (sin caché)
+
+def _progress_lines(p: Patient, limit: int = 8) -> List[str]:
+    """Últimas sesiones del paciente desde los resúmenes precalculados (summary.py)."""
+    from RaspberryPI5_server.emg_processing.summary import load_progress
+    out = []
+    for r in reversed(load_progress(p.patient_id)[-limit:]):
+        slopes = [v for v in r["fatigue_slope_hz_min"] if v is not None]
+        mdf = f"{sum(slopes) / len(slopes):+.1f} Hz/min" if slopes else "—"
+        rt = r["routines"]
+        rutinas = f"{rt['completed']}/{rt['runs']}" if rt["runs"] else "—"
+        rango = max(r["active_range_s"].values(), default=0.0)
+        out.append(f"{time.strftime('%d/%m/%y %H:%M', time.localtime(r['start_time']))}  "
+                   f"RMS {max(r['peak_rms_mV'], default=0.0):.2f} mV · MDF {mdf} · "
+                   f"rutinas {rutinas} · rango {rango:.1f} s")
+    return out
+
+USER_DETAIL = DetailSpec("Usuario", ("ID:", "Correo:", "Teléfono:"),
+                         lambda u: (u.user_id, u.correo or "—", u.telefono or "—"),
+                         lambda u: u.notas)
+PATIENT_DETAIL = DetailSpec("Paciente", ("ID:", "Edad:", "Diagnóstico:"),
+                            lambda p: (p.patient_id, str(p.edad), p.diagnostico or "—"),
+                            lambda p: p.notas, history_of=_progress_lines)
+
+
+class DetailPanel:
+    """
+    Panel de detalle con controles fijos: elegir otro registro sólo cambia
+    textos (Flet envía únicamente los atributos que cambian). Los textos de
+    cada registro se calculan una vez y quedan en caché por clave; si el
+    registro cambia (otro objeto con otros datos) se recalculan. El
+    progreso (history_of) se relee en cada selección: ya viene resumido.
+    """
+    HISTORY_ROWS = 8
+
+    def __init__(self, spec: DetailSpec, placeholder: str):
+        self.spec = spec
+        self._cache: Dict[str, tuple] = {}     # clave -> (registro, título, valores, notas)
+        self.title = ft.Text(placeholder, size=18, weight=ft.FontWeight.BOLD)
+        self.values = [ft.Text("—") for _ in spec.labels]
+        self.notes = ft.Text("—", selectable=True)
+        # Progreso: filas fijas que se rellenan/ocultan (el diff es sólo texto)
+        self.history = [ft.Text("", size=12, visible=False) for _ in range(self.HISTORY_ROWS)]
+        self.history_title = ft.Text("Progreso (últimas sesiones):", weight=ft.FontWeight.BOLD,
+                                     visible=spec.history_of is not None)
+        self.body = ft.Column(
+            [*[ft.Row([ft.Text(lbl, weight=ft.FontWeight.BOLD), v]) for lbl, v in zip(spec.labels, self.values)],
+             ft.Text("Notas:", weight=ft.FontWeight.BOLD),
+             ft.Container(content=self.notes, padding=ft.Padding(8, 6, 8, 6),
+                          bgcolor=ft.Colors.with_opacity(0.06, ft.Colors.WHITE), border_radius=8),
+             self.history_title, *self.history],
+            spacing=8, visible=False)
+        self.column = ft.Column([self.title, ft.Divider(), self.body], spacing=8, expand=True)
+
+    def show(self, key: str, rec, label: str):
+        hit = self._cache.get(key)
+        if hit is None or hit[0] != rec:
+            hit = self._cache[key] = (rec, f"{self.spec.kind}: {label}",
+                                      tuple(self.spec.values_of(rec)), self.spec.notes_of(rec) or "—")
+        _, self.title.value, values, self.notes.value = hit
+        for ctrl, v in zip(self.values, values):
+            ctrl.value = v
+        if self.spec.history_of is not None:
+            try:
+                lines = self.spec.history_of(rec) or ["Sin sesiones resumidas."]
+            except Exception as ex:
+                lines = [f"Progreso no disponible: {ex}"]
+            for i, ctrl in enumerate(self.history):
+                ctrl.visible = i < len(lines)
+                ctrl.value = lines[i] if i < len(lines) else ""
+        self.body.visible = True
+
+    def clear(self, placeholder: str):
+        self.title.value = placeholder
+        self.body.visible = False
+
+
+class RecordSheet:
+    """
+    Hoja común de usuarios/pacientes: lista virtualizada + panel de detalle.
+    Se construye una vez por sesión y queda en page.overlay; abrirla de nuevo
+    sólo cambia 'open' y lo que haya cambiado en los datos (título, filas).
+    """
+    def __init__(self, page: ft.Page, search_hint: str, accent, spec: DetailSpec,
+                 label_of: Callable[[object], str], key_of: Callable[[object], str],
+                 search_keys: Callable[[object], str], on_selected: Callable[[object], None]):
+        self.page = page
+        self.label_of, self.key_of, self.search_keys = label_of, key_of, search_keys
+        self.on_selected = on_selected
+        self._records: Optional[list] = None
+        self._indexed: list = []
+        self._placeholder = ""
+
+        self.detail = DetailPanel(spec, "")
+        self.vlist = VirtualList(page, label_of=label_of, key_of=key_of, on_select=self._on_select, accent=accent)
+        self.title = ft.Text("", weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)
+        header = ft.Container(
+            content=ft.Row([self.title]),
+            padding=ft.Padding(10, 8, 10, 8),
+            bgcolor=ft.Colors.with_opacity(0.16, ft.Colors.WHITE),
+        )
+        self.search = ft.TextField(hint_text=search_hint, prefix_icon=ft.Icons.SEARCH, width=260,
+                                   on_change=lambda e: self._apply_filter(update=True))
+        list_panel = ft.Column(
+            [header, ft.Container(content=self.search, padding=ft.Padding(8, 8, 8, 4)), self.vlist.column],
+            spacing=2, expand=True)
+        detail_container = ft.Container(
+            content=self.detail.column, padding=12,
+            bgcolor=ft.Colors.with_opacity(0.04, ft.Colors.WHITE),
+            border_radius=8, expand=True
+        )
+        sheet_content = ft.Container(
+            content=ft.Row([ft.Container(list_panel, width=300, padding=8), detail_container], spacing=12),
+            padding=12, width=860, bgcolor=ft.Colors.BLUE_GREY_900
+        )
+        self.bs = ft.BottomSheet(content=sheet_content, open=False, show_drag_handle=True,
+                                 is_scroll_controlled=True, on_dismiss=self._on_dismiss)
+        page.overlay.append(self.bs)
+
+    def show(self, title: str, records: list, placeholder: str):
+        self.title.value = title
+        self._placeholder = placeholder
+        self.set_records(records)
+        self.bs.open = True
+        self.page.update()
 
-    def recolor(container: ft.Container, selected: bool, hover: bool):
-        if selected:
-            container.bgcolor = ft.Colors.with_opacity(0.45, ft.Colors.CYAN_200)
-        else:
-            container.bgcolor = ft.Colors.with_opacity(0.18, ft.Colors.WHITE) if hover else ft.Colors.with_opacity(0.08, ft.Colors.WHITE)
-
-    def on_click_factory(item):
-        def _clk(e):
-            for st in items_state:
-                st["selected"] = False
-                recolor(st["ctrl"], False, False)
-            item["selected"] = True
-            recolor(item["ctrl"], True, False)
-            on_patient_selected(item["patient"])
-            show_detail(item["patient"])
-        return _clk
-
-    def on_hover_factory(item):
-        def _hv(e: ft.HoverEvent):
-            if not item["selected"]:
-                recolor(item["ctrl"], False, (e.data == "true")); page.update()
-        return _hv
-
-    header = ft.Container(
-        content=ft.Row([ft.Text(f"Pacientes de {selected_user.nombre}", weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)]),
-        padding=ft.Padding(10, 8, 10, 8), bgcolor=ft.Colors.with_opacity(0.16, ft.Colors.WHITE),
-    )
-    list_panel.controls.append(header)
+    def set_records(self, records: list):
+        """Sin cambios en los datos no se toca la lista (el diff queda vacío)."""
+        if records is self._records or records == self._records:
+            return
+        self._records = records
+        # El texto de búsqueda se precalcula una vez por registro
+        self._indexed = [(rec, self.search_keys(rec).lower()) for rec in records]
+        keys = {self.key_of(r) for r in records}
+        if self.vlist.selected_key not in keys:
+            self.vlist.selected_key = None
+            self.detail.clear(self._placeholder)
+        self._apply_filter(update=False)
+
+    def _apply_filter(self, update: bool):
+        term = (self.search.value or "").strip().lower()
+        self.vlist.set_items([rec for rec, key in self._indexed if (not term) or (term in key)])
+        if update:
+            self.page.update()
+
+    def _on_select(self, rec):
+        self.on_selected(rec)
+        self.detail.show(self.key_of(rec), rec, self.label_of(rec))
+        self.page.update()
 
-    search = ft.TextField(hint_text="Buscar paciente…", prefix_icon=ft.Icons.SEARCH, width=260,
-                          on_change=lambda e: apply_filter())
-    list_panel.controls.append(ft.Container(content=search, padding=ft.Padding(8, 8, 8, 4)))
+    def _on_dismiss(self, e):
+        self.bs.open = False       # el cliente la cerró: que el próximo show() vuelva a enviar open
 
-    def build_item(p: Patient):
-        name = ft.Text(p.nombre, color=ft.Colors.WHITE, size=13)
-        cont = ft.Container(
-            content=ft.Row([name], alignment=ft.MainAxisAlignment.START),
-            padding=ft.Padding(12, 8, 12, 8), border_radius=4,
-            bgcolor=ft.Colors.with_opacity(0.08, ft.Colors.WHITE), ink=True,
-        )
-        state = {"ctrl": cont, "patient": p, "selected": False}
-        cont.on_click = on_click_factory(state); cont.on_hover = on_hover_factory(state)
-        items_state.append(state); return cont
-
-    list_panel.controls.extend([build_item(p) for p in patients])
-
-    def apply_filter():
-        term = (search.value or "").strip().lower()
-        list_panel.controls = list_panel.controls[:2]
-        for st in items_state:
-            p = st["patient"]
-            if (not term) or (term in p.nombre.lower()) or (term in p.patient_id.lower()):
-                list_panel.controls.append(st["ctrl"])
-        page.update()
 
-    sheet_content = ft.Container(
-        content=ft.Row([ft.Container(list_panel, width=300, padding=8), detail_container], spacing=12),
-        padding=12, width=860, bgcolor=ft.Colors.BLUE_GREY_900
-    )
-    bs = ft.BottomSheet(content=sheet_content, open=True, show_drag_handle=True, is_scroll_controlled=True)
-    page.overlay.append(bs); bs.open = True; page.update()
+class RecordSheets:
+    """
+    Hojas de usuarios y pacientes de una sesión: se construyen al primer uso,
+    los datos se leen una vez y después sólo se muestran/ocultan.
+    """
+    def __init__(self, page: ft.Page, on_user_selected: Callable[[User], None],
+                 on_patient_selected: Callable[[Patient], None]):
+        self.page = page
+        self.on_user_selected, self.on_patient_selected = on_user_selected, on_patient_selected
+        self._users: Optional[List[User]] = None
+        self._patients: Optional[Dict[str, List[Patient]]] = None
+        self._users_sheet: Optional[RecordSheet] = None
+        self._patients_sheet: Optional[RecordSheet] = None
+
+    def open_users(self):
+        if self._users_sheet is None:
+            self._users = sample_users()
+            self._users_sheet = RecordSheet(
+                self.page, "Buscar…", ft.Colors.PURPLE_200, USER_DETAIL,
+                label_of=lambda u: u.nombre, key_of=lambda u: u.user_id,
+                search_keys=lambda u: f"{u.nombre}\n{u.user_id}", on_selected=self.on_user_selected)
+        self._users_sheet.show("Usuarios", self._users, "Selecciona un usuario")
+
+    def open_patients(self, selected_user: Optional[User]):
+        if not selected_user:
+            self.page.snack_bar = ft.SnackBar(ft.Text("Selecciona un usuario primero."), bgcolor=ft.Colors.RED_700)
+            self.page.snack_bar.open = True; self.page.update(); return
+        if self._patients_sheet is None:
+            self._patients = sample_patients_by_user()
+            self._patients_sheet = RecordSheet(
+                self.page, "Buscar paciente…", ft.Colors.CYAN_200, PATIENT_DETAIL,
+                label_of=lambda p: p.nombre, key_of=lambda p: p.patient_id,
+                search_keys=lambda p: f"{p.nombre}\n{p.patient_id}", on_selected=self.on_patient_selected)
+        self._patients_sheet.show(f"Pacientes de {selected_user.nombre}",
+                                  self._patients.get(selected_user.user_id, []), "Selecciona un paciente")
 
 # ---------------------- Osciloscopio con flet.canvas ------------------------
+class WindowMinMax:
+    """
+    Mínimo y máximo de las últimas 'window' muestras con deques monótonas:
+    cada muestra entra y sale una sola vez (O(1) amortizado), sin reescanear.
+    """
+    def __init__(self, window: int):
+        self.window = window
+        self._n = 0                          # índice absoluto de la próxima muestra
+        self._min: deque = deque()           # (índice, valor) crecientes en valor
+        self._max: deque = deque()           # (índice, valor) decrecientes en valor
+
+    def reset(self):
+        self._n = 0
+        self._min.clear(); self._max.clear()
+
+    def push(self, values):
+        for v in values:
+            while self._min and self._min[-1][1] >= v:
+                self._min.pop()
+            while self._max and self._max[-1][1] <= v:
+                self._max.pop()
+            self._min.append((self._n, v)); self._max.append((self._n, v))
+            self._n += 1
+        old = self._n - self.window
+        while self._min and self._min[0][0] < old:
+            self._min.popleft()
+        while self._max and self._max[0][0] < old:
+            self._max.popleft()
+
+    @property
+    def seen(self) -> int:
+        return self._n
+
+    @property
+    def bounds(self) -> tuple[float, float] | None:
+        if not self._min:
+            return None
+        return self._min[0][1], self._max[0][1]
+
+
 class Scope:
-    def __init__(self, title: str, width=950, height=280, y_range_mV=6.0):
+    """
+    Osciloscopio de un canal. La transformación muestra -> píxel es una sola
+    operación numpy y las coordenadas se cuantizan a 'quantum' píxeles (0.5
+    por defecto); los puntos repetidos tras cuantizar no se envían.
+
+    Con auto_range=True la escala vertical (simétrica respecto a 0) sigue el
+    mín/máx de la ventana visible: crece al instante y se encoge despacio,
+    entre min_range_mV y y_range_mV.
+
+    show_segment() congela la vista en un segmento de disparo (con marca
+    en el instante del disparo) hasta unfreeze().
+    """
+    def __init__(self, title: str, width=950, height=280, y_range_mV=6.0,
+                 auto_range: bool = False, min_range_mV: float = 0.2, quantum: float = 0.5):
         self.w, self.h = width, height
-        self.y_range = y_range_mV
+        self.y_range = self.max_range = y_range_mV
+        self.auto_range, self.min_range = auto_range, min_range_mV
+        self.quantum = quantum
+        self.frozen = False
+        self._tracker: WindowMinMax | None = None
         self.title_lbl = ft.Text(title, weight=ft.FontWeight.BOLD)
+        self.quality_lbl = ft.Text("", size=12, color=ft.Colors.GREY_400)
+        self.range_lbl = ft.Text("", size=12, color=ft.Colors.GREY_500)
+        self._quality: tuple | None = None
         self.canvas = cv.Canvas(width=self.w, height=self.h)
         self.container = ft.Column(
-            [self.title_lbl,
+            [ft.Row([self.title_lbl, self.quality_lbl, self.range_lbl], spacing=10),
              ft.Container(self.canvas, border_radius=12,
                           bgcolor=ft.Colors.with_opacity(0.04, ft.Colors.WHITE), padding=6)],
             spacing=6, expand=True)
+        self._grid = self._grid_shapes()
         self._draw_frame()
 
-    def _draw_frame(self):
+    def set_quality(self, label: str, ok: bool):
+        """Estado de calidad del canal junto al título (sólo cambia si es distinto)."""
+        if self._quality == (label, ok):
+            return
+        self._quality = (label, ok)
+        self.quality_lbl.value = f"● {label}"
+        self.quality_lbl.color = ft.Colors.GREEN_300 if ok else ft.Colors.RED_300
+
+    def _grid_shapes(self) -> list:
+        """Fondo + rejilla: no dependen de los datos, se construyen una vez."""
         shapes: list = [
             cv.Rect(0, 0, self.w, self.h, paint=ft.Paint(color=ft.Colors.BLUE_GREY_800,
                                                          style=ft.PaintingStyle.FILL))
@@ -285,10 +542,12 @@ class Scope:
         for j in range(0, 9):
             y = int(j * (self.h-2) / 8) + 1
             shapes.append(cv.Line(1, y, self.w-1, y, paint=ft.Paint(color=grid_color, stroke_width=1)))
+        return shapes
+
+    def _draw_frame(self):
         baseline_y = self._map_y(0.0)
-        shapes.append(cv.Line(1, baseline_y, self.w-1, baseline_y,
-                              paint=ft.Paint(color=ft.Colors.AMBER, stroke_width=1)))
-        self.canvas.shapes = shapes
+        self.canvas.shapes = self._grid + [
+            cv.Line(1, baseline_y, self.w-1, baseline_y, paint=ft.Paint(color=ft.Colors.AMBER, stroke_width=1))]
 
     def _map_y(self, mV: float) -> float:
         half = self.y_range / 2.0
@@ -296,50 +555,176 @@ class Scope:
         norm = (mV_clamped + half) / (self.y_range)   # 0..1
         return (1 - norm) * (self.h-2) + 1
 
-    def update_wave(self, t: list[float], y: list[float], color=ft.Colors.AMBER_200):
-        self._draw_frame()
+    def _update_range(self, y, end: int | None):
+        """Escala automática a partir del mín/máx incremental de la ventana."""
+        n = len(y)
+        if self._tracker is None or self._tracker.window != n or end is None or end < self._tracker.seen:
+            self._tracker = WindowMinMax(n)
+            self._tracker.push(y)
+        elif end > self._tracker.seen:
+            new = min(n, end - self._tracker.seen)
+            self._tracker.push(y[n - new:])
+        lo, hi = self._tracker.bounds
+        target = min(self.max_range, max(self.min_range, 2.2 * max(abs(lo), abs(hi))))
+        # Crece al instante (no recortar picos); encoge un 5 % por cuadro (sin parpadeo)
+        self.y_range = target if target > self.y_range else max(target, 0.95 * self.y_range)
+        self.range_lbl.value = f"±{self.y_range / 2:.2f} mV"
+
+    def update_wave(self, t, y, color=None, end: int | None = None):
+        """
+        Dibuja la ventana 'y' (mV). 'end' es el índice absoluto de la muestra
+        siguiente a la última; con él el auto-rango sólo procesa las nuevas.
+        """
+        if self.frozen:
+            return
         if len(t) < 2 or len(y) < 2:
+            self._draw_frame()
             return
-        path = cv.Path()
-        n = len(y)
-        def x_at(i: int) -> float:
-            return 1 + i * (self.w-2) / (n-1)
-        path.move_to(x_at(0), self._map_y(y[0]))
-        for i in range(1, n):
-            path.line_to(x_at(i), self._map_y(y[i]))
-        self.canvas.shapes.append(cv.Stroke(path=path,
-                                   paint=ft.Paint(color=color, stroke_width=1.6)))
+        if self.auto_range:
+            self._update_range(y, end)
+        self._draw_frame()
+        self._draw_trace(y, color or ft.Colors.AMBER_200)
+
+    def show_segment(self, y, pre: int, label: str = "", color=None):
+        """Congela la vista en un segmento de disparo; 'pre' = muestras antes del disparo."""
+        import numpy as np
+        self.frozen = True
+        if self.auto_range:
+            peak = float(np.max(np.abs(y))) if len(y) else 0.0
+            self.y_range = min(self.max_range, max(self.min_range, 2.2 * peak))
+        self.range_lbl.value = f"±{self.y_range / 2:.2f} mV  {label}".rstrip()
+        self._draw_frame()
+        if len(y) >= 2:
+            self._draw_trace(y, color or ft.Colors.AMBER_200)
+            x = round(1 + pre * (self.w - 2) / (len(y) - 1))
+            self.canvas.shapes.append(cv.Line(x, 1, x, self.h - 1,
+                                              paint=ft.Paint(color=ft.Colors.RED_300, stroke_width=1)))
+
+    def unfreeze(self):
+        self.frozen = False
+        self._tracker = None         # el auto-rango vuelve a partir de la ventana en vivo
+
+    def _draw_trace(self, y, color):
+        import numpy as np
         baseline = self._map_y(0.0)
-        fill_path = cv.Path()
-        fill_path.move_to(x_at(0), baseline)
-        for i in range(0, n):
-            fill_path.line_to(x_at(i), self._map_y(y[i]))
-        fill_path.line_to(x_at(n-1), baseline)
-        fill_path.close()
-        self.canvas.shapes.append(cv.Fill(path=fill_path,
-                                   paint=ft.Paint(color=ft.Colors.with_opacity(0.18, ft.Colors.AMBER))))
+
+        # Una sola transformación vectorizada + cuantización
+        half = self.y_range / 2.0
+        v = np.clip(np.asarray(y, dtype=np.float32), -half, half)
+        n = v.size
+        q = 1.0 / self.quantum
+        xs = np.rint((1 + np.arange(n) * ((self.w - 2) / (n - 1))) * q) / q
+        ys = np.rint(((half - v) / self.y_range * (self.h - 2) + 1) * q) / q
+        # Fuera los puntos que tras cuantizar repiten el anterior
+        keep = np.ones(n, dtype=bool)
+        keep[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+        xs, ys = xs[keep].tolist(), ys[keep].tolist()
+
+        fill = [cv.Path.MoveTo(xs[0], baseline)]
+        fill += [cv.Path.LineTo(x, yy) for x, yy in zip(xs, ys)]
+        fill += [cv.Path.LineTo(xs[-1], baseline), cv.Path.Close()]
+        self.canvas.shapes.append(cv.Path(fill, paint=ft.Paint(
+            color=ft.Colors.with_opacity(0.18, color), style=ft.PaintingStyle.FILL)))
+        self.canvas.shapes.append(cv.Points(list(zip(xs, ys)), point_mode=cv.PointMode.POLYGON,
+                                            paint=ft.Paint(color=color, stroke_width=1.6)))
+
+class TrendPlot:
+    """Tendencia de la frecuencia mediana (MDF) por canal; pendiente negativa = fatiga."""
+    def __init__(self, title: str, width=950, height=110, f_max=250.0, points=120):
+        self.w, self.h, self.f_max, self.points = width, height, f_max, points
+        self.title_lbl = ft.Text(title, weight=ft.FontWeight.BOLD, size=12)
+        self.slope_lbl = ft.Text("", size=12, color=ft.Colors.GREY_400)
+        self.canvas = cv.Canvas(width=self.w, height=self.h)
+        self.container = ft.Column(
+            [ft.Row([self.title_lbl, self.slope_lbl], spacing=10),
+             ft.Container(self.canvas, border_radius=12,
+                          bgcolor=ft.Colors.with_opacity(0.04, ft.Colors.WHITE), padding=6)],
+            spacing=4)
+        self.colors = (ft.Colors.AMBER_200, ft.Colors.CYAN_200)
+        self.update([], [])
+
+    def update(self, history, slopes):
+        shapes: list = [cv.Rect(0, 0, self.w, self.h, paint=ft.Paint(color=ft.Colors.BLUE_GREY_800,
+                                                                     style=ft.PaintingStyle.FILL))]
+        hist = list(history)[-self.points:]
+        if len(hist) >= 2:
+            n = len(hist)
+            for ch, color in enumerate(self.colors):
+                if ch >= len(hist[0][2]):
+                    break
+                # NaN = canal enmascarado por calidad en esa ventana
+                pts = [(1 + i * (self.w - 2) / (n - 1),
+                        (1 - min(1.0, float(h[2][ch]) / self.f_max)) * (self.h - 2) + 1)
+                       for i, h in enumerate(hist) if h[2][ch] == h[2][ch]]
+                if len(pts) < 2:
+                    continue
+                shapes.append(cv.Points(pts, point_mode=cv.PointMode.POLYGON,
+                                        paint=ft.Paint(color=color, stroke_width=1.5)))
+        self.canvas.shapes = shapes
+        if len(slopes):
+            self.slope_lbl.value = "  ".join(
+                f"C{ch+1}: MDF {hist[-1][2][ch]:.0f} Hz, {sl:+.2f} Hz/s" if sl == sl else f"C{ch+1}: —"
+                for ch, sl in enumerate(slopes) if hist)
 
 # Motor de datos en tiempo real (simulación sencilla si no importas tu EMG)
 class EMGEngine:
-    def __init__(self, page: ft.Page, scope1: Scope, scope2: Scope | None,
-                 seconds_window=5.0, fs=300):
-        self.page = page
-        self.scope1, self.scope2 = scope1, scope2
+    """
+    Adquisición única por proceso. Cada sesión registra sus Scopes con
+    attach() y se retira con detach(); los bloques se dibujan en todas.
+    Con 'source' (un ShmRing del daemon) se leen las muestras reales en
+    lugar del EMG simulado. Cada bloque alimenta además el analizador de
+    fatiga (MNF/MDF) y, si hay grabación activa, el SessionRecorder.
+    """
+    def __init__(self, seconds_window=5.0, fs=300, source=None):
+        self.source = source
+        if source is not None:
+            fs = source.fs
         self.fs = fs
         self.window = seconds_window
         self.max_pts = int(self.fs * self.window)
         self.t: list[float] = []
         self.y1: list[float] = []
         self.y2: list[float] = []
+        self.n_total = 0                    # muestras recibidas desde el arranque (índice absoluto)
+        self._views: list[tuple] = []       # (page, scope1, scope2, trend)
+        self._views_lock = threading.Lock()
         self._stop = threading.Event()
         self._running = False
         self._t0 = 0.0
-
-    def start(self):
+        # Calidad por canal (bits 1..3 de las banderas del daemon); None = simulación
+        self.q_states: list[int] | None = None
+        self._t_origin: float | None = None       # eje de tiempo del daemon (s)
+        self.fatigue = None                       # FatigueAnalyzer (se crea al arrancar)
+        self.recorder = None                      # SessionRecorder de la sesión en curso
+        self._new_fatigue = False
+        # Captura por disparo (trigger.py): segmentos pre/post + eventos de relés
+        self.trigger = None
+        self.freeze_on_trigger = False
+        self.relay_source: Callable[[float, float], list] | None = None
+        self._new_segment = None
+        self._thread: threading.Thread | None = None
+        self.frame_ms: deque = deque(maxlen=1024)   # duración de cada _render (incluye page.update)
+
+    def attach(self, page: ft.Page, scope1: Scope, scope2: Scope | None,
+               trend: TrendPlot | None = None):
+        with self._views_lock:
+            self._views.append((page, scope1, scope2, trend))
+
+    def detach(self, page: ft.Page):
+        with self._views_lock:
+            self._views = [v for v in self._views if v[0] is not page]
+            empty = not self._views
+        if empty:
+            self.stop()
+
+    def start(self, recorder=None, trigger=None):
         if self._running:
             return
+        self.recorder = recorder
+        self.trigger = trigger
         self._stop.clear()
-        threading.Thread(target=self._loop, daemon=True).start()
+        self._thread = threading.Thread(target=self._loop, name="emg-engine", daemon=True)
+        self._thread.start()
         self._running = True
 
     def stop(self):
@@ -347,43 +732,254 @@ class EMGEngine:
             return
         self._stop.set()
         self._running = False
+        # Esperar al bucle: si no, un start() inmediato lo dejaría vivo (vería
+        # _stop limpio) y su finally cerraría el grabador de la sesión nueva
+        th = self._thread
+        if th is not None and th is not threading.current_thread():
+            th.join(timeout=2.0)
 
     def reset(self):
         self.t.clear(); self.y1.clear(); self.y2.clear()
+        self.n_total = 0
         self._render()
 
     def _loop(self):
         block = max(3, int(self.fs * 0.03))  # ~30 ms
         t0 = self.t[-1] if self.t else 0.0
         import math, random
-        while not self._stop.is_set():
-            # Fallback de EMG simple
-            dt = 1.0 / self.fs
-            ch1, ch2 = [], []
-            for i in range(block):
-                tt = self._t0 + (i+1)*dt
-                val = 0.8 * math.sin(2*math.pi*5*tt) + 0.25*random.random()
-                ch1.append(val); ch2.append(val * 0.6)
-            self._t0 += block * dt
-
-            x = [t0 + (i+1)*dt for i in range(block)]
-            t0 = x[-1]
-            self.t.extend(x); self.y1.extend(ch1)
-            if self.scope2 is not None:
-                self.y2.extend(ch2)
-            if len(self.t) > self.max_pts:
-                extra = len(self.t) - self.max_pts
-                self.t = self.t[extra:]; self.y1 = self.y1[extra:]
-                if self.scope2 is not None:
-                    self.y2 = self.y2[extra:]
-            self._render()
-            time.sleep(0.03)
+        import numpy as np
+        from RaspberryPI5_server.emg_processing.spectral import FatigueAnalyzer, frame_size
+        if self.fatigue is None:
+            win = frame_size(self.fs)   # ~0.5 s
+            self.fatigue = FatigueAnalyzer(self.fs, 2, win=win, hop=win // 2)
+        if self.source is not None:
+            from RaspberryPI5_server.emg_processing.quality import decode_states
+            self.source.read()   # descartar lo acumulado mientras estaba parado
+            if self._t_origin is None:
+                self._t_origin = float(self.source.time_of(self.source.pos))
+        recorder = self.recorder
+        try:
+            while not self._stop.is_set():
+                dt = 1.0 / self.fs
+                if self.source is not None:
+                    data, flags, start = self.source.read()
+                    block = data.shape[0]
+                    if block == 0:
+                        time.sleep(0.03); continue
+                    # Tiempo real de cada muestra (contador del micro + deriva, ver timing.py)
+                    x = (self.source.time_of(start + np.arange(block)) - self._t_origin).tolist()
+                    self.q_states = decode_states(flags[-1]).tolist()
+                    ch1 = data[:, 0].tolist()
+                    ch2 = data[:, 1].tolist() if data.shape[1] > 1 else [0.0] * block
+                else:
+                    # Fallback de EMG simple
+                    ch1, ch2 = [], []
+                    for i in range(block):
+                        tt = self._t0 + (i+1)*dt
+                        val = 0.8 * math.sin(2*math.pi*5*tt) + 0.25*random.random()
+                        ch1.append(val); ch2.append(val * 0.6)
+                    self._t0 += block * dt
+                    x = [t0 + (i+1)*dt for i in range(block)]
+
+                t0 = x[-1]
+                self._process(np.column_stack([ch1, ch2]).astype(np.float32))
+                self.t.extend(x); self.y1.extend(ch1); self.y2.extend(ch2)
+                self.n_total += len(x)
+                if len(self.t) > self.max_pts:
+                    extra = len(self.t) - self.max_pts
+                    self.t = self.t[extra:]; self.y1 = self.y1[extra:]; self.y2 = self.y2[extra:]
+                t_frame = time.perf_counter()
+                self._render()
+                self.frame_ms.append((time.perf_counter() - t_frame) * 1000.0)
+                time.sleep(0.03)
+        finally:
+            # Sólo el grabador con el que arrancó este bucle
+            if recorder is not None:
+                recorder.close()
+                # Resumen de la sesión para el historial del paciente (summary.py)
+                from RaspberryPI5_server.emg_processing.summary import summarize_async
+                summarize_async(recorder.path)
+                if self.recorder is recorder:
+                    self.recorder = None
+
+    def _process(self, block):
+        """
+        Fatiga + disparos + grabación del bloque [n, 2] en mV. Los canales
+        malos según el daemon (quality.good_mask, la misma regla que el
+        indicador del Scope) no se analizan ni disparan; se graban igual.
+        """
+        mask = None
+        if self.q_states is not None:
+            from RaspberryPI5_server.emg_processing.quality import good_mask
+            mask = good_mask(self.q_states[:block.shape[1]])
+        windows = self.fatigue.update(block, mask)
+        self._new_fatigue = self._new_fatigue or bool(windows)
+        segments = self.trigger.update(block, mask) if self.trigger is not None else []
+        for seg in segments:
+            # El post-disparo acaba de completarse: el disparo fue hace (n - sample) muestras
+            seg.t_wall = time.time() - (self.trigger._n - seg.sample) / self.fs
+            if self.relay_source is not None:
+                try:
+                    seg.relay_events = self.relay_source(seg.t_wall - seg.pre / self.fs,
+                                                         seg.t_wall + self.trigger.post_n / self.fs)
+                except Exception:
+                    seg.relay_events = None
+            self._new_segment = seg
+        if self.recorder is not None:
+            self.recorder.append(block)
+            for t_s, mnf, mdf in windows:
+                self.recorder.append_fatigue(t_s, mnf, mdf)
+            for seg in segments:
+                self.recorder.append_segment(seg)
 
     def _render(self):
-        self.scope1.update_wave(self.t, self.y1, color=ft.Colors.AMBER_200)
-        if self.scope2 is not None:
-            self.scope2.update_wave(self.t, self.y2, color=ft.Colors.CYAN_200)
-        self.page.update()
+        with self._views_lock:
+            views = list(self._views)
+        new_fatigue, self._new_fatigue = self._new_fatigue, False
+        seg, self._new_segment = self._new_segment, None
+        for page, scope1, scope2, trend in views:
+            if trend is not None and new_fatigue:
+                trend.update(self.fatigue.history, self.fatigue.trend(last_s=60.0))
+            for ch, (scope, y, color) in enumerate(((scope1, self.y1, ft.Colors.AMBER_200),
+                                                    (scope2, self.y2, ft.Colors.CYAN_200))):
+                if scope is None:
+                    continue
+                ok = self._channel_ok(ch, scope)
+                if seg is not None and self.freeze_on_trigger:
+                    scope.show_segment(seg.data[:, ch], seg.pre, color=color,
+                                       label=f"disparo #{self.trigger.count} (C{seg.channel + 1})")
+                    continue
+                # Canal malo: sólo la rejilla, no se gastan trazos en basura
+                scope.update_wave(self.t if ok else [], y if ok else [], color=color, end=self.n_total)
+            try:
+                page.update()
+            except Exception:
+                pass  # sesión cerrándose
+
+    def _channel_ok(self, ch: int, scope: Scope) -> bool:
+        if self.q_states is None or ch >= len(self.q_states):
+            scope.set_quality("SIM" if self.source is None else "—", True)
+            return True
+        from RaspberryPI5_server.emg_processing.quality import STATE_LABELS, good_mask
+        code = self.q_states[ch]
+        ok = bool(good_mask(code))
+        scope.set_quality(STATE_LABELS.get(code, "?"), ok)
+        return ok
+
+# ---------------------- Estado compartido del proceso -----------------------
+class _SinControlador:
+    """Controlador que no toca relés: cada orden sólo se anota en la bitácora."""
+    def __init__(self, actualizar_estado=None, motivo: str = ""):
+        self.actualizar_estado = actualizar_estado
+        self.motivo = motivo
+        self._msg(motivo)
+    def _msg(self, texto: str):
+        if self.actualizar_estado: self.actualizar_estado(texto)
+    def home_now(self, s=3.0):
+        self._msg(f"Sin controlador: home_now({s}) ignorado. {self.motivo}")
+    def stop_and_home(self, stop_event=None, close_seconds=3.0):
+        if stop_event: stop_event.set()
+        self._msg(f"Sin controlador: stop_and_home() ignorado. {self.motivo}")
+    def mover_actuador(self, *a, **k):
+        self._msg(f"Sin controlador: mover_actuador{a} ignorado. {self.motivo}")
+    def run_routine(self, name, cycles=1, stop_event=None):
+        self._msg(f"Sin controlador: run_routine({name}) ignorado. {self.motivo}")
+
+class _Runtime:
+    """
+    GPIO y adquisición se inicializan una sola vez por proceso (en segundo
+    plano al arrancar) y se comparten entre sesiones. Los mensajes del
+    controlador se reenvían a la bitácora de cada sesión conectada.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners: list[Callable[[str], None]] = []
+        self.controlador = None
+        self.engine: Optional[EMGEngine] = None
+        self.use_daemon = False
+        self.estado = "Inicializando…"
+
+    def warm_up(self):
+        with self._lock:
+            if self.controlador is not None:
+                return
+            self.controlador = _startup.timed("GPIO (ControlActuadores)", self._make_controlador)
+            self.engine = _startup.timed("adquisición (EMGEngine)",
+                                         lambda: EMGEngine(seconds_window=5.0, fs=300,
+                                                           source=self._daemon_ring()))
+        # Resúmenes de sesión que falten o sean de otra versión, sin bloquear
+        try:
+            from RaspberryPI5_server.emg_processing.summary import refresh_stale
+            refresh_stale()
+        except Exception as ex:
+            print(f"[Runtime] sin resúmenes de sesión: {ex}")
+
+    def _daemon_ring(self):
+        if not self.use_daemon:
+            return None
+        try:
+            from RaspberryPI5_server.emg_processing.daemon_client import DEFAULT_SHM
+            from RaspberryPI5_server.emg_processing.shm_ring import ShmRing
+            return ShmRing.attach(DEFAULT_SHM)
+        except Exception as ex:
+            print(f"[Runtime] sin anillo del daemon: {ex}")
+            return None
+
+    def _make_controlador(self):
+        # Lanzado por run.sh (EXO_REQUIRE_DAEMON=1): el daemon es el dueño de
+        # los relés. Si no responde no se toma el GPIO aquí (serían dos dueños
+        # de los mismos pines): controlador inerte y error visible.
+        require = os.environ.get("EXO_REQUIRE_DAEMON") == "1"
+        # 1) Daemon de adquisición/GPIO (proceso aparte) si está corriendo
+        try:
+            from RaspberryPI5_server.emg_processing.daemon_client import ControlRemoto, wait_for_daemon
+            if wait_for_daemon(DAEMON_WAIT_S if require else 0.0):
+                ctrl = ControlRemoto(actualizar_estado=self.broadcast)
+                self.use_daemon = True
+                self.estado = "Daemon de adquisición/GPIO conectado."
+                return ctrl
+            reason = f"el daemon no respondió en {DAEMON_WAIT_S:g} s"
+        except Exception as ex:
+            print(f"[Runtime] daemon no disponible: {ex}")
+            reason = ex
+        if require:
+            self.estado = f"ERROR: sin daemon de GPIO ({reason}); relés deshabilitados."
+            print(f"[Runtime] {self.estado}")
+            return _SinControlador(self.broadcast, self.estado)
+        # 2) GPIO en este mismo proceso
+        try:
+            from Laptop_client.GUI.journal import EventJournal
+            from Laptop_client.GUI.routines import ControlActuadores
+            ctrl = ControlActuadores(actualizar_estado=self.broadcast, journal=EventJournal())
+            self.estado = "GPIO listo (LGPIO) o SIM según entorno."
+            return ctrl
+        except Exception as ex:
+            reason = ex
+        # Respaldo mínimo si hubiera error importando routines.py
+        self.estado = "SIM sin GPIO"
+        return _SinControlador(self.broadcast, f"SIM: controlador (sin GPIO). Motivo: {reason}")
+
+    def subscribe(self, cb: Callable[[str], None]):
+        self._listeners.append(cb)
+
+    def unsubscribe(self, cb: Callable[[str], None]):
+        try:
+            self._listeners.remove(cb)
+        except ValueError:
+            pass
+
+    def sessions(self) -> int:
+        """Sesiones (pestañas) conectadas ahora mismo."""
+        return len(self._listeners)
+
+    def broadcast(self, msg: str):
+        for cb in list(self._listeners):
+            try:
+                cb(msg)
+            except Exception:
+                pass
+
+_runtime = _Runtime()
 
 # ---------------------- UI principal ----------------------------------------
 def window_main(page: ft.Page):
@@ -395,19 +991,43 @@ def window_main(page: ft.Page):
     page.fonts = {"Poppins": "fonts/Poppins-Regular.ttf"}
     page.theme = ft.Theme(font_family="Poppins")
 
-    # Bitácora / estado
+    # Bitácora / estado (acotada: en un turno completo crecería sin límite)
     log_list = ft.ListView(expand=1, spacing=4, auto_scroll=True)
     def push_log(txt: str, color=ft.Colors.GREY_300):
-        log_list.controls.append(ft.Text(txt, size=12, color=color)); page.update()
+        log_list.controls.append(ft.Text(txt, size=12, color=color))
+        if len(log_list.controls) > LOG_MAX_LINES:
+            del log_list.controls[:-LOG_MAX_LINES]
+        page.update()
 
     estado_title = ft.Text("Inicializando…", size=14, color=ft.Colors.GREY_200)
 
+    # Perfil bajo demanda de este proceso (ver diagnostics/profiler.py)
+    def perfilar(e):
+        from RaspberryPI5_server.diagnostics.profiler import profile_async
+        profile_btn.disabled = True
+        push_log("Perfilando la UI 10 s…", ft.Colors.CYAN_200)
+
+        def done(s):
+            profile_btn.disabled = False
+            push_log(f"Perfil listo ({s['samples']} muestras, {s['overhead_pct']}%): {s['out_dir']}",
+                     ft.Colors.CYAN_200)
+
+        def failed(ex):
+            profile_btn.disabled = False
+            push_log(f"Perfil: {ex}", ft.Colors.RED_200)
+        # Sólo pilas: tracemalloc frenaría la UI en plena sesión (--alloc por el socket si hace falta)
+        profile_async(10.0, on_done=done, on_error=failed, label="ui", alloc=False)
+
+    profile_btn = ft.IconButton(icon=ft.Icons.SPEED, icon_color=ft.Colors.GREY_400,
+                                tooltip="Perfilar la UI 10 s", on_click=perfilar)
+
     estado_card = ft.Card(
         content=ft.Container(
             content=ft.Column(
                 [estado_title,
                  ft.Divider(color=ft.Colors.with_opacity(0.2, ft.Colors.WHITE)),
-                 ft.Text("Bitácora", size=12, color=ft.Colors.GREY_400),
+                 ft.Row([ft.Text("Bitácora", size=12, color=ft.Colors.GREY_400), profile_btn],
+                        alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                  log_list],
                 spacing=8, expand=True),
             padding=8, width=360, height=260),
@@ -421,41 +1041,25 @@ def window_main(page: ft.Page):
         bgcolor=ft.Colors.TRANSPARENT, elevation=0, toolbar_height=40,
     )
 
-    # ===== Controlador GPIO a través de routines.py =====
+    # ===== Controlador GPIO (compartido por proceso, ver _Runtime) =====
     def actualizar_estado(msg: str):
         push_log(msg, ft.Colors.GREY_300)
 
-    try:
-        from Laptop_client.GUI.routines import ControlActuadores
-        controlador = ControlActuadores(actualizar_estado=actualizar_estado)
-        estado_title.value = "GPIO listo (LGPIO) o SIM según entorno."
-    except Exception as ex:
-        # Respaldo mínimo si hubiera error importando routines.py
-        class ControlActuadores:
-            def __init__(self, actualizar_estado=None):
-                self.actualizar_estado = actualizar_estado
-                if actualizar_estado: actualizar_estado(f"SIM: controlador (sin GPIO). Motivo: {ex}")
-            def home_now(self, s=3.0): 
-                if self.actualizar_estado: self.actualizar_estado(f"SIM: home_now({s})")
-            def stop_and_home(self, stop_event=None, close_seconds=3.0):
-                if stop_event: stop_event.set()
-                if self.actualizar_estado: self.actualizar_estado("SIM: stop_and_home()")
-            def mover_actuador(self, *a, **k):
-                if self.actualizar_estado: self.actualizar_estado(f"SIM: mover_actuador{a}{k}")
-            def run_routine(self, name, cycles=1, stop_event=None):
-                if self.actualizar_estado: self.actualizar_estado(f"SIM: run_routine({name}, cycles={cycles})")
-        controlador = ControlActuadores(actualizar_estado=actualizar_estado)
-        estado_title.value = "SIM sin GPIO"
+    _runtime.warm_up()   # no-op si el arranque ya lo dejó listo
+    _runtime.subscribe(actualizar_estado)
+    controlador = _runtime.controlador
+    estado_title.value = _runtime.estado
 
     # ===== Estado de selección (Usuarios/Pacientes) =====
     selected_user: Optional[User] = None
+    selected_patient: Optional[Patient] = None
 
     usuarios_btn = ft.OutlinedButton("Usuarios", icon=ft.Icons.PERSON,
                                      style=ft.ButtonStyle(color=ft.Colors.WHITE),
-                                     on_click=lambda e: open_users_sheet(page, on_user_selected))
+                                     on_click=lambda e: sheets.open_users())
     pacientes_btn = ft.OutlinedButton("Pacientes", icon=ft.Icons.PEOPLE,
                                       style=ft.ButtonStyle(color=ft.Colors.WHITE),
-                                      on_click=lambda e: open_patients_sheet(page, selected_user, on_patient_selected))
+                                      on_click=lambda e: sheets.open_patients(selected_user))
 
     def on_user_selected(u: User):
         nonlocal selected_user
@@ -466,10 +1070,15 @@ def window_main(page: ft.Page):
         page.snack_bar.open = True; page.update()
 
     def on_patient_selected(p: Patient):
+        nonlocal selected_patient
+        selected_patient = p
         pacientes_btn.text = f"Paciente/{p.nombre}"
         page.snack_bar = ft.SnackBar(ft.Text(f"Paciente seleccionado: {p.nombre}"), bgcolor=ft.Colors.CYAN_700)
         page.snack_bar.open = True; page.update()
 
+    # Hojas de la sesión (se construyen al primer uso y se reutilizan)
+    sheets = RecordSheets(page, on_user_selected, on_patient_selected)
+
     usuarios_card = ft.Card(
         content=ft.Container(
             content=ft.Column([ft.Text("Usuarios / Pacientes", size=14, color=ft.Colors.GREY_300),
@@ -480,7 +1089,9 @@ def window_main(page: ft.Page):
     )
 
     # ===== RUTINAS (con ciclos + PARO) =====
+    # Propios de esta sesión: el controlador es compartido por todas las pestañas
     stop_event = threading.Event()
+    routine_running = threading.Event()    # rutina lanzada desde esta sesión
 
     rutina_dd = ft.Dropdown(
         options=[
@@ -508,6 +1119,15 @@ def window_main(page: ft.Page):
     def _run_thread(fn):
         threading.Thread(target=fn, daemon=True).start()
 
+    def _run_routine_thread(fn):
+        def run():
+            routine_running.set()
+            try:
+                fn()
+            finally:
+                routine_running.clear()
+        _run_thread(run)
+
     def ejecutar_una_vez(e):
         name = rutina_dd.value or "Rutina 1"
         stop_event.clear()
@@ -518,7 +1138,7 @@ def window_main(page: ft.Page):
                 push_log(f"✓ {name} completada", ft.Colors.GREEN_200)
             except Exception as ex:
                 push_log(f"✖ Error en {name}: {ex}", ft.Colors.RED_200)
-        _run_thread(run)
+        _run_routine_thread(run)
 
     def ejecutar_en_ciclos(e):
         name = rutina_dd.value or "Rutina 1"
@@ -535,7 +1155,7 @@ def window_main(page: ft.Page):
                 push_log(f"✓ {name} ciclos completados", ft.Colors.GREEN_200)
             except Exception as ex:
                 push_log(f"✖ Error en ciclos de {name}: {ex}", ft.Colors.RED_200)
-        _run_thread(run)
+        _run_routine_thread(run)
 
     def parar_rutina_home(e):
         def run():
@@ -646,12 +1266,15 @@ def window_main(page: ft.Page):
     )
 
     # ===== Gráficas EMG (dos canales simulados) =====
-    scope1 = Scope("EMG - Canal 1", width=950, height=280, y_range_mV=6.0)
-    scope2 = Scope("EMG - Canal 2", width=950, height=280, y_range_mV=6.0)
-    charts_col = ft.Column([scope1.container, scope2.container], spacing=12, expand=True)
+    scope1 = Scope("EMG - Canal 1", width=950, height=280, y_range_mV=6.0, auto_range=True)
+    scope2 = Scope("EMG - Canal 2", width=950, height=280, y_range_mV=6.0, auto_range=True)
+    fatigue_plot = TrendPlot("Fatiga - frecuencia mediana (MDF)", width=950, height=110)
+    charts_col = ft.Column([scope1.container, scope2.container, fatigue_plot.container],
+                           spacing=12, expand=True)
 
-    # Motor RT
-    engine = EMGEngine(page, scope1, scope2, seconds_window=5.0, fs=300)
+    # Motor RT (único por proceso)
+    engine = _runtime.engine
+    engine.attach(page, scope1, scope2, fatigue_plot)
 
     # ===== Botones sensor (sim) =====
     def crear_boton(texto, icono, color, on_click=None):
@@ -661,7 +1284,34 @@ def window_main(page: ft.Page):
                                  padding=ft.Padding(12, 10, 12, 10)),
             height=44, width=180)
 
-    def start_sensor(e): engine.start(); push_log("Sensor: START", ft.Colors.GREEN_200)
+    trigger_switch = ft.Switch(label="Grabar sólo disparos", value=False)
+    def toggle_freeze(e):
+        engine.freeze_on_trigger = bool(freeze_switch.value)
+        if not engine.freeze_on_trigger:
+            scope1.unfreeze(); scope2.unfreeze()
+    freeze_switch = ft.Switch(label="Congelar en disparo", value=False, on_change=toggle_freeze)
+
+    def start_sensor(e):
+        # Con paciente seleccionado la sesión se graba (EMG + fatiga); en modo
+        # disparo sólo se guardan los segmentos pre/post con sus eventos de relés
+        recorder = trigger = None
+        if engine._running:
+            return
+        if trigger_switch.value or freeze_switch.value:
+            from RaspberryPI5_server.emg_processing.trigger import TriggeredCapture
+            trigger = TriggeredCapture(engine.fs, 2)
+            engine.relay_source = getattr(controlador, "relay_events", None)
+        if selected_patient is not None:
+            from RaspberryPI5_server.emg_processing.recording import SessionRecorder, SESSIONS_DIR
+            recorder = SessionRecorder(selected_patient.patient_id, engine.fs, 2,
+                                       user_id=selected_user.user_id if selected_user else "",
+                                       continuous=not trigger_switch.value)
+            push_log(f"Grabando sesión en {recorder.path}", ft.Colors.GREEN_200)
+            # El diario de relés usa el mismo id de sesión (paciente/fecha)
+            begin = getattr(controlador, "begin_journal_session", None)
+            if begin is not None:
+                begin(os.path.relpath(recorder.path, SESSIONS_DIR))
+        engine.start(recorder=recorder, trigger=trigger); push_log("Sensor: START", ft.Colors.GREEN_200)
     def stop_sensor(e):  engine.stop();  push_log("Sensor: STOP",  ft.Colors.AMBER_200)
     def reset_sensor(e): engine.reset(); push_log("Sensor: RESET", ft.Colors.AMBER_200)
 
@@ -671,7 +1321,8 @@ def window_main(page: ft.Page):
                                ft.Divider(color=ft.Colors.WHITE),
                                crear_boton("Start Sensor", ft.Icons.PLAY_ARROW, ft.Colors.GREEN_400, start_sensor),
                                crear_boton("Stop Sensor",  ft.Icons.STOP,        ft.Colors.RED_400,   stop_sensor),
-                               crear_boton("Reset Sensor", ft.Icons.REFRESH,     ft.Colors.AMBER_400, reset_sensor)],
+                               crear_boton("Reset Sensor", ft.Icons.REFRESH,     ft.Colors.AMBER_400, reset_sensor),
+                               trigger_switch, freeze_switch],
                               spacing=10),
             padding=8, width=360),
         elevation=2, color=ft.Colors.with_opacity(0.1, ft.Colors.WHITE),
@@ -697,30 +1348,59 @@ def window_main(page: ft.Page):
                     spacing=0, expand=True)
     page.add(layout)
 
-    # Limpieza segura al desconectar
+    # Limpieza segura al desconectar. Sólo se para lo que arrancó esta
+    # sesión (su rutina, con su propio stop_event): un paro general abortaría
+    # la rutina o los pulsos de otra pestaña. HOME sólo si era la última.
     def _cleanup(*_):
+        _runtime.unsubscribe(actualizar_estado)
         try:
-            engine.stop()
+            engine.detach(page)
         except Exception:
             pass
+        propia = routine_running.is_set()
+        stop_event.set()
         try:
-            controlador.stop_and_home(stop_event, close_seconds=3.0)
+            if _runtime.sessions() == 0:
+                controlador.stop_and_home(stop_event, close_seconds=3.0)
+                push_log("Conexión cerrada: HOME aplicado.", ft.Colors.AMBER_200)
+            elif propia:
+                push_log("Conexión cerrada: rutina de esta sesión detenida.", ft.Colors.AMBER_200)
         except Exception:
             pass
-        push_log("Conexión cerrada: HOME aplicado.", ft.Colors.AMBER_200)
     page.on_disconnect = _cleanup
+    _startup.report("primera sesión lista")
 
 # ---------------------- Lanzador --------------------------------------------
 if __name__ == "__main__":
-    port = _find_free_port(HOST, START_PORT)
+    sock = _startup.timed("reservar puerto (bind)", lambda: _bind_port(HOST, START_PORT))
+    port = sock.getsockname()[1]
+    # GPIO + adquisición en paralelo con el import de flet
+    threading.Thread(target=_runtime.warm_up, daemon=True).start()
+    _startup.timed("import flet", lambda: ft.app)
+    # Perfilado desde fuera sin reiniciar el kiosk (EXO_PROFILER_SOCKET)
+    try:
+        from RaspberryPI5_server.diagnostics.profiler import ProfilerServer
+        ProfilerServer(label="ui").start()
+    except OSError as ex:
+        print(f"[Perfil] sin socket de perfilado: {ex}")
+
     print("\n[Flet] Iniciando servidor web…")
     print(f" - Host/IP: {HOST}")
     print(f" - Puerto : {port}")
     print(f" - Abre en tu navegador:  http://{HOST}:{port}")
 
-    view_mode = ft.WEB_BROWSER if OPEN_BROWSER_ON_SERVER else None
-    if OPEN_BROWSER_ON_SERVER:
-        try: webbrowser.open(f"http://{HOST}:{port}")
-        except Exception: pass
-
-    ft.app(target=window_main, assets_dir=ASSETS_DIR, view=view_mode, host=HOST, port=port)
+    asgi = _asgi_app()
+    if asgi is None:
+        # Sin uvicorn/flet-web: servidor propio de flet en el puerto encontrado
+        print(" - (sin uvicorn/flet-web: ft.app en el puerto, sin reservarlo)")
+        sock.close()
+        view_mode = ft.WEB_BROWSER if OPEN_BROWSER_ON_SERVER else None
+        ft.app(target=window_main, assets_dir=ASSETS_DIR, view=view_mode, host=HOST, port=port)
+    else:
+        # El socket ya escucha: el navegador puede conectar aunque uvicorn aún arranque
+        if OPEN_BROWSER_ON_SERVER:
+            try:
+                import webbrowser
+                webbrowser.open(f"http://{HOST}:{port}")
+            except Exception: pass
+        _serve(sock, asgi)
@@ -5,11 +5,28 @@ cd /home/pi/Documents/Repositorios/ExoRehability || exit 1
 # venv (si existe)
 [ -f venv/bin/activate ] && source venv/bin/activate
 
-# actualizar (no fallar si no hay red)
-git pull origin raspberrypi5 || echo "[WARN] git pull falló, sigo local"
+# actualizar ANTES de lanzar nada: el daemon y la UI no deben importar un
+# árbol a medio actualizar. Acotado: sin red se arranca con lo local
+timeout 15 git pull --ff-only origin raspberrypi5 >/dev/null 2>&1 \
+    || echo "[WARN] git pull falló, sigo local"
 
 # prueba visual (requiere: sudo apt install feh)
-feh --fullscreen /home/pi/Downloads/linux.png &
+# feh --fullscreen /home/pi/Downloads/linux.png &
 
-# tu app (descomenta cuando quieras)
-# python3 main.py
+# daemon de adquisición/GPIO (proceso aparte: sobrevive a caídas de la UI)
+# Vivo = responde por el socket; uno que quedó de un daemon caído se borra
+daemon_wait() {   # $1 = segundos de espera
+    python3 -c 'import sys; from RaspberryPI5_server.emg_processing.daemon_client import wait_for_daemon; sys.exit(not wait_for_daemon(float(sys.argv[1])))' "$1"
+}
+if ! daemon_wait 0; then
+    rm -f /tmp/exo_daemon.sock
+    setsid python3 -m RaspberryPI5_server.emg_processing.daemon >/tmp/exo_daemon.log 2>&1 &
+    daemon_wait 20 || echo "[ERROR] el daemon no responde; ver /tmp/exo_daemon.log"
+fi
+
+# kiosk: el proceso imprime el desglose de tiempos de arranque. Los relés
+# son del daemon: la UI nunca toma el GPIO por su cuenta (la espera y el
+# error visible van en main_window._Runtime)
+export PYTHONUNBUFFERED=1
+export EXO_REQUIRE_DAEMON=1
+exec python3 main_window.py
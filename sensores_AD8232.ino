@@ -3,6 +3,16 @@ const int ecgPin1 = A0; // AD8232 #1
 const int ecgPin2 = A1; // AD8232 #2
 const int ecgPin3 = A2; // AD8232 #3
 
+// Muestreo por temporizador (micros) en lugar de delay(): 400 Hz exactos.
+// Peor línea: "65535,1023,1,1023,1,1023,1\r\n" = 28 bytes -> 400 Hz son
+// 11200 B/s. A 115200 baud (11520 B/s) eso era el 97 % del cable; a 500000
+// (50000 B/s) es el 22 %. 500000 es exacto con un AVR a 16 MHz (U2X,
+// UBRR = 3), a diferencia de 230400 (-3.5 %). El host usa el mismo valor
+// (protocol.DEFAULT_BAUD).
+const unsigned long PERIODO_US = 2500;
+unsigned long proximo = 0;
+uint16_t contador = 0;  // nº de muestra (módulo 65536) para sincronizar en el host
+
 // Pines Lead-Off (opcional)
 const int loPlus1  = 2;
 const int loMinus1 = 3;
@@ -12,7 +22,7 @@ const int loPlus3  = 6;
 const int loMinus3 = 7;
 
 void setup() {
-  Serial.begin(115200); // Velocidad alta para ver bien la señal
+  Serial.begin(500000); // = protocol.DEFAULT_BAUD en el host
 
   pinMode(loPlus1,  INPUT);
   pinMode(loMinus1, INPUT);
@@ -20,9 +30,13 @@ void setup() {
   pinMode(loMinus2, INPUT);
   pinMode(loPlus3,  INPUT);
   pinMode(loMinus3, INPUT);
+  proximo = micros();
 }
 
 void loop() {
+  if ((long)(micros() - proximo) < 0) return;
+  proximo += PERIODO_US;
+
   // Lecturas analógicas
   int ecg1 = analogRead(ecgPin1);
   int ecg2 = analogRead(ecgPin2);
@@ -33,7 +47,9 @@ void loop() {
   bool leadOff2 = digitalRead(loPlus2) || digitalRead(loMinus2);
   bool leadOff3 = digitalRead(loPlus3) || digitalRead(loMinus3);
 
-  // Mostrar datos
+  // Mostrar datos: n,ecg1,lo1,ecg2,lo2,ecg3,lo3
+  Serial.print(contador);
+  Serial.print(",");
   Serial.print(ecg1);
   Serial.print(",");
   Serial.print(leadOff1);
@@ -41,10 +57,10 @@ void loop() {
   Serial.print(ecg2);
   Serial.print(",");
   Serial.print(leadOff2);
+  Serial.print(",");
   Serial.print(ecg3);
   Serial.print(",");
   Serial.println(leadOff3);
 
-
-  delay(2); // ~500 Hz de muestreo aprox.
+  contador++;
 }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Los paquetes viven en la raíz del repo (sin instalar)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,48 @@
+"""Rutinas en tiempo virtual: interlock, deadtime y duraciones de cada tramo."""
+import pytest
+
+from Laptop_client.GUI.clock import VirtualClock, check_timeline, on_intervals, simulate
+
+# rutina -> (actuadores por pasada, avance, pausa, retroceso)
+ROUTINES = {
+    "Rutina 1": ((1, 2, 3, 4, 5), 2.0, 4.0, 2.0),
+    "Rutina 2": ((1, 2, 3, 4, 5), 0.5, 4.0, 0.5),
+    "Rutina 3": ((2, 3, 4, 5, 1, 2, 3, 4, 5, 1, 2, 3, 4, 5), 2.0, 1.0, 2.0),
+}
+
+
+@pytest.mark.parametrize("routine", sorted(ROUTINES))
+def test_timeline_sin_violaciones(routine):
+    ctrl, timeline = simulate(routine, cycles=2, clock=VirtualClock())
+    assert timeline
+    assert check_timeline(timeline, ctrl.deadtime_s) == []
+    # Todo OFF al terminar
+    last = {}
+    for e in timeline:
+        last[e.actuator] = (e.A, e.B)
+    assert all(st == (False, False) for st in last.values())
+
+
+@pytest.mark.parametrize("routine", sorted(ROUTINES))
+def test_duraciones(routine):
+    acts, avance, pausa, retroceso = ROUTINES[routine]
+    cycles = 2
+    ctrl, timeline = simulate(routine, cycles=cycles, clock=VirtualClock())
+    iv = on_intervals(timeline)
+    assert len(iv) == 2 * len(acts) * cycles
+    for act, side, _, dur in iv:
+        assert dur == pytest.approx(avance if side == "A" else retroceso, abs=1e-6)
+    # Por actuador: A y B alternan, separados por la pausa y dos deadtimes
+    for n in set(acts):
+        mine = [r for r in iv if r[0] == n]
+        assert [r[1] for r in mine] == ["A", "B"] * (len(mine) // 2)
+        for a, b in zip(mine[::2], mine[1::2]):
+            gap = b[2] - (a[2] + a[3])
+            assert gap == pytest.approx(pausa + 2 * ctrl.deadtime_s, abs=1e-6)
+
+
+def test_tiempo_virtual():
+    ctrl, timeline = simulate("Rutina 1", cycles=1, clock=VirtualClock())
+    # deadtime + avance + deadtime + pausa + deadtime + retroceso + deadtime
+    assert ctrl.clock.now() == pytest.approx(2.0 + 4.0 + 2.0 + 4 * ctrl.deadtime_s, abs=1e-6)
+    assert timeline[-1].t <= ctrl.clock.now()
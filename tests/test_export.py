@@ -0,0 +1,45 @@
+"""Exportación de sesiones sólo de disparos (EDF+D y CSV por segmentos)."""
+import numpy as np
+
+from RaspberryPI5_server.emg_processing.export import export_session
+from RaspberryPI5_server.emg_processing.recording import SessionRecorder
+from RaspberryPI5_server.emg_processing.trigger import TriggerSegment
+
+FS = 400
+
+
+def _trigger_session(root, samples=(1000, 1500, 9000)):
+    rec = SessionRecorder("P1", FS, 2, root=str(root), continuous=False)
+    for s in samples:
+        rec.append_segment(TriggerSegment(sample=s, channel=0, pre=200,
+                                          data=np.full((800, 2), s / 1000, np.float32)))
+    rec.close()
+    return rec.path
+
+
+def test_edf_discontinuo(tmp_path):
+    (edf,) = export_session(_trigger_session(tmp_path / "s"), str(tmp_path / "out"), ["edf"])
+    raw = open(edf, "rb").read()
+    assert raw[192:197] == b"EDF+D"
+    ns = int(raw[252:256])
+    spr = [int(raw[256 + ns * 216 + 8 * i:256 + ns * 216 + 8 * (i + 1)]) for i in range(ns)]
+    n_rec, hl, reclen = int(raw[236:244]), 256 * (ns + 1), 2 * sum(spr)
+    assert len(raw) == hl + n_rec * reclen
+    # Inicio de cada registro (TAL de tiempo): los dos primeros segmentos se solapan y se unen
+    onsets = [float(raw[hl + k * reclen + 2 * sum(spr[:-1]):].split(b"\x14")[0])
+              for k in range(n_rec)]
+    assert onsets == [2.0, 3.0, 4.0, 5.0, 22.0, 23.0]
+
+
+def test_csv_por_segmentos(tmp_path):
+    (csv,) = export_session(_trigger_session(tmp_path / "s"), str(tmp_path / "out"), ["csv"])
+    t = np.loadtxt(csv, delimiter=",", skiprows=1)[:, 0]
+    assert len(t) == 1300 + 800                      # 800..2100 y 8800..9600, sin repetir muestras
+    assert t[0] == 800 / FS and t[-1] == 9599 / FS
+    assert np.all(np.diff(t) > 0)
+
+
+def test_sesion_vacia(tmp_path):
+    rec = SessionRecorder("P1", FS, 2, root=str(tmp_path / "s"), continuous=False)
+    rec.close()
+    assert export_session(rec.path, str(tmp_path / "out"), ["edf", "csv"]) == []
@@ -0,0 +1,17 @@
+"""Formato de línea del firmware y margen del cable serie."""
+from RaspberryPI5_server.emg_processing.protocol import (DEFAULT_BAUD, DEFAULT_FS, LINE_MAX_BYTES,
+                                                         link_load, parse_line)
+
+WORST = "65535,1023,1,1023,1,1023,1\r\n"
+
+
+def test_peor_linea():
+    assert len(WORST.encode()) == LINE_MAX_BYTES
+    vals, lo, n = parse_line(WORST.strip(), channels=3, counter=True)
+    assert vals == [1023, 1023, 1023] and lo == [1, 1, 1] and n == 65535
+
+
+def test_margen_del_cable():
+    # Con el peor caso el UART no debe pasar de la mitad
+    assert link_load(DEFAULT_FS, DEFAULT_BAUD) < 0.5
+    assert link_load(DEFAULT_FS, 115200) > 0.95        # lo que había antes